@@ -0,0 +1,87 @@
+"""Benchmark of the import time of the exegis command line interface.
+
+The module is imported in a new interpreter with ``python -X importtime``,
+the best cumulative time of several runs is compared to the budget. Some
+modules (lxml, pkg_resources) must not be imported at all: they are only
+needed when a file is converted.
+
+Usage:
+    bench_import.py [--module=<name>] [--budget=<ms>] [--repeat=<n>]
+                    [--top=<n>]
+    bench_import.py -h | --help
+
+Options:
+    -h --help           Show this screen.
+    --module=<name>     Module imported [default: exegis.main]
+    --budget=<ms>       Maximum cumulative import time in ms [default: 150]
+    --repeat=<n>        Number of runs, the fastest is kept [default: 5]
+    --top=<n>           Number of slowest modules printed [default: 10]
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+import os
+import sys
+import subprocess
+from docopt import docopt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modules which must not be imported at start up
+FORBIDDEN = ('lxml', 'pkg_resources')
+
+
+def import_times(module):
+    """Import the module in a new interpreter.
+
+    Returns
+    -------
+    dict
+        cumulative import time (microseconds) of each module imported.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import ' + module],
+                            stderr=subprocess.PIPE, env=env, check=True,
+                            universal_newlines=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(args=None):
+    """Run the benchmark, return 1 if the budget is exceeded."""
+    arguments = docopt(__doc__, argv=args)
+    module = arguments['--module']
+    budget = float(arguments['--budget'])
+
+    runs = [import_times(module) for _ in range(int(arguments['--repeat']))]
+    best = min(runs, key=lambda times: times[module])
+    total = best[module] / 1000.
+
+    top = sorted(best.items(), key=lambda item: -item[1])
+    for name, cumulative in top[:int(arguments['--top'])]:
+        print('{:>10.1f} ms  {}'.format(cumulative / 1000., name))
+
+    status = 0
+    forbidden = sorted(name for name in best
+                       if name.split('.')[0] in FORBIDDEN)
+    if forbidden:
+        print('Modules imported at start up: {}'.format(', '.join(forbidden)))
+        status = 1
+    print('import {}: {:.1f} ms (budget {:.1f} ms)'.format(module, total,
+                                                           budget))
+    if total > budget:
+        print('Import time budget exceeded')
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
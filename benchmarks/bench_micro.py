@@ -0,0 +1,239 @@
+"""Micro-benchmarks of the functions which analyse the aphorisms,
+the commentaries and the footnotes.
+
+The inputs are the ``.in`` files of ``tests/test_files`` (the outputs are
+checked against the ``.ref`` files), the lines of ``text.txt`` and the
+footnotes of ``footnotes.txt``. ``--scale`` repeats the inputs to measure
+larger strings.
+
+The best time of each benchmark and a digest of its output are saved in a
+JSON baseline. When a baseline exists the benchmark fails if a function is
+slower than the baseline by more than the threshold or if its output
+changed: an optimisation is accepted only if it keeps the output.
+
+Usage:
+    bench_micro.py [--baseline=<file>] [--threshold=<pct>] [--scale=<n>]
+                   [--repeat=<n>] [--update] [--only=<name>...]
+    bench_micro.py -h | --help
+
+Options:
+    -h --help               Show this screen.
+    --baseline=<file>       JSON file with the results of reference [default: benchmarks/micro_baseline.json]
+    --threshold=<pct>       Slowdown allowed compared to the baseline (percent) [default: 20]
+    --scale=<n>             Number of times the inputs are repeated [default: 1]
+    --repeat=<n>            Number of measures, the fastest is kept [default: 5]
+    --update                Save the results as the new baseline
+    --only=<name>           Run only the benchmark (can be repeated)
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+import os
+import re
+import sys
+import json
+import timeit
+import hashlib
+from docopt import docopt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import exegis.analysis as analysis  # noqa: E402
+from exegis.footnotes import Footnote, Footnotes  # noqa: E402
+
+TEST_FILES = os.path.join(ROOT, 'tests', 'test_files')
+
+# Footnote symbol
+MARKER = re.compile(r'\*(\d+)\*')
+
+# Fixtures of the footnotes and the method used to treat them
+OMISSIONS = ('test_process_omission', 'test_omission_and_conieci',
+             'test_omission_and_conieci_no_tttt_w1',
+             'test_omission_and_conieci_no_tttt_w1_w2',
+             'test_omission_and_correxi',
+             'test_omission_and_correxi_multiple_witnesses',
+             'test_omission_and_correxi_no_tttt_w1',
+             'test_omission_and_correxi_no_tttt_w1_w2')
+CORRECTIONS = (('test_process_addition1', 'add'),
+               ('test_process_addition2', 'add'),
+               ('test_process_addition3', 'add'),
+               ('test_process_correxi1', 'correxi'),
+               ('test_process_correxi2', 'correxi'),
+               ('test_process_conieci1', 'conieci'),
+               ('test_process_conieci2', 'conieci'),
+               ('test_process_standard_variant', 'standard'),
+               ('test_process_standard_variant2', 'standard'),
+               ('test_process_standard_variant_multiple_witnesses',
+                'standard'))
+
+
+def _renumber(text, offset):
+    """Add offset to the number of the footnote symbols ``*n*``."""
+    return MARKER.sub(lambda m: '*{}*'.format(int(m.group(1)) + offset),
+                      text)
+
+
+def _read(name):
+    with open(os.path.join(TEST_FILES, name), 'r', encoding="utf-8") as f:
+        return f.read()
+
+
+def _reference(name):
+    """Return the content of the .ref file, None if it does not exist."""
+    try:
+        return _read(name + '.ref')
+    except OSError:
+        return None
+
+
+def _footnote_xml(text, method, *args):
+    ft = Footnote(text, 1, xml=[])
+    getattr(ft, method)(*args)
+    return '\n'.join(ft.xml)
+
+
+def _check(name, output, reference):
+    if reference is not None and output != reference:
+        raise AssertionError('Output of {} differs from its .ref '
+                             'file'.format(name))
+
+
+def cases(scale=1):
+    """Return the benchmarks.
+
+    Returns
+    -------
+    dict
+        name: function without argument which returns the output (str) of
+        the treatment.
+    """
+    references_in = _read('test_process_references.in')
+    _check('references', analysis.references(references_in),
+           _reference('test_process_references'))
+
+    lines = [line for line in _read('text.txt').splitlines()
+             if line.strip() and not line.strip().rstrip('.').isdigit()]
+    lines = [' ' + analysis.references(line) for line in lines]
+    first = int(lines[0].split('*')[1])
+    n_markers = len(MARKER.findall(' '.join(lines)))
+    # All the lines in one string: one line with many footnotes
+    one_line = ' '.join(_renumber(' '.join(lines), k * n_markers)
+                        for k in range(scale))
+
+    omissions = [(name, _read(name + '.in')) for name in OMISSIONS]
+    corrections = [(name, _read(name + '.in'), kind)
+                   for name, kind in CORRECTIONS]
+    for name, text in omissions:
+        _check(name, _footnote_xml(text, 'omission'), _reference(name))
+    for name, text, kind in corrections:
+        _check(name, _footnote_xml(text, 'correction', kind),
+               _reference(name))
+    omissions *= scale
+    corrections *= scale
+
+    footnotes_txt = _read('footnotes.txt').strip().splitlines()
+    footnotes_lines = [_renumber(line, k * len(footnotes_txt))
+                       for k in range(scale) for line in footnotes_txt]
+
+    def references():
+        return analysis.references(references_in * scale)
+
+    def footnotes_lines_():
+        out = []
+        for _ in range(scale):
+            next_footnote = first
+            for line in lines:
+                xml, next_footnote = analysis.footnotes(line, next_footnote)
+                out += xml
+        return '\n'.join(out)
+
+    def footnotes_one_line():
+        return '\n'.join(analysis.footnotes(one_line, first)[0])
+
+    def omission():
+        return '\n'.join(_footnote_xml(text, 'omission')
+                         for _, text in omissions)
+
+    def correction():
+        return '\n'.join(_footnote_xml(text, 'correction', kind)
+                         for _, text, kind in corrections)
+
+    def dictionary():
+        notes = Footnotes()
+        notes.footnotes = footnotes_lines
+        notes._dictionary()  # pylint: disable=protected-access
+        return json.dumps(notes.footnotes, ensure_ascii=False)
+
+    return {'analysis.references': references,
+            'analysis.footnotes': footnotes_lines_,
+            'analysis.footnotes_one_line': footnotes_one_line,
+            'Footnote.omission': omission,
+            'Footnote.correction': correction,
+            'Footnotes._dictionary': dictionary}
+
+
+def measure(func, repeat=5):
+    """Return the best time (seconds) of one call of the function."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def digest(text):
+    """Digest of the output of a benchmark."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def main(args=None):
+    """Run the benchmarks, return 1 if a function is slower than the
+    baseline or if its output changed."""
+    arguments = docopt(__doc__, argv=args)
+    scale = int(arguments['--scale'])
+    threshold = float(arguments['--threshold']) / 100.
+    fname = arguments['--baseline']
+
+    baseline = {}
+    if os.path.exists(fname):
+        with open(fname, 'r', encoding="utf-8") as f:
+            baseline = json.load(f)
+    key = 'scale={}'.format(scale)
+    reference = {} if arguments['--update'] else baseline.get(key, {})
+
+    results = {}
+    status = 0
+    print('{:<28} {:>12} {:>12} {:>8}'.format('benchmark', 'time (us)',
+                                              'baseline', 'change'))
+    for name, func in cases(scale).items():
+        if arguments['--only'] and name not in arguments['--only']:
+            continue
+        seconds = measure(func, int(arguments['--repeat']))
+        results[name] = {'seconds': seconds, 'digest': digest(func())}
+        line = '{:<28} {:>12.2f}'.format(name, seconds * 1e6)
+        if name in reference:
+            old = reference[name]
+            change = seconds / old['seconds'] - 1
+            line += ' {:>12.2f} {:>+7.0%}'.format(old['seconds'] * 1e6,
+                                                  change)
+            if change > threshold:
+                line += '  SLOWER'
+                status = 1
+            if old['digest'] != results[name]['digest']:
+                line += '  OUTPUT CHANGED'
+                status = 1
+        print(line)
+
+    if not reference:
+        baseline.setdefault(key, {}).update(results)
+        with open(fname, 'w', encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('Baseline saved in {}'.format(fname))
+    elif status:
+        print('Regression compared to the baseline {} (threshold '
+              '{:.0%})'.format(fname, threshold))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
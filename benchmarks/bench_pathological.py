@@ -0,0 +1,187 @@
+"""Benchmark of the conversion of pathological documents.
+
+Each case generates a worst-case document of ``n`` elements: thousands of
+footnotes on one line, references or ``[`` repeated, a long text without
+aphorism numbers, a footnote with a huge list of witnesses... The document
+is converted by :func:`exegis.pipeline.render` (the validation is not done)
+for increasing values of ``n``, a conversion which fails with an error of
+the document is measured too.
+
+The growth of the time is the slope of the time against the size in log-log
+scale between two sizes: 1 for a linear conversion, 2 for a quadratic one.
+The benchmark fails with a report of the cases whose growth exceeds the
+maximum given.
+
+Usage:
+    bench_pathological.py [--sizes=<list>] [--repeat=<n>]
+                          [--max-slope=<x>] [--only=<name>...]
+    bench_pathological.py -h | --help
+
+Options:
+    -h --help               Show this screen.
+    --sizes=<list>          Number of elements of the documents (comma separated) [default: 1000,4000,16000]
+    --repeat=<n>            Number of runs, the fastest is kept [default: 3]
+    --max-slope=<x>         Maximum slope of the time against the size (log-log) [default: 1.3]
+    --only=<name>           Run only the case (can be repeated)
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+import os
+import sys
+import math
+import time
+import tempfile
+from docopt import docopt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from exegis.pipeline import render  # noqa: E402
+from exegis.aphorisms_to_xml import AphorismsToXMLException  # noqa: E402
+
+
+# First aphorism of the documents, a document needs at least one footnote
+FIRST = 'Title\n1.\nAphorism aaaa*1* bbbb.\n'
+
+
+def _notes(n):
+    return '\n'.join('*{0}*aaaa ] W1 bbbb W2.'.format(i)
+                     for i in range(1, n + 1))
+
+
+def footnotes_one_line(n):
+    """One commentary with n footnotes."""
+    line = ' '.join('aaaa bbbb cccc dddd*{}*'.format(i)
+                    for i in range(2, n + 2))
+    return '{}{}.\n\n{}\n'.format(FIRST, line, _notes(n + 1))
+
+
+def references_one_line(n):
+    """One commentary with n references."""
+    line = ' '.join('aaaa [W{} {}r] bbbb'.format(i % 5, i)
+                    for i in range(n))
+    return '{}{}.\n\n{}\n'.format(FIRST, line, _notes(1))
+
+
+def brackets(n):
+    """A reference which starts with n ``[``."""
+    return '{}Commentary {}W1 1r] aaaa.\n\n{}\n'.format(FIRST, '[' * n,
+                                                          _notes(1))
+
+
+def unclosed_brackets(n):
+    """n ``[`` without ``]`` (the conversion fails)."""
+    return '{}Commentary {}.\n\n{}\n'.format(FIRST, ' aaaa [' * n,
+                                               _notes(1))
+
+
+def unnumbered(n):
+    """A text of n lines without aphorism number (all in the title)."""
+    return 'Title aaaa*1* bbbb.\n{}\n\n{}\n'.format(
+        '\n'.join('aaaa bbbb cccc dddd.' for _ in range(n)), _notes(1))
+
+
+def aphorisms(n):
+    """n aphorisms without commentary."""
+    return '{}{}\n\n{}\n'.format(
+        FIRST, '\n'.join('{}.\nAphorism aaaa.'.format(i)
+                         for i in range(2, n + 2)), _notes(1))
+
+
+def blank_lines(n):
+    """Two aphorisms separated by n empty lines."""
+    return '{}{}\n2.\nAphorism bbbb.\n\n{}\n'.format(FIRST, '\n' * n,
+                                                      _notes(1))
+
+
+def witnesses(n):
+    """One footnote with n witnesses."""
+    wits = ', '.join('W{}'.format(i) for i in range(n))
+    return '{}\n*1*aaaa ] cccc {}: dddd {}.\n'.format(FIRST, wits, wits)
+
+
+CASES = {'footnotes_one_line': footnotes_one_line,
+         'references_one_line': references_one_line,
+         'brackets': brackets,
+         'unclosed_brackets': unclosed_brackets,
+         'unnumbered': unnumbered,
+         'aphorisms': aphorisms,
+         'blank_lines': blank_lines,
+         'witnesses': witnesses}
+
+
+def convert(text):
+    """Convert the text (the errors of the document are ignored)."""
+    try:
+        render('pathological_1.txt', text)
+    except AphorismsToXMLException:
+        pass
+
+
+def measure(text, repeat=3):
+    """Return the fastest time (seconds) of the conversion of the text."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def growth(sizes, times):
+    """Return the largest slope (log-log) of the time between two
+    successive sizes."""
+    slopes = [math.log(max(t2, 1e-9) / max(t1, 1e-9)) / math.log(s2 / s1)
+              for s1, s2, t1, t2 in zip(sizes, sizes[1:], times, times[1:])]
+    return max(slopes) if slopes else 0.
+
+
+def main(args=None):
+    """Run the benchmark, return 1 if the time of a case grows faster than
+    the maximum slope."""
+    arguments = docopt(__doc__, argv=args)
+    sizes = [int(s) for s in arguments['--sizes'].split(',')]
+    repeat = int(arguments['--repeat'])
+    max_slope = float(arguments['--max-slope'])
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    failures = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            print('{:<22} {}  {:>6}'.format(
+                'case', ' '.join('{:>10}'.format(s) for s in sizes),
+                'slope'))
+            for name, make in CASES.items():
+                if arguments['--only'] and name not in arguments['--only']:
+                    continue
+                times = [measure(make(size), repeat) for size in sizes]
+                slope = growth(sizes, times)
+                line = '{:<22} {}  {:>6.2f}'.format(
+                    name, ' '.join('{:>10.4f}'.format(t) for t in times),
+                    slope)
+                if slope > max_slope:
+                    line += '  NOT LINEAR'
+                    failures.append((name, slope))
+                print(line)
+        finally:
+            os.chdir(cwd)
+
+    if failures:
+        print('Conversion time grows faster than the size '
+              '(maximum slope {:.2f}):'.format(max_slope))
+        for name, slope in failures:
+            print('    {}: {} (slope {:.2f})'.format(name,
+                                                   CASES[name].__doc__,
+                                                   slope))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
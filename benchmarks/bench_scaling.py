@@ -0,0 +1,147 @@
+"""Benchmark of the conversion time and memory against the size of the
+document.
+
+Synthetic documents (see :mod:`corpus`) of increasing sizes are converted
+by :meth:`exegis.aphorisms_to_xml.Process.main` (reading, conversion,
+writing and validation). The time and the peak of memory (tracemalloc, in a
+separate run) are printed for each size, with the slope of the time against
+the size in log-log scale: 1 for a linear conversion, 2 for a quadratic
+one. The benchmark fails if the slope exceeds the maximum given.
+
+The compilation of the Relaxng schema is done once before the measures.
+
+Usage:
+    bench_scaling.py [--sizes=<list>] [--commentaries=<n>]
+                     [--footnotes=<n>] [--references=<n>] [--repeat=<n>]
+                     [--max-slope=<x>] [--no-memory]
+    bench_scaling.py -h | --help
+
+Options:
+    -h --help               Show this screen.
+    --sizes=<list>          Number of aphorisms of the documents (comma separated) [default: 10,100,1000]
+    --commentaries=<n>      Number of commentaries per aphorism [default: 2]
+    --footnotes=<n>         Number of footnotes per line [default: 1]
+    --references=<n>        Number of references per line [default: 1]
+    --repeat=<n>            Number of runs, the fastest is kept [default: 3]
+    --max-slope=<x>         Maximum slope of the time against the size (log-log) [default: 1.3]
+    --no-memory             Do not measure the peak of memory
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+import os
+import sys
+import math
+import time
+import tempfile
+import tracemalloc
+from docopt import docopt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from exegis.aphorisms_to_xml import Process  # noqa: E402
+from corpus import generate  # noqa: E402
+
+
+def convert(fname):
+    """Convert a file with Process.main (the XML is written in the working
+    directory)."""
+    comtoepi = Process(fname=fname)
+    comtoepi.main()
+    return comtoepi
+
+
+def measure(fname, repeat=3, memory=True):
+    """Convert a file several times.
+
+    Returns
+    -------
+    tuple
+        fastest time (seconds) and peak of memory (bytes, 0 if not
+        measured).
+    """
+    best = min(_timed(fname) for _ in range(repeat))
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        try:
+            convert(fname)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def _timed(fname):
+    start = time.perf_counter()
+    convert(fname)
+    return time.perf_counter() - start
+
+
+def slope(sizes, values):
+    """Slope of the least square line of log(values) against log(sizes)."""
+    x = [math.log(s) for s in sizes]
+    y = [math.log(max(v, 1e-9)) for v in values]
+    mean_x, mean_y = sum(x) / len(x), sum(y) / len(y)
+    var = sum((xi - mean_x) ** 2 for xi in x)
+    if var == 0:
+        return 0.
+    return sum((xi - mean_x) * (yi - mean_y) for xi, yi in zip(x, y)) / var
+
+
+def main(args=None):
+    """Run the benchmark, return 1 if the slope exceeds the maximum."""
+    arguments = docopt(__doc__, argv=args)
+    sizes = [int(s) for s in arguments['--sizes'].split(',')]
+    repeat = int(arguments['--repeat'])
+    memory = not arguments['--no-memory']
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            # Compile the Relaxng schema before the measures
+            fname = os.path.join(folder, 'warmup_1.txt')
+            with open(fname, 'w', encoding="utf-8") as f:
+                f.write(generate(aphorisms=1))
+            convert(fname)
+
+            print('{:>9} {:>10} {:>10} {:>12} {:>10}'.format(
+                'aphorisms', 'bytes', 'time (s)', 'us/byte', 'peak (MB)'))
+            n_bytes, times, peaks = [], [], []
+            for size in sizes:
+                text = generate(
+                    aphorisms=size,
+                    commentaries=int(arguments['--commentaries']),
+                    footnotes=int(arguments['--footnotes']),
+                    references=int(arguments['--references']))
+                fname = os.path.join(folder, 'synthetic_{}.txt'.format(size))
+                with open(fname, 'w', encoding="utf-8") as f:
+                    f.write(text)
+                elapsed, peak = measure(fname, repeat, memory)
+                n_bytes.append(len(text.encode('utf-8')))
+                times.append(elapsed)
+                peaks.append(peak)
+                print('{:>9} {:>10} {:>10.4f} {:>12.3f} {:>10.3f}'.format(
+                    size, n_bytes[-1], elapsed, elapsed / n_bytes[-1] * 1e6,
+                    peak / 1024. / 1024.))
+        finally:
+            os.chdir(cwd)
+
+    max_slope = float(arguments['--max-slope'])
+    time_slope = slope(n_bytes, times)
+    print('Slope of the time against the size: {:.2f} '
+          '(maximum {:.2f})'.format(time_slope, max_slope))
+    if memory:
+        print('Slope of the memory against the size: {:.2f}'.format(
+            slope(n_bytes, peaks)))
+    if time_slope > max_slope:
+        print('Conversion time grows faster than the size of the document')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
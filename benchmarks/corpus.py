@@ -0,0 +1,163 @@
+"""Generator of synthetic exegis texts used by the benchmarks.
+
+The texts follow the conventions of the exegis documents: an optional
+introduction between ``++``, a title, numbered aphorisms followed by their
+commentaries, witness references ``[W1 12r]`` and footnotes of each kind
+(omission, addition, correxi, conieci and standard variation). The same
+parameters and seed always give the same text.
+
+Usage:
+    corpus.py <folder> [--files=<n>] [--aphorisms=<n>]
+              [--commentaries=<n>] [--witnesses=<n>] [--references=<n>]
+              [--footnotes=<n>] [--kinds=<list>] [--introduction]
+              [--seed=<n>]
+    corpus.py -h | --help
+
+Options:
+    -h --help               Show this screen.
+    --files=<n>             Number of files [default: 1]
+    --aphorisms=<n>         Number of aphorisms per file [default: 10]
+    --commentaries=<n>      Number of commentaries per aphorism [default: 2]
+    --witnesses=<n>         Number of witnesses [default: 5]
+    --references=<n>        Number of references per line [default: 1]
+    --footnotes=<n>         Number of footnotes per line [default: 1]
+    --kinds=<list>          Kinds of footnotes (comma separated) [default: omission,addition,correxi,conieci,standard]
+    --introduction          Add an introduction
+    --seed=<n>              Seed of the random generator [default: 0]
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+import os
+import sys
+import random
+
+# Kinds of footnotes
+KINDS = ('omission', 'addition', 'correxi', 'conieci', 'standard')
+
+WORDS = ('aaaa', 'bbbb', 'cccc', 'dddd', 'eeee', 'ffff', 'gggg', 'hhhh',
+         'iiii', 'ssss', 'tttt')
+
+
+def _words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def _witnesses(rng, witnesses, n):
+    return ', '.join(rng.sample(witnesses, min(n, len(witnesses))))
+
+
+def footnote(n_footnote, kind, witnesses, rng):
+    """Return the line of a footnote (``*n*...``) of the given kind."""
+    a = _witnesses(rng, witnesses, rng.randint(1, 2))
+    b = _witnesses(rng, witnesses, rng.randint(1, 2))
+    if kind == 'omission':
+        text = '{} ] {}: om. {}'.format(_words(rng, 2), a, b)
+    elif kind == 'addition':
+        text = '{} ] add. {} {}'.format(_words(rng, 2), _words(rng, 2), a)
+    elif kind == 'correxi':
+        text = '{} ] correxi: {} {}'.format(_words(rng, 2), _words(rng, 2),
+                                            a)
+    elif kind == 'conieci':
+        text = '{} ] conieci: {} {}: {} {}'.format(_words(rng, 1),
+                                                   _words(rng, 2), a,
+                                                   _words(rng, 2), b)
+    elif kind == 'standard':
+        text = '{} ] {}: {} {}'.format(_words(rng, 2), a, _words(rng, 2), b)
+    else:
+        raise ValueError('Unknown kind of footnote {}'.format(kind))
+    return '*{}*{}.'.format(n_footnote, text)
+
+
+def generate(aphorisms=10, commentaries=2, witnesses=5, references=1,
+             footnotes=1, kinds=KINDS, introduction=False, seed=0):
+    """Generate an exegis text.
+
+    Parameters
+    ----------
+    aphorisms : int, optional
+        number of aphorisms.
+
+    commentaries : int, optional
+        number of commentaries of each aphorism.
+
+    witnesses : int, optional
+        number of witnesses (W1, W2...).
+
+    references : int, optional
+        number of references ``[W p]`` in each line.
+
+    footnotes : int, optional
+        number of footnotes in each line.
+
+    kinds : tuple, optional
+        kinds of footnotes used (in turn).
+
+    introduction : bool, optional
+        if True the text starts with an introduction.
+
+    seed : int, optional
+        seed of the random generator.
+
+    Returns
+    -------
+    str
+        the text.
+    """
+    rng = random.Random(seed)
+    witnesses = ['W{}'.format(i) for i in range(1, witnesses + 1)]
+    notes = []
+
+    def line():
+        parts = [_words(rng, 3)]
+        for _ in range(references):
+            parts.append('[{} {}r]'.format(rng.choice(witnesses),
+                                           rng.randint(1, 300)))
+            parts.append(_words(rng, 2))
+        for _ in range(footnotes):
+            notes.append(footnote(len(notes) + 1,
+                                  kinds[len(notes) % len(kinds)],
+                                  witnesses, rng))
+            parts.append('{}*{}* {}'.format(_words(rng, 1), len(notes),
+                                            _words(rng, 2)))
+        return ' '.join(parts) + '.'
+
+    lines = ['Title ' + _words(rng, 3)]
+    if introduction:
+        lines += ['++', 'Introduction ' + line(), '++']
+    for n in range(1, aphorisms + 1):
+        lines.append('{}.'.format(n))
+        lines.append('Aphorism ' + line())
+        for _ in range(commentaries):
+            lines.append('Commentary ' + line())
+    lines.append('')
+    lines += notes
+    return '\n'.join(lines) + '\n'
+
+
+def main(args=None):
+    """Write the synthetic corpus in the folder."""
+    from docopt import docopt
+    arguments = docopt(__doc__, argv=args)
+    folder = arguments['<folder>']
+    os.makedirs(folder, exist_ok=True)
+    seed = int(arguments['--seed'])
+    for i in range(1, int(arguments['--files']) + 1):
+        text = generate(aphorisms=int(arguments['--aphorisms']),
+                        commentaries=int(arguments['--commentaries']),
+                        witnesses=int(arguments['--witnesses']),
+                        references=int(arguments['--references']),
+                        footnotes=int(arguments['--footnotes']),
+                        kinds=tuple(arguments['--kinds'].split(',')),
+                        introduction=arguments['--introduction'],
+                        seed=seed + i)
+        fname = os.path.join(folder, 'synthetic_{}.txt'.format(i))
+        with open(fname, 'w', encoding="utf-8") as f:
+            f.write(text)
+        print('{} ({} bytes)'.format(fname, len(text.encode('utf-8'))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
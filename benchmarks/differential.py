@@ -0,0 +1,334 @@
+"""Differential test of a candidate conversion against the current one.
+
+The current conversion (:class:`exegis.aphorisms_to_xml.Process` through
+:func:`exegis.pipeline.render`) and a candidate implementation are run on
+the same documents, in parallel in a pool of worker processes (see
+:class:`exegis.pool.WorkerPool`). The documents are the text files of a
+corpus or synthetic documents (see :mod:`corpus`).
+
+The candidate is given as ``module:function``. The function is called with
+the name of the file and its text and returns the XML, or a tuple whose
+first element is the XML like :func:`~exegis.pipeline.render`. A document
+rejected by both implementations with the same exception is considered
+identical.
+
+The XML are compared byte for byte or, with ``--c14n``, after their
+canonicalisation (C14N). The time of each implementation is the fastest
+of several conversions, after a first conversion which is not timed. The
+implementations are run in turn, the first one is drawn at random and they
+alternate. For each document which differs the first line, the first unit
+(aphorism and commentaries) and the first footnote (``<app>``) which differ
+are reported with the time of both implementations. The test fails if a
+document differs.
+
+Usage:
+    differential.py <candidate> <path> [--exclude=<pattern>...] [--jobs=<n>]
+                    [--c14n] [--repeat=<n>] [--max-report=<n>]
+    differential.py <candidate> --synthetic=<n> [--aphorisms=<n>]
+                    [--footnotes=<n>] [--jobs=<n>] [--c14n] [--repeat=<n>]
+                    [--max-report=<n>]
+    differential.py -h | --help
+
+Options:
+    -h --help               Show this screen.
+    --exclude=<pattern>     Ignore files and folders matching the glob pattern (can be repeated)
+    --synthetic=<n>         Number of synthetic documents compared
+    --aphorisms=<n>         Number of aphorisms of the synthetic documents [default: 50]
+    --footnotes=<n>         Number of footnotes per line of the synthetic documents [default: 2]
+    --jobs=<n>              Number of worker processes [default: 2]
+    --c14n                  Compare the canonical form (C14N) of the XML
+    --repeat=<n>            Number of conversions of each document, the fastest is kept [default: 3]
+    --max-report=<n>        Number of differing documents reported in detail [default: 10]
+
+Example::
+
+    python benchmarks/differential.py mymodule:convert texts --c14n
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+import os
+import re
+import sys
+import time
+import random
+import logging
+import tempfile
+import importlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from docopt import docopt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from exegis.pipeline import render  # noqa: E402
+from exegis.discovery import Discovery  # noqa: E402
+from exegis.pool import WorkerPool, PoolException  # noqa: E402
+from corpus import generate  # noqa: E402
+
+# Beginning of a unit and of a footnote in the XML
+UNIT = re.compile(r'<div n="([^"]*)" type="aphorism_commentary_unit">')
+APP = re.compile(r'<app from="#begin_fn([^"]*)"')
+
+# Candidates already imported (in each worker)
+_candidates = {}
+
+
+def load(candidate):
+    """Import the function ``module:function``."""
+    if candidate not in _candidates:
+        module, sep, name = candidate.partition(':')
+        if not sep or not name:
+            raise ValueError('The candidate has to be given as '
+                             'module:function, got {}'.format(candidate))
+        _candidates[candidate] = getattr(importlib.import_module(module),
+                                         name)
+    return _candidates[candidate]
+
+
+def legacy(path, text):
+    """Current conversion of a text."""
+    return render(path, text)[0]
+
+
+def _run(func, path, text):
+    """Call the conversion, return the XML (None if it failed), the error
+    (``name: message``) and the time spent."""
+    start = time.perf_counter()
+    try:
+        xml, error = func(path, text), None
+        if isinstance(xml, tuple):
+            xml = xml[0]
+    except Exception as e:  # pylint: disable=broad-except
+        xml, error = None, '{}: {}'.format(type(e).__name__, e)
+    return xml, error, time.perf_counter() - start
+
+
+def canonical(xml):
+    """Return the canonical form (C14N) of the XML."""
+    from lxml import etree
+    root = etree.fromstring(xml.encode('utf-8'))
+    return etree.tostring(root, method='c14n').decode('utf-8')
+
+
+def sections(xml):
+    """Split the XML in sections: the beginning, each unit and each
+    footnote.
+
+    Returns
+    -------
+    OrderedDict
+        the key is ``(kind, n)`` with kind ``header``, ``unit`` or
+        ``footnote``, the value is the list of lines of the section.
+    """
+    result = OrderedDict()
+    key = ('header', '')
+    for line in xml.splitlines():
+        match = UNIT.search(line)
+        if match:
+            key = ('unit', match.group(1))
+        else:
+            match = APP.search(line)
+            if match:
+                key = ('footnote', match.group(1))
+        result.setdefault(key, []).append(line)
+    return result
+
+
+def compare(legacy_xml, candidate_xml):
+    """Compare two XML.
+
+    Returns
+    -------
+    dict
+        None if the XML are identical, otherwise the number of the first
+        line which differs, this line in both XML and the first unit and
+        footnote which differ (None if they are all identical).
+    """
+    if legacy_xml == candidate_xml:
+        return None
+    old, new = legacy_xml.splitlines(), candidate_xml.splitlines()
+    line = next((i for i, (a, b) in enumerate(zip(old, new)) if a != b),
+                min(len(old), len(new)))
+
+    old_sections, new_sections = sections(legacy_xml), sections(candidate_xml)
+    keys = list(old_sections) + [key for key in new_sections
+                                 if key not in old_sections]
+
+    def first(kind):
+        for key in keys:
+            if key[0] == kind and \
+                    old_sections.get(key) != new_sections.get(key):
+                return key[1]
+        return None
+
+    return {'line': line + 1,
+            'legacy': old[line] if line < len(old) else None,
+            'candidate': new[line] if line < len(new) else None,
+            'unit': first('unit'),
+            'footnote': first('footnote')}
+
+
+def compare_file(candidate, path, text, c14n=False, repeat=1):
+    """Convert a text with both implementations and compare the results.
+
+    This function is executed in the worker processes.
+
+    Returns
+    -------
+    dict
+        path, time and error of each implementation and the difference
+        (see :func:`compare`, None if the results are identical).
+    """
+    # A first run of both implementations is not timed (imports, template,
+    # regular expressions...), then they are run in turn, the first one
+    # drawn at random, and the fastest time of each is kept
+    implementations = [legacy, load(candidate)]
+    for func in implementations:
+        _run(func, path, text)
+    times = [float('inf'), float('inf')]
+    outputs = [None, None]
+    first = random.randrange(2)
+    for i in range(max(1, repeat)):
+        for j in ((0, 1) if (i + first) % 2 == 0 else (1, 0)):
+            xml, error, seconds = _run(implementations[j], path, text)
+            outputs[j] = xml, error
+            times[j] = min(times[j], seconds)
+    (legacy_xml, legacy_error), (candidate_xml, candidate_error) = outputs
+    legacy_time, candidate_time = times
+
+    result = {'path': path,
+              'legacy_time': legacy_time,
+              'candidate_time': candidate_time,
+              'difference': None}
+
+    if legacy_error or candidate_error:
+        if legacy_error is None or candidate_error is None or \
+                legacy_error.partition(':')[0] != \
+                candidate_error.partition(':')[0]:
+            result['difference'] = {'legacy_error': legacy_error,
+                                    'candidate_error': candidate_error}
+        return result
+
+    if c14n:
+        from lxml import etree
+        try:
+            legacy_xml = canonical(legacy_xml)
+        except etree.XMLSyntaxError as e:
+            result['difference'] = {'legacy_error': str(e)}
+            return result
+        try:
+            candidate_xml = canonical(candidate_xml)
+        except etree.XMLSyntaxError as e:
+            result['difference'] = {'candidate_error': 'XML not well '
+                                                       'formed: {}'.format(e)}
+            return result
+
+    result['difference'] = compare(legacy_xml, candidate_xml)
+    return result
+
+
+def documents(arguments):
+    """Yield the name and the text of the documents compared."""
+    if arguments['--synthetic']:
+        for i in range(1, int(arguments['--synthetic']) + 1):
+            yield 'synthetic_{}.txt'.format(i), generate(
+                aphorisms=int(arguments['--aphorisms']),
+                footnotes=int(arguments['--footnotes']),
+                introduction=i % 2 == 0, seed=i)
+        return
+    for text_file in Discovery(arguments['<path>'],
+                               exclude=arguments['--exclude']):
+        try:
+            with open(text_file.path, 'r', encoding="utf-8") as f:
+                yield text_file.relpath, f.read()
+        except UnicodeDecodeError:
+            print('{}: not an utf-8 text, ignored'.format(text_file.relpath))
+
+
+def _report(result):
+    difference = result['difference']
+    print('{}: DIFFERENT (legacy {:.4f} s, candidate {:.4f} s)'.format(
+        result['path'], result['legacy_time'], result['candidate_time']))
+    if 'line' not in difference:
+        for side in ('legacy', 'candidate'):
+            print('    {:<9} {}'.format(side, difference.get(side + '_error')
+                                        or 'ok'))
+        return
+    print('    first difference line {}, unit {}, footnote {}'.format(
+        difference['line'], difference['unit'], difference['footnote']))
+    for side in ('legacy', 'candidate'):
+        print('    {:<9} {!r}'.format(side, difference[side]))
+
+
+def main(args=None):
+    """Run the comparison, return 1 if a document differs."""
+    arguments = docopt(__doc__, argv=args)
+    candidate = arguments['<candidate>']
+    c14n = arguments['--c14n']
+    max_report = int(arguments['--max-report'])
+    repeat = int(arguments['--repeat'])
+    if arguments['<path>']:
+        arguments['<path>'] = os.path.abspath(arguments['<path>'])
+    load(candidate)
+
+    # The errors of the documents are in the report
+    logging.disable(logging.CRITICAL)
+
+    n_documents = n_different = 0
+    legacy_time = candidate_time = 0.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            jobs = int(arguments['--jobs'])
+            with WorkerPool(jobs) as pool, ThreadPoolExecutor(jobs) as threads:
+
+                def task(document):
+                    try:
+                        return pool.run(compare_file, candidate, document[0],
+                                        document[1], c14n, repeat)
+                    except PoolException as e:
+                        return {'path': document[0], 'legacy_time': 0.,
+                                'candidate_time': 0.,
+                                'difference': {'legacy_error': str(e),
+                                               'candidate_error': str(e)}}
+
+                # At most two documents waiting for each worker, the
+                # corpus is not read in memory
+                inputs = documents(arguments)
+                pending = deque()
+
+                def submit():
+                    for document in inputs:
+                        pending.append(threads.submit(task, document))
+                        if len(pending) >= 2 * jobs:
+                            return
+
+                submit()
+                while pending:
+                    result = pending.popleft().result()
+                    submit()
+                    n_documents += 1
+                    legacy_time += result['legacy_time']
+                    candidate_time += result['candidate_time']
+                    if result['difference'] is not None:
+                        n_different += 1
+                        if n_different <= max_report:
+                            _report(result)
+        finally:
+            os.chdir(cwd)
+
+    print('{} documents: {} identical, {} different'.format(
+        n_documents, n_documents - n_different, n_different))
+    print('Time of the conversions: legacy {:.3f} s, candidate {:.3f} s'
+          ''.format(legacy_time, candidate_time) +
+          (' (speedup {:.2f})'.format(legacy_time / candidate_time)
+           if candidate_time > 0 else ''))
+    return 1 if n_different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
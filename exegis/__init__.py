@@ -3,3 +3,52 @@
 __author__ = """Nicolas Gruel"""
 __email__ = 'nicolas.gruel@manchester.ac.uk'
 __version__ = '0.5.0'
+
+
+def convert(text, doc_num=1, template=None, validate=True, relaxng=None):
+    """Convert an exegis text in XML in memory (see
+    :func:`exegis.api.convert`).
+
+    The conversion modules are imported at the first call.
+    """
+    from .api import convert as _convert
+    return _convert(text, doc_num=doc_num, template=template,
+                    validate=validate, relaxng=relaxng)
+
+
+def convert_many(inputs, jobs=1, ordered=True, template=None, validate=True,
+                 relaxng=None, cancel=None):
+    """Convert several exegis texts in XML in memory (see
+    :func:`exegis.api.convert_many`).
+
+    The conversion modules are imported at the first call.
+    """
+    from .api import convert_many as _convert_many
+    return _convert_many(inputs, jobs=jobs, ordered=ordered,
+                         template=template, validate=validate,
+                         relaxng=relaxng, cancel=cancel)
+
+
+def convert_async(text, doc_num=1, template=None, validate=True,
+                  relaxng=None):
+    """Convert an exegis text in XML from :mod:`asyncio` (see
+    :func:`exegis.aio.convert_async`), returns a coroutine.
+
+    The conversion modules are imported at the first call.
+    """
+    from .aio import convert_async as _convert_async
+    return _convert_async(text, doc_num=doc_num, template=template,
+                          validate=validate, relaxng=relaxng)
+
+
+def convert_many_async(inputs, ordered=True, template=None, validate=True,
+                       relaxng=None):
+    """Convert several exegis texts in XML from :mod:`asyncio` (see
+    :func:`exegis.aio.convert_many_async`), returns an asynchronous
+    generator.
+
+    The conversion modules are imported at the first call.
+    """
+    from .aio import convert_many_async as _convert_many_async
+    return _convert_many_async(inputs, ordered=ordered, template=template,
+                               validate=validate, relaxng=relaxng)
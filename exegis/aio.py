@@ -0,0 +1,247 @@
+"""Module which contains the functions used to convert exegis texts in XML
+from :mod:`asyncio` programs.
+
+The conversion does not block the event loop: the analysis of the text
+(pure Python) is done in a pool of processes, the validation of the XML
+(lxml, which releases the GIL) in a pool of threads::
+
+    import exegis
+
+    async def ingest(text):
+        result = await exegis.convert_async(text)
+        ...
+
+    async def ingest_all(texts):
+        async for result in exegis.convert_many_async(texts):
+            ...
+
+The executors and the number of conversions done at the same time are set by
+creating an :class:`AsyncConverter`.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import asyncio
+import weakref
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from .api import Context, doc_number
+except ImportError:
+    from api import Context, doc_number
+
+
+def _parse(context, text, doc_num, name):
+    """Conversion done in the executor of the analysis."""
+    return context.parse(text, doc_num, name)
+
+
+def _warm(context):
+    """Compile the Relaxng schema in a thread of the validation."""
+    try:
+        context.warm()
+    except Exception:  # pylint: disable=broad-except
+        # The error is reported by the validation
+        pass
+
+
+class AsyncConverter(object):
+    """Class which converts exegis texts without blocking the event loop.
+
+    Attributes
+    ----------
+    processes : int, optional
+        number of processes used for the analysis of the texts, 0 to do it
+        in the threads of the validation. Default: number of CPUs
+
+    threads : int, optional
+        number of threads used for the validation. Each thread compiles the
+        Relaxng schema when it starts (several seconds). Default: 1
+
+    limit : int, optional
+        number of conversions done at the same time, the others wait.
+        Default: processes + threads
+
+    template, validate, relaxng : optional
+        see :func:`exegis.api.convert`.
+
+    process_executor, thread_executor : concurrent.futures.Executor, optional
+        executors used instead of the ones created with ``processes`` and
+        ``threads`` (they are not shut down by :meth:`close`).
+
+    Raises
+    ------
+    AphorismsToXMLException
+        if the template cannot be read.
+    """
+    def __init__(self, processes=None, threads=1, limit=None, template=None,
+                 validate=True, relaxng=None, process_executor=None,
+                 thread_executor=None):
+        self.context = Context(template, validate, relaxng)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.processes = processes
+        self.threads = max(1, threads)
+        self.limit = limit or self.processes + self.threads
+
+        self._owned = []
+        if thread_executor is None:
+            thread_executor = ThreadPoolExecutor(
+                self.threads, initializer=_warm, initargs=(self.context,))
+            self._owned.append(thread_executor)
+        if process_executor is None and self.processes:
+            process_executor = ProcessPoolExecutor(self.processes)
+            self._owned.append(process_executor)
+        self.thread_executor = thread_executor
+        self.process_executor = process_executor or thread_executor
+
+        # One semaphore per event loop (forgotten with the loop)
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.limit)
+            return self._semaphores[loop]
+
+    async def convert(self, text, doc_num=1, name=None):
+        """Convert a text (see :func:`exegis.api.convert`).
+
+        Returns
+        -------
+        Result
+            the XML and the diagnostics.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._semaphore():
+            result = await loop.run_in_executor(
+                self.process_executor, _parse, self.context, text, doc_num,
+                name)
+            if self.context.validate and result.xml is not None:
+                result = await loop.run_in_executor(
+                    self.thread_executor, self.context.check, result)
+        return result
+
+    async def convert_many(self, inputs, ordered=True):
+        """Convert several texts (see :func:`exegis.api.convert_many`).
+
+        At most ``limit`` texts are read in advance from ``inputs``. The
+        conversions not finished are cancelled when the iteration stops
+        (``aclose()`` or cancellation of the task).
+
+        Parameters
+        ----------
+        inputs : iterable or asynchronous iterable
+            ``(name, text)`` of the documents.
+
+        ordered : bool, optional
+            if True the results are returned in the order of the inputs,
+            otherwise as soon as they are ready. Default: True
+
+        Yields
+        ------
+        Result
+            the result of each document (with its name).
+        """
+        if hasattr(inputs, '__aiter__'):
+            iterator = inputs.__aiter__()
+        else:
+            iterator = iter(inputs)
+
+        async def next_input():
+            try:
+                if hasattr(iterator, '__anext__'):
+                    return await iterator.__anext__()
+                return next(iterator)
+            except (StopIteration, StopAsyncIteration):
+                return None
+
+        pending = deque()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.limit:
+                    document = await next_input()
+                    if document is None:
+                        exhausted = True
+                        break
+                    name, text = document
+                    pending.append(asyncio.ensure_future(
+                        self.convert(text, doc_number(name), name)))
+                if not pending:
+                    break
+                if ordered:
+                    task = pending.popleft()
+                    await task
+                else:
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED)
+                    task = next(t for t in pending if t in done)
+                    pending.remove(task)
+                yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        """Shut down the executors created by the converter."""
+        while self._owned:
+            self._owned.pop().shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+# Converter used by the functions of the module (created at the first call)
+_converters = {}
+_converters_lock = threading.Lock()
+
+
+def converter(template=None, validate=True, relaxng=None):
+    """Return the converter shared by the functions of the module for these
+    options (created at the first call)."""
+    key = (template, validate, relaxng)
+    with _converters_lock:
+        if key not in _converters:
+            _converters[key] = AsyncConverter(template=template,
+                                              validate=validate,
+                                              relaxng=relaxng)
+        return _converters[key]
+
+
+async def convert_async(text, doc_num=1, template=None, validate=True,
+                        relaxng=None):
+    """Convert an exegis text without blocking the event loop (see
+    :func:`exegis.api.convert`).
+
+    Returns
+    -------
+    Result
+        the XML and the diagnostics.
+    """
+    return await converter(template, validate, relaxng).convert(text,
+                                                                doc_num)
+
+
+def convert_many_async(inputs, ordered=True, template=None, validate=True,
+                       relaxng=None):
+    """Convert several exegis texts without blocking the event loop (see
+    :meth:`AsyncConverter.convert_many`).
+
+    Returns
+    -------
+    asynchronous generator
+        yields the :class:`~exegis.api.Result` of each document.
+    """
+    return converter(template, validate, relaxng).convert_many(inputs,
+                                                               ordered)
@@ -53,67 +53,70 @@ def references(line):
         - ``[W1 W2`` : missing ``]``
     """
 
-    # Create a string to contain the return value
-    result = ''
-
     if not line:
         return
 
+    # The parts of the result are joined at the end and the line is
+    # scanned with positions (no copy of the remaining text) to keep the
+    # time linear with the length of the line.
+    result = []
+    pos = 0
+
     while True:
-        # Try to partition this line at the first '[' character
-        text_before, sep, text_after = line.partition('[')
+        # Find the next '[' character
+        start = line.find('[', pos)
 
-        # Note: if sep is zero there are no more witnesses to add
+        # Note: if start is -1 there are no more witnesses to add
+        text_before = line[pos:] if start == -1 else line[pos:start]
 
-        # Add text_before to the result string
+        # Add text_before to the result
         if text_before != '':
-            result += text_before
+            result.append(text_before)
             # If there is a witness to add start a new line
-            if sep != '':
-                result += '\n'
+            if start != -1:
+                result.append('\n')
 
-        # If sep has zero length we can stop because there are no more
+        # If there is no '[' we can stop because there are no more
         # witness _references
-        if sep == '':
+        if start == -1:
             break
 
-        # Try to split text_after at the first ']' character
-        reference, sep, line = text_after.partition(']')
+        # Find the ']' character which closes the reference
+        end = line.find(']', start + 1)
 
-        # If this partition failed then something went wrong,
-        # so throw an error
-        if sep == '':
-            error = 'Unable to partition string {} at "]" ' \
-                    'when looking for a reference'.format(line)
-            logger.error(error)
+        # If there is no ']' something went wrong, so throw an error
+        if end == -1:
+            logger.error('Unable to partition string %s at "]" '
+                         'when looking for a reference', line[start + 1:])
             raise AnalysisException
 
         # Partition the reference into witness and location (these are
         # separated by the ' ' character)
+        reference = line[start + 1:end]
         witness, sep, page = reference.partition(' ')
 
         # If this partition failed there is an error
         if sep == '':
-            error = ('Unable to partition reference [{}] '
-                     'because missing space probably'.format(reference))
-            logger.error(error)
+            logger.error('Unable to partition reference [%s] '
+                         'because missing space probably', reference)
             raise AnalysisException
 
-        # Add the witness and location XML to the result string
-        result += '<locus target="' + witness.strip() + \
-                  '">' + page.strip() + '</locus>'
+        # Add the witness and location XML to the result
+        result.append('<locus target="' + witness.strip() +
+                      '">' + page.strip() + '</locus>')
 
-        # If text has zero length we can stop
-        if line == '':
+        # If there is no more text we can stop
+        pos = end + 1
+        if pos == len(line):
             break
         else:
             # There is more text to process so start a new line
-            result += '\n'
+            result.append('\n')
 
-    return result
+    return ''.join(result)
 
 
-def footnotes(string_to_process, next_footnote):
+def footnotes(string_to_process, next_footnote, anchors=None):
     """
     This helper function takes a single string containing text and
     processes any embedded footnote symbols (describing additions,
@@ -138,6 +141,9 @@ def footnotes(string_to_process, next_footnote):
     next_footnote: int
         reference the footnote to find.
 
+    anchors: exegis.anchors.Anchors, optional
+        if given the anchors created are added to it.
+
     Returns
     -------
 
@@ -156,26 +162,29 @@ def footnotes(string_to_process, next_footnote):
     """
     # Create lists to contain the XML
     xml_main = []
+    # Position of the text not yet processed. The string is not
+    # partitioned (which copies the remaining text at each footnote) to
+    # keep the time linear with the length of the line.
+    pos = 0
     try:
         while True:
-            # Use string partition to try to split this text at
-            # the next footnote symbol
+            # Find the next footnote symbol
             footnote_symbol = '*' + str(next_footnote) + '*'
-            text_before_symbol, sep, string_to_process = \
-                string_to_process.partition(footnote_symbol)
+            start = string_to_process.find(footnote_symbol, pos)
 
-            # If the partition failed sep will have zero length and the next
-            # footnote is not in this line, hence we can stop
-            # processing and return
-            if sep == '':
-                # Add text_before_symbol to the XML and stop processing
-                for next_line in text_before_symbol.splitlines():
+            # If the symbol is not found the next footnote is not in this
+            # line, hence we can stop processing and return
+            if start == -1:
+                # Add the remaining text to the XML and stop processing
+                for next_line in string_to_process[pos:].splitlines():
                     xml_main.append(XML_OSS * XML_N_OFFSET +
                                     next_line.strip())
                 break
 
-            # We know sep has non-zero length and we are dealing with
-            # a footnote.
+            # We are dealing with a footnote.
+            text_before_symbol = string_to_process[pos:start]
+            pos = start + len(footnote_symbol)
+
             # Now use string partition to try to split text_before_symbol
             # at a '#' character.
             next_text_for_xml, sep, base_text = \
@@ -192,9 +201,8 @@ def footnotes(string_to_process, next_footnote):
             # Check we succeeded in partitioning the text before the footnote
             # at '#' or ' '. If we didn't there's an error.
             if sep == '':
-                error = ('Unable to partition text before footnote symbol '
-                         '{}'.format(footnote_symbol))
-                logger.error(error)
+                logger.error('Unable to partition text before footnote '
+                             'symbol %s', footnote_symbol)
                 error = ('Probably missing a space or the "#" character '
                          'to determine the word(s) to apply the footnote')
                 logger.error(error)
@@ -219,16 +227,19 @@ def footnotes(string_to_process, next_footnote):
                             '<anchor xml:id="end_fn' +
                             str(next_footnote) + '"/>')
 
+            if anchors is not None:
+                anchors.anchor('begin_fn' + str(next_footnote))
+                anchors.anchor('end_fn' + str(next_footnote))
+
             # Increment the footnote number
             next_footnote += 1
 
             # Test to see if there is any more text to process
-            if string_to_process == '':
+            if pos == len(string_to_process):
                 break
     except (AttributeError, AnalysisException):
-        error = 'Cannot analyse aphorism or commentary ' \
-                '{}'.format(string_to_process)
-        logger.error(error)
+        logger.error('Cannot analyse aphorism or commentary %s',
+                     string_to_process)
         raise AnalysisException
 
     return xml_main, next_footnote
@@ -0,0 +1,92 @@
+"""Module which contains the check of the consistency between the anchors of
+the main text and the apparatus.
+
+Each footnote gives two anchors in the main text
+(``<anchor xml:id="begin_fnN"/>`` and ``<anchor xml:id="end_fnN"/>``) and an
+apparatus ``<app from="#begin_fnN" to="#end_fnN">``. The Relaxng validation
+does not verify that the references of the apparatus exist, the
+:class:`Anchors` collected during the conversion do it in linear time: the
+anchors without apparatus, the apparatus without anchors and the identifiers
+given twice are reported.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+
+
+class Anchors(object):
+    """Class which collects the anchors and the references of the apparatus
+    created during the conversion of a document.
+
+    Attributes
+    ----------
+    anchors : dict
+        identifiers of the anchors created (in their order, the values are
+        not used).
+
+    references : dict
+        identifiers referenced by the apparatus (``from`` and ``to``).
+
+    apps : set
+        ``(from, to)`` of the apparatus created.
+
+    duplicates : list
+        identifiers of the anchors created twice.
+
+    duplicate_apps : list
+        apparatus ``(from, to)`` created twice.
+    """
+    def __init__(self):
+        self.anchors = {}
+        self.references = {}
+        self.apps = set()
+        self.duplicates = []
+        self.duplicate_apps = []
+
+    def anchor(self, xml_id):
+        """Add an anchor of the main text."""
+        if xml_id in self.anchors:
+            self.duplicates.append(xml_id)
+        self.anchors[xml_id] = None
+
+    def app(self, begin, end):
+        """Add an apparatus which goes from the anchor ``begin`` to the
+        anchor ``end`` (identifiers without ``#``)."""
+        if (begin, end) in self.apps:
+            self.duplicate_apps.append((begin, end))
+        self.apps.add((begin, end))
+        self.references[begin] = None
+        self.references[end] = None
+
+    def orphans(self):
+        """Return the anchors without apparatus."""
+        return [xml_id for xml_id in self.anchors
+                if xml_id not in self.references]
+
+    def missing(self):
+        """Return the identifiers referenced by the apparatus without
+        anchor."""
+        return [xml_id for xml_id in self.references
+                if xml_id not in self.anchors]
+
+    def problems(self):
+        """Return the description of the inconsistencies (list of str)."""
+        problems = []
+        for message, ids in (('Anchors without apparatus', self.orphans()),
+                             ('Apparatus referencing missing anchors',
+                              self.missing()),
+                             ('Anchors created twice', self.duplicates),
+                             ('Apparatus created twice',
+                              ['{}-{}'.format(*app)
+                               for app in self.duplicate_apps])):
+            if ids:
+                problems.append('{}: {}'.format(message, ', '.join(ids)))
+        return problems
+
+    @property
+    def consistent(self):
+        """True if each anchor has its apparatus and inversely."""
+        return not (self.duplicates or self.duplicate_apps or
+                    self.orphans() or self.missing())
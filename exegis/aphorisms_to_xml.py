@@ -22,7 +22,7 @@ If processing succeeds two XML files will be created in a folder called XML.
 The XML file names start with the text file base name and end in _main.xml (for
 the XML files will be file_1_main.xml and file_1_app.xml.
 
-If processing fails error messages will be saved in the exegis.log file.
+If processing fails error messages will be saved in the log file.
 
 The commentaries should be utf-8 text files with the format as documented
 in the associated documentation (docs/_build/index.html).
@@ -34,20 +34,25 @@ in the associated documentation (docs/_build/index.html).
 # pylint: disable=locally-disabled, invalid-name
 import os
 import re
-from lxml import etree
+import threading
+from collections import Counter
 
 try:
     from .analysis import references, footnotes, AnalysisException
-    from .introduction import Introduction
+    from .introduction import Introduction, IntroductionException
     from .title import Title, TitleException
     from .footnotes import Footnotes, FootnotesException
+    from .anchors import Anchors
     from .baseclass import Exegis, logger, TEMPLATE_FNAME, RELAXNG_FNAME
+    from .timings import Timings
 except ImportError:
     from analysis import references, footnotes, AnalysisException
     from introduction import Introduction, IntroductionException
     from title import Title, TitleException
     from footnotes import Footnotes, FootnotesException
+    from anchors import Anchors
     from baseclass import Exegis, logger, TEMPLATE_FNAME, RELAXNG_FNAME
+    from timings import Timings
 
 
 # Define an Exception
@@ -57,6 +62,106 @@ class AphorismsToXMLException(Exception):
     pass
 
 
+# Line with the number of an aphorism (e.g. ``12.``) with the empty lines
+# before it. The match starts at the end of the previous non empty line,
+# otherwise it would be tried from each line of a long run of empty lines
+# (quadratic time).
+APHORISM_NUMBER = r'(?:^|(?<=\S))[^\S\n]*\n\s*{}\.?\n'
+
+
+# Compiled Relaxng schemas. A validator cannot be used by two threads at
+# the same time, each thread has its own cache.
+_relaxng_cache = threading.local()
+
+
+def relaxng_validator(relaxng_fname, reload=False):
+    """Function which compile a Relaxng file or get it from the cache.
+
+    Parameters
+    ----------
+    relaxng_fname : str
+        name of the Relaxng file. The Relaxng file provided with the
+        software is used if it cannot be read.
+
+    reload : bool, optional
+        if True the file is compiled again (it changed). Default: False
+
+    Returns
+    -------
+    relaxng : lxml.etree.RelaxNG
+        the compiled schema.
+
+    relaxng_fname : str
+        name of the Relaxng file really used.
+    """
+    from lxml import etree
+
+    cache = getattr(_relaxng_cache, 'validators', None)
+    if cache is None:
+        cache = _relaxng_cache.validators = {}
+
+    if reload or relaxng_fname not in cache:
+        try:
+            relaxng_doc = etree.parse(relaxng_fname)
+            fname = relaxng_fname
+        except (OSError, ValueError, TypeError):
+            relaxng_doc = etree.parse(RELAXNG_FNAME)
+            fname = RELAXNG_FNAME
+        cache[relaxng_fname] = (etree.RelaxNG(relaxng_doc), fname)
+        # The file used is in cache too (it is the name returned)
+        if reload:
+            cache[fname] = cache[relaxng_fname]
+        else:
+            cache.setdefault(fname, cache[relaxng_fname])
+
+    return cache[relaxng_fname]
+
+
+def validate_xml(xml, relaxng_fname, name=''):
+    """Function to validate an XML document with a Relaxng file.
+
+    Parameters
+    ----------
+    xml : str
+        XML document.
+
+    relaxng_fname : str
+        name of the Relaxng file (see :func:`relaxng_validator`).
+
+    name : str, optional
+        name of the document used in the messages.
+
+    Returns
+    -------
+    str
+        name of the Relaxng file used.
+
+    Raises
+    ------
+    AphorismsToXMLException
+        if the document is not valid.
+    """
+    from lxml import etree
+
+    relaxng, relaxng_fname = relaxng_validator(relaxng_fname)
+    doc = etree.fromstring(xml.encode('utf-8'))
+
+    try:
+        relaxng.assertValid(doc)
+        logger.info('The document {} created is '
+                    'valid corresponding '
+                    'to the Relaxng declared '
+                    'or used'.format(name))
+    except etree.DocumentInvalid:
+        logger.error('The document {} created is '
+                     'not valid corresponding '
+                     'to the Relaxng declared '
+                     'or used'.format(name))
+        raise AphorismsToXMLException
+
+    return relaxng_fname
+
+
 class Process(Exegis):
     """Class to main hypocratic aphorism text to produce a TEI XML file.
 
@@ -75,6 +180,13 @@ class Process(Exegis):
     doc_num : int, optional
         version of the document treated.
         Default value: 1
+
+    anchors : exegis.anchors.Anchors
+        anchors and apparatus created by the conversion.
+
+    consistent : bool
+        True if each anchor of the main text has its apparatus and
+        inversely (see :meth:`convert`).
     """
     def __init__(self,
                  fname=None,
@@ -95,6 +207,11 @@ class Process(Exegis):
             self.base_name = None
 
         self.footnotes_app = None
+        self.anchors = Anchors()
+        self.consistent = True
+
+        # Time spent in each phase of the conversion
+        self.timings = Timings()
 
         # Initialise footnote number
         self._next_footnote = 1
@@ -124,7 +241,7 @@ class Process(Exegis):
         # Set XML file name
         self.xml_file = os.path.join('XML', self.base_name + '.xml')
 
-    def open_document(self, fname=None):
+    def open_document(self, fname=None, text=None):
         """Method to open and read the exegis document.
 
         Parameters
@@ -132,6 +249,10 @@ class Process(Exegis):
         fname : str, optional
             name of the file to analyse.
 
+        text : str, optional
+            content of the file if it has already been read (the file is
+            not opened).
+
         Attributes
         ----------
         folder : str, optional
@@ -172,7 +293,7 @@ class Process(Exegis):
             raise AphorismsToXMLException
 
         full_path = os.path.join(self.folder, self.fname)
-        if os.path.isdir(full_path):
+        if text is None and os.path.isdir(full_path):
             logger.info('The software does not treat subfolder.')
             raise AphorismsToXMLException
 
@@ -184,9 +305,12 @@ class Process(Exegis):
             if sep == '':
                 raise AphorismsToXMLException
         except ValueError:
-            info = ('File name {} does not provide version information. '
-                    'Use version 1 by default'.format(self.fname))
-            logger.info(info)
+            logger.info('File name %s does not provide version information. '
+                        'Use version 1 by default', self.fname)
+
+        if text is not None:
+            self._text = text.strip()
+            return
 
         # Open the file to process
         # pylint: disable=locally-disabled, invalid-name
@@ -195,13 +319,11 @@ class Process(Exegis):
                 # Read in file
                 self._text = f.read().strip()
         except UnicodeDecodeError:
-            info = ('File {} is not treatable by the software'.format(
-                self.fname))
-            logger.info(info)
+            logger.info('File %s is not treatable by the software',
+                        self.fname)
             raise AphorismsToXMLException
         except FileNotFoundError:
-            info = ('File {} does not exist'.format(self.fname))
-            logger.info(info)
+            logger.info('File %s does not exist', self.fname)
             raise AphorismsToXMLException
 
     def divide_document(self):
@@ -271,7 +393,7 @@ class Process(Exegis):
             raise AphorismsToXMLException(e)
 
         try:
-            p = re.compile(r'\n\s{0,}1\.?\n')
+            p = re.compile(APHORISM_NUMBER.format('1'))
             if self._title == '':
                 _tmp = p.split(self._text)
                 self._title = _tmp[0]
@@ -297,7 +419,8 @@ class Process(Exegis):
         AphorismsToXMLException
             if it is not possible to create the dictionary.
         """
-        aphorism = re.split(r'\n\s{0,}[0-9]+\.?\n', '\n' + self._text)[1:]
+        p = re.compile(APHORISM_NUMBER.format('[0-9]+'))
+        aphorism = p.split('\n' + self._text)[1:]
 
         # Split the text in function of the numbers (i.e. the separation
         # of the aphorism.
@@ -305,16 +428,17 @@ class Process(Exegis):
         #    which start with end of line or any space character
         #    with at least on number ending
         #    with a point and a end of line.
-        p = re.compile(r'\n\s{0,}?[0-9]+\.?\n')
         error = ''
         try:
             n_aphorism = [int(i.group().strip('.\t\n '))
                           for i in p.finditer('\n' + self._text)]
             # Find missing aphorism or badly written (e.g.: 14-)
-            missing = [i for i in list(range(1, max(n_aphorism)))
-                       if i not in n_aphorism]
+            numbers = set(n_aphorism)
+            missing = [i for i in range(1, max(n_aphorism))
+                       if i not in numbers]
             # Find if multiple aphorism with the same number.
-            doublon = list({i for i in n_aphorism if n_aphorism.count(i) > 1})
+            doublon = list({i for i, count in Counter(n_aphorism).items()
+                            if count > 1})
             if not n_aphorism:
                 error = 'There are no aphorisms detected'
                 logger.error(error)
@@ -379,14 +503,13 @@ class Process(Exegis):
         try:
             with open(self.template_fname, 'r', encoding="utf-8") as f:
                 self.template = f.read()
-                info = 'Template file {} found.'.format(self.template_fname)
-                logger.info(info)
+                logger.info('Template file %s found.', self.template_fname)
         except FileNotFoundError:
-            error = 'Template file {} not found.'.format(self.template_fname)
-            logger.error(error)
+            logger.error('Template file %s not found.', self.template_fname)
             raise AphorismsToXMLException
 
         if self.relaxng_fname is None:
+            from lxml import etree
             tree = etree.parse(self.template_fname)
             root = tree.getroot()
             model = root.xpath("/processing-instruction('xml-model')")[0]
@@ -407,9 +530,8 @@ class Process(Exegis):
             wits = set(self.wits)
             wits = list(wits)
             wits.sort()
-            info = 'Witnesses found in the aphorisms and ' \
-                   'commentaries {}'.format(wits)
-            logger.info(info)
+            logger.info('Witnesses found in the aphorisms and '
+                        'commentaries %s', wits)
             _wits = []
             for w in wits:
                 _wits.append(self.xml_oss * self.xml_n_offset +
@@ -424,35 +546,15 @@ class Process(Exegis):
         self.xml = xml
 
     def _validate_xml(self):
+        """Method to validate the XML created with the Relaxng file.
 
-        try:
-            relaxng_doc = etree.parse(self.relaxng_fname)
-        except OSError:
-            relaxng_doc = etree.parse(RELAXNG_FNAME)
-            self.relaxng_fname = RELAXNG_FNAME
-
-        relaxng = etree.RelaxNG(relaxng_doc)
-        xml = etree.parse(self.xml_file)
-        # relaxng.validate(xml)
-        # if not relaxng(xml):
-        #     logger.error("INVALID")
-        # else:
-        #     logger.error(self.xml_file)
-        #     logger.error("VALID")
-
-        try:
-            relaxng.assertValid(xml)
-            logger.info('The document {} created is '
-                        'valid corresponding '
-                        'to the Relaxng declared '
-                        'or used'.format(self.xml_file))
-
-        except etree.DocumentInvalid:
-            logger.error('The document {} created is '
-                         'not valid corresponding '
-                         'to the Relaxng declared '
-                         'or used'.format(self.xml_file))
-            raise AphorismsToXMLException
+        Raises
+        ------
+        AphorismsToXMLException
+            if the XML is not valid.
+        """
+        self.relaxng_fname = validate_xml(self.xml, self.relaxng_fname,
+                                          self.xml_file)
 
     def treat_footnotes(self):
         """Method to treat Footnote.
@@ -472,7 +574,7 @@ class Process(Exegis):
             logger.info('Footnotes treated')
 
             # Create XML app
-            self.footnotes_app.xml_app()
+            self.footnotes_app.xml_app(self.anchors)
             self.app = self.footnotes_app.xml
             self.wits = self.footnotes_app.wits
             logger.info('Footnotes app file created')
@@ -490,8 +592,6 @@ class Process(Exegis):
         For example for file_1.txt the XML files will be file_1_main.xml and
         file_1_app.xml.
 
-        Modify the attribute ``xml`` to add the title section in the main XML
-
         Raises
         ------
         AphorismsToXMLException
@@ -500,30 +600,63 @@ class Process(Exegis):
         """
 
         # Open and read the exegis document
-        self.open_document()
+        with self.timings.phase('open_document'):
+            self.open_document()
+
+        logger.debug('Open document %s', self.fname)
+
+        self.convert()
+
+        # Save the xmls created
+        with self.timings.phase('save_xml'):
+            self.save_xml(self.xml_file)
+        with self.timings.phase('validate'):
+            self._validate_xml()
+        logger.debug('Save main xml')
+
+    def convert(self):
+        """Method to convert the text read by :meth:`open_document` in XML.
+
+        Nothing is written on the disk, :meth:`save_xml` and
+        :meth:`_validate_xml` have to be called after.
 
-        debug = 'Open document {}'.format(self.fname)
-        logger.debug(debug)
+        Modify the attribute ``xml`` which contains the whole XML document
+        (string). The time spent in each phase and the size of the document
+        are recorded in the attribute ``timings``. The attribute
+        ``consistent`` is False if anchors of the main text and apparatus do
+        not correspond (the errors are logged).
+
+        Raises
+        ------
+        AphorismsToXMLException
+            if the processing of the text does not work as expected.
+        """
+        self.timings.counts['characters'] = len(self._text)
 
         # Divide the document in the different part (intro, title,
         # text, footnotes)
 
         try:
-            self.divide_document()
+            with self.timings.phase('divide_document'):
+                self.divide_document()
             logger.info('Division of the document ok.')
         except AphorismsToXMLException:
             logger.error('Division of the document failed.')
             raise AphorismsToXMLException
 
-        self.treat_footnotes()
+        with self.timings.phase('treat_footnotes'):
+            self.treat_footnotes()
 
-        self.aphorisms_dict()
+        with self.timings.phase('aphorisms_dict'):
+            self.aphorisms_dict()
         logger.info('Created aphorisms dictionary')
 
         if self._introduction != '':
             try:
-                intro = Introduction(self._introduction, self._next_footnote)
-                intro.xml_main()
+                with self.timings.phase('introduction'):
+                    intro = Introduction(self._introduction,
+                                         self._next_footnote, self.anchors)
+                    intro.xml_main()
                 self._next_footnote = intro.next_footnote
                 self.xml += intro.xml
                 logger.debug('Introduction treated')
@@ -535,14 +668,16 @@ class Process(Exegis):
         # and the title
         # =======================================================
 
-        try:
-            title = Title(self._title, self._next_footnote, self.doc_num)
-        except TitleException:
-            raise AphorismsToXMLException from None
-        logger.debug('Title treated')
+        with self.timings.phase('title'):
+            try:
+                title = Title(self._title, self._next_footnote, self.doc_num,
+                              self.anchors)
+            except TitleException:
+                raise AphorismsToXMLException from None
+            logger.debug('Title treated')
 
-        title.xml_main()
-        logger.debug('Title xml created')
+            title.xml_main()
+            logger.debug('Title xml created')
 
         self._next_footnote = title.next_footnote
 
@@ -551,6 +686,37 @@ class Process(Exegis):
 
         # Now process the rest of the main text
         # =====================================
+        with self.timings.phase('body'):
+            self._aphorisms_xml()
+
+        with self.timings.phase('create_xml'):
+            self._create_xml()
+
+        # The Relaxng validation does not check the references of the
+        # apparatus
+        with self.timings.phase('anchors'):
+            problems = self.anchors.problems()
+        self.consistent = not problems
+        for problem in problems:
+            logger.error('Footnotes not consistent with the apparatus: %s',
+                         problem)
+
+        self.timings.counts.update(
+            units=len(self._aph_com),
+            footnotes=(len(self.footnotes_app.footnotes)
+                       if self.footnotes_app is not None else 0),
+            footnote_kinds=(dict(self.footnotes_app.kinds)
+                            if self.footnotes_app is not None else {}),
+            witnesses=len(set(self.wits)))
+
+    def _aphorisms_xml(self):
+        """Method to create the XML of the aphorisms and commentaries.
+
+        Raises
+        ------
+        AphorismsToXMLException
+            if an aphorism or a commentary cannot be treated.
+        """
         logger.debug('Start aphorisms and commentaries treatment')
         for k in self._aph_com:
             if not len(self._aph_com[k]):
@@ -578,9 +744,7 @@ class Process(Exegis):
             try:
                 line_ref = references(aphorism)
             except AnalysisException:
-                error = ('Unable to process references in '
-                         'aphorism {}'.format(k))
-                logger.error(error)
+                logger.error('Unable to process references in aphorism %s', k)
                 raise AphorismsToXMLException from None
 
             if line_ref is None or line_ref == '':
@@ -591,12 +755,10 @@ class Process(Exegis):
             try:
                 self.xml_n_offset += 3
                 xml_main_to_add, self._next_footnote = \
-                    footnotes(line_ref, self._next_footnote)
+                    footnotes(line_ref, self._next_footnote, self.anchors)
                 self.xml_n_offset -= 3
             except (TypeError, AnalysisException):
-                error = ('Unable to process footnotes in '
-                         'aphorism {}'.format(k))
-                logger.error(error)
+                logger.error('Unable to process footnotes in aphorism %s', k)
                 raise AphorismsToXMLException from None
 
             # Add the XML
@@ -614,10 +776,9 @@ class Process(Exegis):
 
                 if line[-1] != '.':
 
-                    debug = ('Commentaries should ended with a `.`\n'
-                             'Warning in aphorism {}\n'
-                             'commentary {}'.format(k, line))
-                    logger.debug(debug)
+                    logger.debug('Commentaries should ended with a `.`\n'
+                                 'Warning in aphorism %s\n'
+                                 'commentary %s', k, line)
 
                 # Add initial XML for this aphorism's commentary
                 self.xml.append(self.xml_oss * self.xml_n_offset +
@@ -629,10 +790,8 @@ class Process(Exegis):
                 try:
                     line_ref = references(line)
                 except AnalysisException:
-                    error = ('Unable to process references, '
-                             'commentary {} for aphorism '
-                             '{}'.format(n_com+1, k))
-                    logger.error(error)
+                    logger.error('Unable to process references, '
+                                 'commentary %d for aphorism %s', n_com+1, k)
                     raise AphorismsToXMLException from None
 
                 # Process any _footnotes in line_ref. If this fails with a
@@ -640,13 +799,12 @@ class Process(Exegis):
                 try:
                     self.xml_n_offset += 3
                     xml_main_to_add, self._next_footnote = \
-                        footnotes(line_ref, self._next_footnote)
+                        footnotes(line_ref, self._next_footnote,
+                                  self.anchors)
                     self.xml_n_offset -= 3
                 except (TypeError, AnalysisException):
-                    error = ('Unable to process footnote, '
-                             'commentary {} for aphorism '
-                             '{}'.format(n_com+1, k))
-                    logger.error(error)
+                    logger.error('Unable to process footnote, '
+                                 'commentary %d for aphorism %s', n_com+1, k)
                     raise AphorismsToXMLException from None
 
                 # Add the XML
@@ -662,9 +820,3 @@ class Process(Exegis):
             self.xml.append(self.xml_oss * self.xml_n_offset + '</div>')
 
         logger.debug('Finish aphorisms and commentaries treatment')
-        # Save the xmls created
-
-        self._create_xml()
-        self.save_xml(self.xml_file)
-        self._validate_xml()
-        logger.debug('Save main xml')
@@ -0,0 +1,466 @@
+"""Module which contains the functions used to convert exegis texts in XML
+from a program (library interface).
+
+The conversion is done in memory: nothing is read or written on the disk
+but the template and the Relaxng schema, which are read once and kept in
+cache. The functions can be called by several threads at the same time::
+
+    import exegis
+
+    result = exegis.convert(text)
+    if result.ok:
+        send(result.xml)
+    else:
+        print(result.errors)
+
+The messages logged during a conversion (errors and warnings of the
+document) are returned with the result, they are collected separately for
+each thread.
+
+Several texts are converted with :func:`convert_many`, which shares the
+template and the compiled schema between the conversions::
+
+    for result in exegis.convert_many(texts, jobs=4, ordered=False):
+        save(result.name, result.xml)
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from .aphorisms_to_xml import (Process, AphorismsToXMLException,
+                                   validate_xml, relaxng_validator)
+    from .analysis import AnalysisException
+    from .footnotes import FootnotesException
+    from .introduction import IntroductionException
+    from .title import TitleException
+    from .baseclass import logger, TEMPLATE_FNAME
+    from .pool import WorkerPool, PoolException
+    from .fragments import validate_fragments, FragmentsException
+except ImportError:
+    from aphorisms_to_xml import (Process, AphorismsToXMLException,
+                                  validate_xml, relaxng_validator)
+    from analysis import AnalysisException
+    from footnotes import FootnotesException
+    from introduction import IntroductionException
+    from title import TitleException
+    from baseclass import logger, TEMPLATE_FNAME
+    from pool import WorkerPool, PoolException
+    from fragments import validate_fragments, FragmentsException
+
+# Exceptions raised when a document cannot be converted
+DOCUMENT_EXCEPTIONS = (AphorismsToXMLException, AnalysisException,
+                       FootnotesException, IntroductionException,
+                       TitleException)
+
+
+# Templates already read: name of the file -> (text, name of the Relaxng
+# file declared)
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_template(fname=None, reload=False):
+    """Return the text of a template and the name of the Relaxng file it
+    declares. The file is read only once.
+
+    Parameters
+    ----------
+    fname : str, optional
+        name of the template. Default: the template provided with the
+        software.
+
+    reload : bool, optional
+        if True the file is read again (it changed). Default: False
+
+    Raises
+    ------
+    AphorismsToXMLException
+        if the template cannot be read.
+    """
+    fname = fname or TEMPLATE_FNAME
+    with _templates_lock:
+        if reload or fname not in _templates:
+            comtoepi = Process()
+            comtoepi.template_fname = fname
+            comtoepi.read_template()
+            _templates[fname] = (comtoepi.template, comtoepi.relaxng_fname)
+        return _templates[fname]
+
+
+class _Diagnostics(logging.Handler):
+    """Handler which keeps the records logged by a thread while it collects
+    them (see :meth:`collect`)."""
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self._local = threading.local()
+
+    def emit(self, record):
+        records = getattr(self._local, 'records', None)
+        if records is not None:
+            records.append((record.levelname, record.getMessage()))
+
+    @contextmanager
+    def collect(self):
+        """Collect the records of the thread, yield the list where they
+        are added."""
+        previous = getattr(self._local, 'records', None)
+        records = self._local.records = []
+        try:
+            yield records
+        finally:
+            self._local.records = previous
+
+
+_diagnostics = None
+_diagnostics_lock = threading.Lock()
+
+
+def _collect():
+    """Return the context manager which collects the records of the
+    thread (the handler is added to the logger the first time)."""
+    global _diagnostics
+    with _diagnostics_lock:
+        if _diagnostics is None:
+            _diagnostics = _Diagnostics()
+            logger.addHandler(_diagnostics)
+    return _diagnostics.collect()
+
+
+class Result(object):
+    """Class which contains the result of a conversion.
+
+    Attributes
+    ----------
+    xml : bytes
+        XML document (utf-8), None if the conversion failed.
+
+    valid : bool
+        True if the document is valid, False if not, None if the validation
+        was not done.
+
+    diagnostics : list
+        ``(level, message)`` of the messages logged during the conversion
+        (``WARNING`` and above unless the logging is configured with a lower
+        level).
+
+    timings : dict
+        time spent in each phase and size of the document (see
+        :meth:`exegis.timings.Timings.record`).
+
+    relaxng_fname : str
+        name of the Relaxng file used for the validation.
+
+    name : str
+        name of the document (see :func:`convert_many`), None if not given.
+    """
+    def __init__(self, xml=None, valid=None, diagnostics=None, timings=None,
+                 relaxng_fname=None, name=None):
+        self.name = name
+        self.xml = xml
+        self.valid = valid
+        self.diagnostics = diagnostics or []
+        self.timings = timings or {}
+        self.relaxng_fname = relaxng_fname
+
+    @property
+    def ok(self):
+        """True if the conversion succeeded and the document is not
+        invalid."""
+        return self.xml is not None and self.valid is not False
+
+    @property
+    def errors(self):
+        """Messages of level ``ERROR`` and above."""
+        return [message for level, message in self.diagnostics
+                if level in ('ERROR', 'CRITICAL')]
+
+    def to_dict(self):
+        """Return the result as a dictionary which can be saved in JSON
+        (the XML is a string)."""
+        return {'name': self.name, 'ok': self.ok, 'valid': self.valid,
+                'xml': (self.xml.decode('utf-8')
+                        if self.xml is not None else None),
+                'diagnostics': [list(d) for d in self.diagnostics],
+                'timings': self.timings,
+                'relaxng_fname': self.relaxng_fname}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a result from a dictionary (see :meth:`to_dict`)."""
+        xml = data.get('xml')
+        return cls(xml=xml.encode('utf-8') if xml is not None else None,
+                   valid=data.get('valid'),
+                   diagnostics=[tuple(d) for d in
+                                data.get('diagnostics') or []],
+                   timings=data.get('timings'),
+                   relaxng_fname=data.get('relaxng_fname'),
+                   name=data.get('name'))
+
+    def __repr__(self):
+        return '<Result {}ok={} valid={} errors={}>'.format(
+            '{} '.format(self.name) if self.name else '', self.ok,
+            self.valid, len(self.errors))
+
+
+def doc_number(name):
+    """Return the number of a document from its name: the number after the
+    last ``_`` of the base name (``file_2.txt`` is the document 2), 1 if
+    there is none."""
+    base_name = os.path.splitext(os.path.basename(name or ''))[0]
+    try:
+        return int(base_name.rpartition('_')[2])
+    except ValueError:
+        return 1
+
+
+class Context(object):
+    """Class which contains what the conversions share: the template, the
+    Relaxng file and the compiled schema.
+
+    Attributes
+    ----------
+    template : str
+        text of the XML template.
+
+    relaxng_fname : str
+        name of the Relaxng file.
+
+    validate : bool
+        if True the documents are validated.
+
+    fragments : exegis.fragments.FragmentCache, optional
+        if given only the fragments of the documents which are not in the
+        cache are validated (see :mod:`exegis.fragments`).
+
+    Raises
+    ------
+    AphorismsToXMLException
+        if the template cannot be read.
+    """
+    def __init__(self, template=None, validate=True, relaxng=None,
+                 fragments=None):
+        self.template, self.relaxng_fname = load_template(template)
+        if relaxng:
+            self.relaxng_fname = relaxng
+        self.validate = validate
+        self.fragments = fragments
+
+    def warm(self):
+        """Compile the Relaxng schema for the current thread (and the worker
+        processes forked after)."""
+        if self.validate:
+            relaxng_validator(self.relaxng_fname)
+
+    def parse(self, text, doc_num=1, name=None):
+        """Convert a text without validating the XML.
+
+        Returns
+        -------
+        Result
+            the result of the conversion (``valid`` is None, False if the
+            anchors of the main text and the apparatus do not correspond).
+        """
+        result = Result(name=name, relaxng_fname=self.relaxng_fname)
+        with _collect() as diagnostics:
+            comtoepi = Process(doc_num=doc_num)
+            comtoepi.template = self.template
+            comtoepi.relaxng_fname = self.relaxng_fname
+            try:
+                comtoepi._text = text.strip()
+                comtoepi.convert()
+                result.xml = comtoepi.xml.encode('utf-8')
+                if not comtoepi.consistent:
+                    result.valid = False
+            except DOCUMENT_EXCEPTIONS:
+                logger.error('Conversion of the document %s failed',
+                             name or doc_num)
+            result.timings = comtoepi.timings.record()
+        result.diagnostics = diagnostics
+        return result
+
+    def check(self, result, full=False):
+        """Validate the XML of a result (if the context validates the
+        documents), the result is modified and returned. A result already
+        not valid (see :meth:`parse`) is not validated again.
+
+        With a cache of fragments only the fragments which changed are
+        validated, unless ``full`` is True.
+        """
+        from lxml import etree
+        if not self.validate or result.xml is None or result.valid is False:
+            return result
+        with _collect() as diagnostics:
+            start = time.perf_counter()
+            try:
+                if self.fragments is not None and not full:
+                    validate_fragments(result.xml.decode('utf-8'),
+                                       result.relaxng_fname, self.fragments,
+                                       str(result.name or ''))
+                else:
+                    result.relaxng_fname = validate_xml(
+                        result.xml.decode('utf-8'), result.relaxng_fname,
+                        str(result.name or ''))
+                result.valid = True
+            except (AphorismsToXMLException, FragmentsException):
+                result.valid = False
+            except etree.XMLSyntaxError as e:
+                logger.error('XML of %s not well formed: %s',
+                             result.name or 'the document', e)
+                result.valid = False
+            result.timings.setdefault('phases', {})['validate'] = \
+                time.perf_counter() - start
+        result.diagnostics += diagnostics
+        return result
+
+    def convert(self, text, doc_num=1, name=None):
+        """Convert a text and validate the XML (see :func:`convert`)."""
+        return self.check(self.parse(text, doc_num, name))
+
+
+def convert(text, doc_num=1, template=None, validate=True, relaxng=None):
+    """Convert an exegis text in XML.
+
+    Nothing is written on the disk. The template is read only once, the
+    compiled Relaxng schema is kept in cache by each thread (the compilation
+    takes several seconds).
+
+    Parameters
+    ----------
+    text : str
+        content of the exegis document.
+
+    doc_num : int, optional
+        number of the document (``n`` of the title section). Default: 1
+
+    template : str, optional
+        name of the XML template. Default: the template provided with the
+        software.
+
+    validate : bool, optional
+        if True the document is validated with the Relaxng schema.
+        Default: True
+
+    relaxng : str, optional
+        name of the Relaxng file. Default: the one declared in the template.
+
+    Returns
+    -------
+    Result
+        the XML and the diagnostics. A document which cannot be converted
+        gives a result without XML, it does not raise an exception.
+    """
+    try:
+        context = Context(template, validate, relaxng)
+    except AphorismsToXMLException:
+        return Result(diagnostics=[('ERROR', 'Template {} cannot be '
+                                             'read'.format(template))])
+    return context.convert(text, doc_num)
+
+
+def _convert_task(context, name, text):
+    """Conversion done in a worker process."""
+    return context.convert(text, doc_number(name), name)
+
+
+def convert_many(inputs, jobs=1, ordered=True, template=None, validate=True,
+                 relaxng=None, cancel=None):
+    """Convert several exegis texts in XML.
+
+    The template is read and the Relaxng schema compiled once, before the
+    conversions. With several jobs the texts are converted in a pool of
+    worker processes (:class:`~exegis.pool.WorkerPool`) which inherit the
+    compiled schema when the processes are forked (the default on Unix).
+    Only a few texts are read in advance from ``inputs``.
+
+    The conversions are cancelled when the generator is closed
+    (``results.close()``) or when the event ``cancel`` is set: the texts not
+    yet converted are not, the results not yet returned are lost.
+
+    Parameters
+    ----------
+    inputs : iterable
+        ``(name, text)`` of the documents. The number of the document is
+        taken from its name (see :func:`doc_number`).
+
+    jobs : int, optional
+        number of conversions done at the same time. Default: 1
+
+    ordered : bool, optional
+        if True the results are returned in the order of the inputs,
+        otherwise as soon as they are ready. Default: True
+
+    template, validate, relaxng : optional
+        see :func:`convert`.
+
+    cancel : threading.Event, optional
+        event set (by another thread) to cancel the conversions.
+
+    Yields
+    ------
+    Result
+        the result of each document (with its name).
+
+    Raises
+    ------
+    AphorismsToXMLException
+        if the template cannot be read.
+    """
+    context = Context(template, validate, relaxng)
+    context.warm()
+
+    if jobs <= 1:
+        for name, text in inputs:
+            if cancel is not None and cancel.is_set():
+                return
+            yield context.convert(text, doc_number(name), name)
+        return
+
+    pool = WorkerPool(jobs)
+    threads = ThreadPoolExecutor(jobs)
+
+    def task(name, text):
+        try:
+            return pool.run(_convert_task, context, name, text)
+        except PoolException as e:
+            return Result(name=name, diagnostics=[('ERROR', str(e))])
+
+    inputs = iter(inputs)
+    pending = deque()
+
+    def submit():
+        while len(pending) < 2 * jobs and \
+                (cancel is None or not cancel.is_set()):
+            try:
+                name, text = next(inputs)
+            except StopIteration:
+                return
+            pending.append(threads.submit(task, name, text))
+
+    try:
+        submit()
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+            yield future.result()
+            if cancel is not None and cancel.is_set():
+                return
+            submit()
+    finally:
+        for future in pending:
+            future.cancel()
+        threads.shutdown(wait=True)
+        pool.close()
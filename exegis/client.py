@@ -0,0 +1,255 @@
+"""Module which contains the client of the conversion server (see
+:mod:`exegis.server`).
+
+The client keeps its connection to the server open, a conversion costs a
+request and not the start of the software::
+
+    from exegis.client import Client
+
+    client = Client('unix:/run/user/1000/exegis.sock')
+    result = client.convert(text)
+    for result in client.convert_many(documents):
+        ...
+
+The results are :class:`exegis.api.Result`, as with the library interface.
+The address of the server is ``http://host:port`` or ``unix:path``, by
+default the value of the environment variable ``EXEGIS_SERVER`` or
+``http://127.0.0.1:8642``.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import json
+import socket
+from itertools import islice
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlencode, urlsplit
+
+try:
+    from .api import Result
+except ImportError:
+    from api import Result
+
+# Address used by default
+ADDRESS = 'http://127.0.0.1:8642'
+
+
+# Define an Exception
+class ClientException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    """HTTP connection over a Unix socket."""
+    def __init__(self, socket_fname, timeout=None):
+        HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_fname = socket_fname
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_fname)
+
+
+def connection(address=None, timeout=None):
+    """Return the HTTP connection to a server.
+
+    Parameters
+    ----------
+    address : str, optional
+        ``http://host:port``, ``host:port`` or ``unix:path``. Default: the
+        environment variable ``EXEGIS_SERVER`` or ``http://127.0.0.1:8642``.
+
+    timeout : float, optional
+        timeout of the connection (seconds).
+
+    Raises
+    ------
+    ClientException
+        if the address is not valid.
+    """
+    address = address or os.environ.get('EXEGIS_SERVER') or ADDRESS
+    if address.startswith('unix:'):
+        return _UnixHTTPConnection(address[len('unix:'):], timeout)
+    if '://' not in address:
+        address = 'http://' + address
+    url = urlsplit(address)
+    try:
+        port = url.port
+    except ValueError:
+        port = None
+    if url.scheme != 'http' or not url.hostname or port is None:
+        raise ClientException('Address not valid: {}'.format(address))
+    return HTTPConnection(url.hostname, port, timeout=timeout)
+
+
+class Client(object):
+    """Class which sends the documents to a conversion server.
+
+    Attributes
+    ----------
+    address : str, optional
+        address of the server (see :func:`connection`).
+
+    timeout : float, optional
+        timeout of the connection (seconds).
+
+    Raises
+    ------
+    ClientException
+        if the address is not valid.
+    """
+    def __init__(self, address=None, timeout=None):
+        self.address = address
+        self.timeout = timeout
+        self._connection = connection(address, timeout)
+
+    def _request(self, method, path, body=None, params=None):
+        """Send a request, return the response (status 200).
+
+        Raises
+        ------
+        ClientException
+            if the server cannot be reached or answers with an error.
+        """
+        if params:
+            path += '?' + urlencode(params)
+        headers = {'Content-Length': str(len(body or b''))}
+        # The server can close a connection kept open: try again once
+        for attempt in (1, 2):
+            try:
+                self._connection.request(method, path, body, headers)
+                response = self._connection.getresponse()
+                break
+            except (OSError, HTTPException) as e:
+                self._connection.close()
+                if attempt == 2 or isinstance(e, ConnectionRefusedError):
+                    raise ClientException('Unable to reach the server '
+                                          '{}: {}'.format(self.address or
+                                                          ADDRESS, e))
+        if response.status != 200:
+            data = response.read()
+            try:
+                error = json.loads(data.decode('utf-8'))['error']
+            except (ValueError, KeyError, TypeError):
+                error = data.decode('utf-8', 'replace')
+            raise ClientException('Error {} of the server: {}'.format(
+                response.status, error))
+        return response
+
+    def _json(self, method, path, body=None, params=None):
+        response = self._request(method, path, body, params)
+        return json.loads(response.read().decode('utf-8'))
+
+    def convert(self, text, doc_num=None, name=None, validate=True):
+        """Convert a text (see :func:`exegis.api.convert`).
+
+        Parameters
+        ----------
+        doc_num : int, optional
+            number of the document. Default: taken from the name.
+
+        name : str, optional
+            name of the document.
+
+        Returns
+        -------
+        Result
+            the XML and the diagnostics.
+        """
+        params = {}
+        if name is not None:
+            params['name'] = name
+        if doc_num is not None:
+            params['doc_num'] = doc_num
+        if not validate:
+            params['validate'] = 0
+        return Result.from_dict(self._json('POST', '/convert',
+                                           text.encode('utf-8'), params))
+
+    def convert_many(self, documents, validate=True, ordered=True,
+                     batch=None):
+        """Convert several texts, sent by batches (one request by batch).
+
+        The documents are read from the iterable one batch at a time: the
+        memory used does not depend on the number of documents and a
+        request rejected by the server concerns only its batch.
+
+        Parameters
+        ----------
+        documents : iterable
+            ``(name, text)`` of the documents.
+
+        validate, ordered : bool, optional
+            see :func:`exegis.api.convert_many`. Without order, the results
+            are in any order inside a batch.
+
+        batch : int, optional
+            number of documents by request. Default: twice the number of
+            workers of the server.
+
+        Yields
+        ------
+        Result
+            the result of each document, as soon as the server sends it.
+        """
+        if batch is None:
+            batch = 2 * self.status()['workers']
+        params = {'validate': int(validate), 'ordered': int(ordered)}
+        documents = iter(documents)
+        while True:
+            body = ''.join(json.dumps({'name': name, 'text': text}) + '\n'
+                           for name, text in islice(documents, batch))
+            if not body:
+                return
+            response = self._request('POST', '/batch', body.encode('utf-8'),
+                                     params)
+            finished = False
+            try:
+                for line in response:
+                    if line.strip():
+                        yield Result.from_dict(
+                            json.loads(line.decode('utf-8')))
+                finished = True
+            finally:
+                if not finished:
+                    # The rest of the answer is not read
+                    self._connection.close()
+
+    def validate(self, xml, name=None):
+        """Validate an XML document (str or bytes).
+
+        Returns
+        -------
+        Result
+            ``valid`` and the diagnostics.
+        """
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+        params = {'name': name} if name is not None else None
+        return Result.from_dict(self._json('POST', '/validate', xml, params))
+
+    def status(self):
+        """Return the status of the server (dictionary)."""
+        return self._json('GET', '/status')
+
+    def reload(self):
+        """Ask the server to read the template and the Relaxng file again,
+        return its status."""
+        return self._json('POST', '/reload', b'')
+
+    def close(self):
+        """Close the connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,15 +1,17 @@
 """Module to contains the configuration of the exegis software
 
+Importing the module has no side effect: the logging is configured by
+:func:`setup_logging` (called by the command line interface), a program
+using exegis as a library keeps its own logging configuration.
+
 :Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
 
 :Copyright: IT Services, The University of Manchester
 """
 # pylint: disable=locally-disabled, invalid-name
 import os
-import sys
+import time
 import logging
-import logging.config
-import pkg_resources
 
 # Pure python dictionary with the configuration for the logging
 
@@ -43,43 +45,156 @@ LOGGING = {
 }
 
 
-# Read logging configuration and create logger
-logging.config.dictConfig(LOGGING)
 logger = logging.getLogger('exegis')
 
+
+# Listeners writing the records sent through the queues (one for the
+# threads of the process, one for the worker processes)
+_listeners = []
+_handlers = []
+_worker_queue = None
+
+
+def log_fname(folder=None):
+    """Return a log file name unique to the run.
+
+    The name contains the date, the time and the process id
+    (``exegis-20180101-120000-1234.log``): runs in parallel do not write in
+    the same file.
+
+    Parameters
+    ----------
+    folder : str, optional
+        folder of the log file (created if needed). Default: working
+        directory.
+    """
+    name = 'exegis-{}-{}.log'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                     os.getpid())
+    if not folder:
+        return name
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+
+def setup_logging(config=None, level=None, fname=None):
+    """Function to configure the logging (log file and console).
+
+    The handlers are not called by the threads which log: the records are
+    put in a queue and written by a single thread
+    (:class:`logging.handlers.QueueListener`). The worker processes send
+    their records to the same thread (see :func:`worker_queue`).
+
+    Parameters
+    ----------
+    config : dict, optional
+        logging configuration (see :mod:`logging.config`).
+        Default: :data:`LOGGING`
+
+    level : str, optional
+        level of the messages written in the log file (e.g. ``INFO``).
+        Default: the level of the configuration.
+
+    fname : str, optional
+        name of the log file. Default: the name of the configuration.
+    """
+    import copy
+    import queue
+    import logging.config
+    import logging.handlers
+    stop_logging()
+    config = copy.deepcopy(config or LOGGING)
+    if level is not None:
+        level = level.upper()
+        config['handlers']['file']['level'] = level
+        config['root']['level'] = level
+    if fname is not None:
+        config['handlers']['file']['filename'] = fname
+    logging.config.dictConfig(config)
+
+    root = logging.getLogger()
+    _handlers[:] = root.handlers
+    records = queue.Queue()
+    listener = logging.handlers.QueueListener(records, *_handlers,
+                                              respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    listener.start()
+    _listeners.append(listener)
+
+
+def worker_queue():
+    """Return the queue used by the worker processes to send their log
+    records to the process which configured the logging.
+
+    Returns
+    -------
+    multiprocessing.Queue
+        None if :func:`setup_logging` has not been called.
+    """
+    global _worker_queue
+    import logging.handlers
+    if not _handlers:
+        return None
+    if _worker_queue is None:
+        import multiprocessing
+        _worker_queue = multiprocessing.Queue()
+        listener = logging.handlers.QueueListener(_worker_queue, *_handlers,
+                                                  respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+    return _worker_queue
+
+
+def log_to_queue(records, level=logging.DEBUG):
+    """Send the log records of the process to a queue (used in the worker
+    processes, the handlers inherited from the parent are removed).
+    """
+    import logging.handlers
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level)
+
+
+def stop_logging():
+    """Write the records still in the queues and close the log file."""
+    global _worker_queue
+    import logging.handlers
+    while _listeners:
+        _listeners.pop().stop()
+    if _worker_queue is not None:
+        _worker_queue.close()
+        _worker_queue.join_thread()
+        _worker_queue = None
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    for handler in _handlers:
+        handler.close()
+    _handlers[:] = []
+
+
 # Some constants use in the creation of the XML
 XML_N_OFFSET = 3
 XML_OFFSET_SIZE = 4
 XML_OSS = ' ' * XML_OFFSET_SIZE
 
+
+def _resource(*name):
+    """Return the path of a file provided with the package."""
+    try:
+        from importlib.resources import files
+        path = files('exegis')
+        for part in name:
+            path = path.joinpath(part)
+        return str(path)
+    except ImportError:
+        # Python < 3.9 or module not used as a package
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            *name)
+
+
 # XML template information
-try:
-    TEMPLATE_FNAME = pkg_resources.resource_filename('exegis',
-                                                     os.path.join(
-                                                         'template',
-                                                         'xml_template.xml'))
-except (ModuleNotFoundError, KeyError):
-    TEMPLATE_FNAME = os.path.join('template', 'xml_template.xml')
-
-try:
-    os.path.isfile(TEMPLATE_FNAME)
-except FileNotFoundError:
-    error = "Please provide the xml template to use " \
-            "(option --xml--template=<file name>)"
-    sys.exit()
+TEMPLATE_FNAME = _resource('template', 'xml_template.xml')
 
 # Relaxng
-try:
-    RELAXNG_FNAME = pkg_resources.resource_filename('exegis',
-                                                    os.path.join('template',
-                                                                 'tei_all.rng'))
-except (ModuleNotFoundError, KeyError):
-    RELAXNG_FNAME = os.path.join('template', 'tei_all.rng')
-
-try:
-    os.path.isfile(RELAXNG_FNAME)
-except FileNotFoundError:
-    error = "Please provide the Relaxng file to use " \
-            "(option --relaxng=<file name>)"
-    sys.exit()
-
+RELAXNG_FNAME = _resource('template', 'tei_all.rng')
@@ -0,0 +1,206 @@
+"""Module which contains the functions used to find the exegis text files
+to convert in a corpus.
+
+The corpus is walked recursively with ``os.scandir`` (the directory entries
+carry the file type and the ``stat`` information, no extra system call is
+needed to skip folders or get the size of a file). The files found are
+yielded one by one, they can be sent to the conversion while the rest of
+the tree is still explored.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import time
+import fnmatch
+from collections import namedtuple
+
+try:
+    from .baseclass import logger
+except ImportError:
+    from baseclass import logger
+
+
+# Extension of the files treated by default
+EXTENSIONS = ('.txt',)
+
+
+# Define an Exception
+class DiscoveryException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+# File found in the corpus
+TextFile = namedtuple('TextFile', ['path', 'relpath', 'size'])
+
+
+def _match(relpath, patterns):
+    """Return True if the relative path or its base name match one of the
+    glob patterns.
+    """
+    name = os.path.basename(relpath)
+    for pattern in patterns:
+        if fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+class Discovery(object):
+    """Class which find recursively the exegis text files in a folder.
+
+    The object is an iterable which yields :class:`TextFile` in the order
+    they are found. The statistics (number of files, size, time spent)
+    are available once the iteration is done.
+
+    Attributes
+    ----------
+    path : str
+        Name of the folder (or of the file) to explore.
+
+    include : list, optional
+        glob patterns, only the files matching one of them are kept.
+        The patterns are compared to the path relative to ``path`` and
+        to the base name of the file.
+
+    exclude : list, optional
+        glob patterns, the files and the folders matching one of them are
+        not considered.
+
+    extensions : list, optional
+        extensions of the files to keep (case insensitive).
+        Default: ``.txt``. Use an empty list to keep all the files.
+
+    n_files : int
+        number of files found.
+
+    n_bytes : int
+        total size of the files found.
+
+    n_skipped : int
+        number of entries ignored (wrong extension, excluded, not regular
+        files).
+
+    elapsed : float
+        time (in seconds) spent to explore the tree. The time spent by the
+        consumer of the files between two iterations is not counted.
+
+    Raises
+    ------
+    DiscoveryException
+        if the path does not exist.
+    """
+    def __init__(self, path, include=None, exclude=None,
+                 extensions=EXTENSIONS):
+        self.path = path
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.extensions = tuple(ext.lower() for ext in extensions or ())
+        self.n_files = 0
+        self.n_bytes = 0
+        self.n_skipped = 0
+        self.elapsed = 0.
+
+    def _keep(self, relpath):
+        """Return True if the file has to be treated."""
+        if self.extensions and \
+                not relpath.lower().endswith(self.extensions):
+            return False
+        if self.include and not _match(relpath, self.include):
+            return False
+        if self.exclude and _match(relpath, self.exclude):
+            return False
+        return True
+
+    def __iter__(self):
+        start = time.perf_counter()
+
+        if not os.path.exists(self.path):
+            error = 'Error: path {} for text files not found'.format(
+                self.path)
+            logger.error(error)
+            raise DiscoveryException(error)
+
+        # Only one file to treat
+        if not os.path.isdir(self.path):
+            self.n_files = 1
+            self.n_bytes = os.path.getsize(self.path)
+            self.elapsed = time.perf_counter() - start
+            yield TextFile(self.path, os.path.basename(self.path),
+                           self.n_bytes)
+            return
+
+        # Use a stack instead of the recursion (no limit on the depth)
+        stack = ['']
+        while stack:
+            reldir = stack.pop()
+            try:
+                with os.scandir(os.path.join(self.path, reldir)) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                logger.warning('Unable to read folder %s: %s', reldir, e)
+                continue
+
+            subfolders = []
+            for entry in entries:
+                relpath = os.path.join(reldir, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.exclude and _match(relpath, self.exclude):
+                            self.n_skipped += 1
+                        else:
+                            subfolders.append(relpath)
+                        continue
+                    if not entry.is_file() or not self._keep(relpath):
+                        self.n_skipped += 1
+                        continue
+                    size = entry.stat().st_size
+                except OSError as e:
+                    logger.warning('Unable to read %s: %s', relpath, e)
+                    self.n_skipped += 1
+                    continue
+
+                self.n_files += 1
+                self.n_bytes += size
+                self.elapsed += time.perf_counter() - start
+                yield TextFile(entry.path, relpath, size)
+                start = time.perf_counter()
+
+            # Reverse to explore the subfolders in alphabetical order
+            stack.extend(reversed(subfolders))
+
+        self.elapsed += time.perf_counter() - start
+        logger.info('Discovered %d files (%d bytes) in %.3f s, '
+                    '%d entries skipped', self.n_files, self.n_bytes,
+                    self.elapsed, self.n_skipped)
+
+    def summary(self):
+        """Return a string which summarise the discovery."""
+        return ('Discovered {} files ({} bytes) in {:.3f} s '
+                '({} entries skipped)'.format(self.n_files, self.n_bytes,
+                                              self.elapsed, self.n_skipped))
+
+
+def largest_first(files):
+    """Sort the files found by decreasing size.
+
+    Starting with the largest files shorten the time needed to treat a
+    corpus in parallel (the small files fill the gaps at the end).
+    The ordering needs the whole list of files, the discovery is then
+    complete before the first file is returned.
+
+    Parameters
+    ----------
+    files : iterable
+        :class:`TextFile` objects
+
+    Returns
+    -------
+    list
+        :class:`TextFile` sorted by decreasing size (the relative path
+        is used to have a stable order for files with the same size).
+    """
+    return sorted(files, key=lambda f: (-f.size, f.relpath))
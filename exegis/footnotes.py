@@ -6,7 +6,7 @@
 """
 # pylint: disable=locally-disabled, invalid-name
 import re
-from collections import OrderedDict
+from collections import OrderedDict, Counter
 
 try:
     from .baseclass import Exegis, logger
@@ -137,9 +137,8 @@ class Footnote(Exegis):
             self._omission_xml()
         except (IndexError, FootnotesException):
             self.note_xml(self.footnote)
-            error = 'Omission error in footnote {}: {}'.format(self.n_footnote,
-                                                               self.footnote)
-            logger.error(error)
+            logger.error('Omission error in footnote %s: %s', self.n_footnote,
+                         self.footnote)
 
     def _omission_xml(self):
         """Method to create the XML portion related to footnote (TEI format)
@@ -257,9 +256,8 @@ class Footnote(Exegis):
             self._correction_xml()
         except (IndexError, FootnotesException):
             self.note_xml(self.footnote)
-            error = 'Footnote error in footnote {}: {}'.format(self.n_footnote,
-                                                               self.footnote)
-            logger.error(error)
+            logger.error('Footnote error in footnote %s: %s', self.n_footnote,
+                         self.footnote)
 
     def _correction_xml(self):
         """Method to create the XML portion related to footnote (TEI format)
@@ -319,6 +317,11 @@ class Footnotes(object):
     footnotes : list, str, OrderedDict, dict
         List which contains the whole set of footnote from the exegis
         file.
+
+    kinds : Counter
+        number of footnotes of each kind (``omission``, ``addition``,
+        ``correxi``, ``conieci`` and ``standard``) treated by
+        :meth:`xml_app`.
     """
 
     def __init__(self, footnotes=None):
@@ -329,6 +332,7 @@ class Footnotes(object):
             self.footnotes = footnotes
         self.xml = []
         self.wits = []
+        self.kinds = Counter()
 
     def _dictionary(self):
         """Create an ordered dictionary (OrderedDict object) with the footnotes
@@ -368,9 +372,8 @@ class Footnotes(object):
             if not re.findall(str(_size), _tmp[-1])[0] == str(_size):
                 raise FootnotesException
         except (IndexError, FootnotesException):
-            error = 'Number of footnotes {} not in agreement ' \
-                    'with their numeration in the file'.format(_size)
-            logger.error(error)
+            logger.error('Number of footnotes %d not in agreement '
+                         'with their numeration in the file', _size)
             raise FootnotesException
 
         # Create the ordered dictionary and remove the '.'
@@ -382,16 +385,14 @@ class Footnotes(object):
                 if len(pos_stars) < 2 or pos_stars[0] != 0:
                     raise FootnotesException
                 elif len(pos_stars) > 2:
-                    warning = 'Problem in footnote: {}'.format(line)
-                    logger.warning(warning)
+                    logger.warning('Problem in footnote: %s', line)
                     logger.warning('There are a footnote reference inside '
                                    'the footnote. This case is not treatable '
                                    'by the actual version of the software')
                 key = line[1:pos_stars[1]]
                 value = line[pos_stars[1]+1:]
             except FootnotesException:
-                error = 'There are a problem in footnote: {}'.format(line)
-                logger.error(error)
+                logger.error('There are a problem in footnote: %s', line)
                 raise FootnotesException
 
             # Remove space and '.'
@@ -399,9 +400,14 @@ class Footnotes(object):
 
             self.footnotes = _dic
 
-    def xml_app(self):
+    def xml_app(self, anchors=None):
         """Method to create the XML add for the footnote
 
+        Parameters
+        ----------
+        anchors : exegis.anchors.Anchors, optional
+            if given the references of the apparatus are added to it.
+
         Returns
         -------
         xml_app : list
@@ -420,6 +426,9 @@ class Footnotes(object):
 
             self.xml.append('<app from="#begin_fn' + str(n_footnote) +
                             '" to="#end_fn' + str(n_footnote) + '">')
+            if anchors is not None:
+                anchors.app('begin_fn' + str(n_footnote),
+                            'end_fn' + str(n_footnote))
 
             ft.check_endnote()
 
@@ -427,22 +436,27 @@ class Footnotes(object):
             # Case 1 - omission
             if 'om.' in ft.footnote:
                 ft.omission()
+                self.kinds['omission'] += 1
 
             # Case 2 - addition
             elif 'add.' in ft.footnote:
                 ft.correction('add')
+                self.kinds['addition'] += 1
 
             # Case 3 - correxi
             elif 'correxi' in ft.footnote:
                 ft.correction('correxi')
+                self.kinds['correxi'] += 1
 
             # Case4 - conieci
             elif 'conieci' in ft.footnote:
                 ft.correction('conieci')
+                self.kinds['conieci'] += 1
 
             # Remaining case - standard variation
             else:
                 ft.correction('standard')
+                self.kinds['standard'] += 1
 
             self.xml += ft.xml
             self.wits += ft.wits
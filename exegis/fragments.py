@@ -0,0 +1,308 @@
+"""Module which contains the validation of the documents by fragments.
+
+After the edition of a commentary only one part of the XML changes. The
+fragments of a document (the ``teiHeader``, each ``div`` of the body, i.e.
+the title, the introduction and each aphorism with its commentaries, and
+each ``<app>`` of the apparatus) are hashed with the version of the Relaxng
+file. A fragment found valid is kept in a cache, only the fragments which
+changed are validated again::
+
+    cache = FragmentCache('fragments.cache')
+    validate_fragments(xml, relaxng_fname, cache)
+    cache.save()
+
+The rest of the document (the frame given by the template) is validated with
+the whole document the first time it is seen. Then the fragments which
+changed are validated in a reduced document: the frame, the ``teiHeader``,
+the first ``div`` (a body cannot be empty) and the fragments which changed.
+The same compiled schema as :func:`exegis.aphorisms_to_xml.validate_xml` is
+used: the compilation (about 14 s for ``tei_all``) is done once by thread,
+it is kept by the contexts of :mod:`exegis.api` and by the server. A
+document without change is not validated and the schema not compiled.
+:func:`exegis.aphorisms_to_xml.validate_xml` still validates the whole
+document on demand.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import hashlib
+import threading
+
+try:
+    from .aphorisms_to_xml import (validate_xml, relaxng_validator,
+                                   AphorismsToXMLException)
+    from .baseclass import logger, RELAXNG_FNAME
+except ImportError:
+    from aphorisms_to_xml import (validate_xml, relaxng_validator,
+                                  AphorismsToXMLException)
+    from baseclass import logger, RELAXNG_FNAME
+
+TEI = '{http://www.tei-c.org/ns/1.0}'
+
+# Number of hexadecimal characters of the hash kept in the cache
+HASH_SIZE = 32
+
+# Version of the Relaxng files compiled by each thread (see schema_id)
+_compiled = threading.local()
+
+
+# Define an Exception
+class FragmentsException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+def _relaxng_file(relaxng_fname):
+    """Return the Relaxng file used (the one provided with the software if
+    the file cannot be read)."""
+    if relaxng_fname and os.path.isfile(relaxng_fname):
+        return os.path.abspath(relaxng_fname)
+    return os.path.abspath(RELAXNG_FNAME)
+
+
+def schema_id(relaxng_fname):
+    """Return the identifier of the version of a Relaxng file (name, size
+    and time of modification)."""
+    fname = _relaxng_file(relaxng_fname)
+    stat = os.stat(fname)
+    return '{}:{}:{}'.format(fname, stat.st_size, stat.st_mtime_ns)
+
+
+def validator(relaxng_fname):
+    """Return the compiled Relaxng schema of the current thread, compiled
+    again if the file changed since its compilation (see
+    :func:`exegis.aphorisms_to_xml.relaxng_validator`).
+
+    Parameters
+    ----------
+    relaxng_fname : str
+        name of the Relaxng file. The Relaxng file provided with the
+        software is used if it cannot be read.
+
+    Returns
+    -------
+    lxml.etree.RelaxNG
+        the compiled schema.
+    """
+    versions = getattr(_compiled, 'versions', None)
+    if versions is None:
+        versions = _compiled.versions = {}
+    version = schema_id(relaxng_fname)
+    reload = versions.get(relaxng_fname, version) != version
+    relaxng = relaxng_validator(relaxng_fname, reload=reload)[0]
+    versions[relaxng_fname] = version
+    return relaxng
+
+
+class FragmentCache(object):
+    """Class which keeps the hashes of the fragments found valid.
+
+    The file contains one hash by line. The new hashes are appended to it
+    by :meth:`save`.
+
+    Attributes
+    ----------
+    fname : str, optional
+        name of the file of the cache. Without file the hashes are kept only
+        in memory.
+
+    n_fragments : int
+        number of fragments checked.
+
+    n_validated : int
+        number of fragments validated (not in the cache).
+    """
+    def __init__(self, fname=None):
+        self.fname = fname
+        self.n_fragments = 0
+        self.n_validated = 0
+        self._hashes = set()
+        self._new = []
+        self._lock = threading.Lock()
+        if fname is not None:
+            try:
+                with open(fname, 'r', encoding="utf-8") as f:
+                    # A line partially written is ignored
+                    self._hashes = {line.strip() for line in f
+                                    if len(line.strip()) == HASH_SIZE}
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                raise FragmentsException('Unable to read the cache {}: '
+                                         '{}'.format(fname, e))
+
+    def __contains__(self, key):
+        return key in self._hashes
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, key):
+        """Add the hash of a valid fragment."""
+        with self._lock:
+            if key not in self._hashes:
+                self._hashes.add(key)
+                self._new.append(key)
+
+    def count(self, n_fragments, n_validated):
+        """Count the fragments of a document checked and validated."""
+        with self._lock:
+            self.n_fragments += n_fragments
+            self.n_validated += n_validated
+
+    def save(self):
+        """Append the new hashes to the file."""
+        with self._lock:
+            new, self._new = self._new, []
+        if self.fname is None or not new:
+            return
+        with open(self.fname, 'a', encoding="utf-8") as f:
+            f.write(''.join(key + '\n' for key in new))
+
+    def summary(self):
+        """Return a string which summarise the validation."""
+        return '{} fragments checked, {} validated, {} in the cache ' \
+               '{}'.format(self.n_fragments, self.n_validated,
+                           len(self._hashes), self.fname)
+
+
+def _hash(schema, data):
+    return hashlib.sha256(schema + b'\n' + data).hexdigest()[:HASH_SIZE]
+
+
+def _describe(fragment):
+    """Return the description of a fragment used in the messages."""
+    name = fragment.tag.replace(TEI, '')
+    if name == 'app':
+        return 'apparatus from {}'.format(fragment.get('from'))
+    if fragment.get('n') is not None:
+        return '{} n={} ({})'.format(name, fragment.get('n'),
+                                     fragment.get('type'))
+    if fragment.get('type') is not None:
+        return '{} ({})'.format(name, fragment.get('type'))
+    return name
+
+
+def _reduced(fragments, selected):
+    """Put back in the frame the fragments selected (in their place)."""
+    skipped = {}
+    for fragment, parent, index in fragments:
+        if fragment in selected:
+            parent.insert(index - skipped.get(parent, 0), fragment)
+        else:
+            skipped[parent] = skipped.get(parent, 0) + 1
+
+
+def _blame(errors, changed):
+    """Return the fragments which changed with an error (the fragment of
+    an error is the last one which starts before its line)."""
+    starts = sorted((fragment.sourceline or 0, i)
+                    for i, fragment in enumerate(changed))
+    blamed = set()
+    for error in errors:
+        found = None
+        for line, i in starts:
+            if line > error.line:
+                break
+            found = i
+        if found is None:
+            # Error in the frame, all the fragments are doubtful
+            return set(range(len(changed)))
+        blamed.add(found)
+    return blamed
+
+
+def validate_fragments(xml, relaxng_fname, cache, name=''):
+    """Function to validate the fragments of an XML document which are not
+    in the cache.
+
+    Parameters
+    ----------
+    xml : str
+        XML document.
+
+    relaxng_fname : str
+        name of the Relaxng file (see :func:`validator`).
+
+    cache : FragmentCache
+        cache of the fragments valid, the new ones are added.
+
+    name : str, optional
+        name of the document used in the messages.
+
+    Returns
+    -------
+    int
+        number of fragments validated (not in the cache).
+
+    Raises
+    ------
+    FragmentsException
+        if a fragment (or the document) is not valid.
+    """
+    from lxml import etree
+
+    schema = schema_id(relaxng_fname).encode('utf-8')
+    root = etree.fromstring(xml.encode('utf-8'))
+    text = root.find(TEI + 'text')
+    elements = []
+    if text is not None:
+        elements.extend(root.iterchildren(TEI + 'teiHeader'))
+        for body in text.iterchildren(TEI + 'body'):
+            elements.extend(body.iterchildren(TEI + 'div'))
+        elements.extend(text.iterchildren(TEI + 'app'))
+    hashes = [_hash(schema, etree.tostring(element))
+              for element in elements]
+
+    # The frame of the document (without the fragments) is validated with
+    # the whole document the first time
+    fragments = []
+    for element in elements:
+        parent = element.getparent()
+        fragments.append((element, parent, parent.index(element)))
+        parent.remove(element)
+    frame = _hash(schema, etree.tostring(root))
+    if frame not in cache:
+        # Compiled again if the file changed
+        validator(relaxng_fname)
+        try:
+            validate_xml(xml, relaxng_fname, name)
+        except AphorismsToXMLException:
+            raise FragmentsException('Document {} not valid'.format(name))
+        for key in [frame] + hashes:
+            cache.add(key)
+        cache.count(len(elements), len(elements))
+        return len(elements)
+
+    changed = [i for i, key in enumerate(hashes) if key not in cache]
+    cache.count(len(elements), len(changed))
+    logger.info('%d fragments of the document %s validated, %d in the '
+                'cache', len(changed), name, len(elements) - len(changed))
+    if not changed:
+        return 0
+
+    # The teiHeader and a div are required
+    selected = {elements[i] for i in changed}
+    for tag in ('teiHeader', 'div'):
+        selected.update(element for element in elements[:2]
+                        if element.tag == TEI + tag)
+    _reduced(fragments, selected)
+    relaxng = validator(relaxng_fname)
+    errors = [] if relaxng.validate(root) else list(relaxng.error_log)
+    blamed = _blame(errors, [elements[i] for i in changed])
+    for j, i in enumerate(changed):
+        if j in blamed:
+            logger.error('Fragment %s of the document %s not valid',
+                         _describe(elements[i]), name)
+        else:
+            cache.add(hashes[i])
+    for error in errors:
+        logger.error('%s:%d: %s', name, error.line, error.message)
+    if blamed:
+        raise FragmentsException('{} fragments of the document {} not '
+                                 'valid'.format(len(blamed), name))
+    return len(changed)
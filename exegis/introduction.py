@@ -34,16 +34,20 @@ class Introduction(Exegis):
         integer which contains the footnote reference number which
         can be present.
 
+    anchors : exegis.anchors.Anchors, optional
+        collects the anchors created (see :func:`exegis.analysis.footnotes`).
+
     Raises
     ------
     IntroductionException
         if cannot create the xml code for the introduction.
     """
 
-    def __init__(self, introduction, next_footnote):
+    def __init__(self, introduction, next_footnote, anchors=None):
         Exegis.__init__(self)
         self.introduction = introduction
         self.next_footnote = next_footnote
+        self.anchors = anchors
 
     def xml_main(self):
         """Method to treat the optional part of the introduction.
@@ -76,7 +80,8 @@ class Introduction(Exegis):
             try:
                 self.xml_n_offset += 2
                 xml_main_to_add, self.next_footnote = \
-                    footnotes(line_ref, self.next_footnote)
+                    footnotes(line_ref, self.next_footnote,
+                              self.anchors)
                 self.xml_n_offset -= 2
             except IntroductionException:
                 error = ('Unable to process footnote in the introduction'
@@ -0,0 +1,247 @@
+"""Module which contains the journal of a run, used to resume it when it is
+interrupted.
+
+Each file converted is appended to the journal (one JSON object per line):
+its path, the hash of its text, its status, the XML file written and the
+hash of the XML. The records are written and synchronised on the disk
+(``fsync``) by batches: a run killed loses at most the last batch, the
+files of this batch are converted again when the run is resumed. A line
+partially written by a crash is removed when the journal is opened again.
+
+With ``exegis --journal=<file> --resume`` the files already converted (same
+text, XML file still present) are not converted again.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    from .baseclass import logger
+except ImportError:
+    from baseclass import logger
+
+# Status of the files which are not converted again
+FINISHED = ('ok', 'invalid', 'failed')
+
+
+# Define an Exception
+class JournalException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+def text_hash(text):
+    """Return the hash (SHA-256, hexadecimal) of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _truncate_torn(fname):
+    """Remove the last line of the file if it is not complete (crash during
+    a write)."""
+    try:
+        with open(fname, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if not size:
+                return
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+            if tail.endswith(b'\n'):
+                return
+            end = tail.rfind(b'\n')
+            if end < 0 and size > len(tail):
+                raise JournalException('Last line of the journal {} too '
+                                       'long'.format(fname))
+            f.truncate(size - len(tail) + end + 1)
+            logger.warning('Incomplete last record removed from the '
+                           'journal %s', fname)
+    except FileNotFoundError:
+        return
+
+
+def load(fname):
+    """Read a journal.
+
+    Returns
+    -------
+    dict
+        last record of each file (key: relative path).
+    """
+    records = {}
+    try:
+        with open(fname, 'r', encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                    records[record['path']] = record
+                except (ValueError, KeyError, TypeError):
+                    logger.warning('Record %d of the journal %s not valid',
+                                   n, fname)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+class Journal(object):
+    """Class which appends the files converted to the journal of the run.
+
+    Attributes
+    ----------
+    fname : str
+        name of the journal (JSON lines).
+
+    resume : bool, optional
+        if True the journal is kept and the files it contains are not
+        converted again (see :meth:`pending`), otherwise it is started
+        again. Default: False
+
+    batch : int, optional
+        number of records written and synchronised together. Default: 64
+
+    interval : float, optional
+        maximum time (seconds) a record waits before being written.
+        Default: 1
+
+    n_skipped : int
+        number of files not converted again.
+
+    Raises
+    ------
+    JournalException
+        if the journal cannot be opened.
+    """
+    def __init__(self, fname, resume=False, batch=64, interval=1.):
+        self.fname = fname
+        self.resume = resume
+        self.batch = batch
+        self.interval = interval
+        self.n_skipped = 0
+        self.records = {}
+
+        try:
+            if resume:
+                _truncate_torn(fname)
+                self.records = load(fname)
+            created = not os.path.exists(fname)
+            flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+            if not resume:
+                flags |= os.O_TRUNC
+            self._fd = os.open(fname, flags, 0o644)
+            if created:
+                # The entry of the journal in its folder is on the disk
+                _fsync_dir(os.path.dirname(os.path.abspath(fname)))
+        except OSError as e:
+            raise JournalException('Unable to open the journal {}: '
+                                   '{}'.format(fname, e))
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_regularly,
+                                        name='exegis-journal', daemon=True)
+        self._thread.start()
+
+    def _is_finished(self, text_file):
+        """Return True if the file was converted by the previous run and
+        did not change."""
+        record = self.records.get(text_file.relpath)
+        if record is None or record.get('status') not in FINISHED or \
+                record.get('quarantined') or record.get('size') != \
+                text_file.size:
+            return False
+        output = record.get('output')
+        if record['status'] != 'failed':
+            try:
+                if os.path.getsize(output) != record.get('output_size'):
+                    return False
+            except (OSError, TypeError):
+                return False
+        try:
+            with open(text_file.path, 'r', encoding="utf-8") as f:
+                return text_hash(f.read()) == record.get('hash')
+        except (OSError, UnicodeDecodeError):
+            return False
+
+    def pending(self, files):
+        """Yield the files which are not finished in the journal."""
+        for text_file in files:
+            if self._is_finished(text_file):
+                self.n_skipped += 1
+                continue
+            yield text_file
+
+    def add(self, job):
+        """Append the record of a job at the end of the pipeline."""
+        record = {'path': job.relpath, 'input': job.path, 'size': job.size,
+                  'hash': job.text_hash, 'status': job.status,
+                  'output': job.output, 'output_size': job.output_size,
+                  'output_hash': job.output_hash, 'error': job.error,
+                  'quarantined': job.quarantined, 'time': time.time()}
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write the records waiting and synchronise the journal."""
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            data = b''.join(lines)
+            # O_APPEND: each write is added at the end of the file
+            while data:
+                data = data[os.write(self._fd, data):]
+            os.fsync(self._fd)
+
+    def _flush_regularly(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error('Unable to write the journal %s: %s',
+                             self.fname, e)
+
+    def close(self):
+        """Write the last records and close the journal."""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        os.close(self._fd)
+
+    def summary(self):
+        """Return a string which summarise the resumption."""
+        return '{} files already converted in the journal {}'.format(
+            self.n_skipped, self.fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fsync_dir(folder):
+    """Synchronise the entries of a folder (not possible on all the
+    systems)."""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
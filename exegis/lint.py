@@ -0,0 +1,380 @@
+"""Module which contains the pre-flight check of the exegis documents
+(``exegis --check``).
+
+The structure of a document (footnote section, ``++`` separators,
+numeration of the aphorisms, references ``[W1 W2]``, footnote symbols
+``*n*`` and footnote lines) is verified with the rules used by the
+conversion, but without creating any XML nor validating it. Contrary to the
+conversion, which stops at the first problem, all the problems of a file
+are reported with their line number::
+
+    from exegis.lint import lint
+
+    for issue in lint(text):
+        print(issue.line, issue.level, issue.message)
+
+The text is read once (linear time), the check of a whole corpus is fast
+enough to be done each time a file is saved.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import re
+from collections import namedtuple
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Problem found in a document (line: number of the line, starting at 1,
+# None if the problem concerns the whole file)
+Issue = namedtuple('Issue', ['line', 'level', 'message'])
+
+# Aphorism number alone on its line (see APHORISM_NUMBER in
+# exegis.aphorisms_to_xml)
+_NUMBER = re.compile(r'[^\S\n]*([0-9]+)\.?')
+# Line which looks like an aphorism number but is not recognised as one
+# (e.g.: .1, 14-, "3. ")
+_BAD_NUMBER = re.compile(r'\s*[.\-]?[0-9]+\s*[.\-,:;)]?\s*')
+_SYMBOL = re.compile(r'\*([0-9]+)\*')
+_INTRO_SEP = '++'
+
+
+class _Scanner(object):
+    """Check of the body of a document (title, introduction, aphorisms and
+    commentaries), line after line."""
+    def __init__(self, issues):
+        self.issues = issues
+        self.next_footnote = 1
+        self.symbols = {}
+
+    def error(self, line, message, *args):
+        self.issues.append(Issue(line, ERROR, message.format(*args)))
+
+    def references(self, n, line):
+        """Check the references ``[W1 W2]`` of a line (see
+        :func:`exegis.analysis.references`)."""
+        start = line.find('[')
+        while start != -1:
+            end = line.find(']', start + 1)
+            if end == -1:
+                self.error(n, 'Reference not closed (missing "]"): {}',
+                           line[start:start + 30])
+                return
+            reference = line[start + 1:end]
+            if ' ' not in reference:
+                self.error(n, 'Reference [{}] without space between the '
+                              'witness and the location', reference)
+            start = line.find('[', end + 1)
+
+    def footnotes(self, n, line):
+        """Check the footnote symbols ``*n*`` of a line (see
+        :func:`exegis.analysis.footnotes`)."""
+        pos = 0
+        for match in _SYMBOL.finditer(line):
+            number = int(match.group(1))
+            if number < self.next_footnote:
+                self.error(n, 'Footnote *{}* out of order or repeated '
+                              '(expected *{}*)', number, self.next_footnote)
+                continue
+            if number > self.next_footnote:
+                self.error(n, 'Footnote {} missing before *{}*',
+                           _numbers(self.next_footnote, number), number)
+            before = line[pos:match.start()]
+            if '#' not in before and ' ' not in before:
+                self.error(n, 'Missing a space or "#" before the footnote '
+                              '*{}* to determine the word(s) it applies to',
+                           number)
+            self.symbols[number] = n
+            self.next_footnote = number + 1
+            pos = match.end()
+
+    def line(self, n, line):
+        self.references(n, line)
+        self.footnotes(n, line)
+
+
+def _numbers(first, last):
+    """Return the description of the numbers from first to last (excluded).
+    """
+    if last - first == 1:
+        return '*{}*'.format(first)
+    return '*{}* to *{}*'.format(first, last - 1)
+
+
+def _footnote(n, number, footnote, issues):
+    """Check the format of a footnote (see
+    :meth:`exegis.footnotes.Footnotes.xml_app`). A footnote which is not
+    understood is added as a note to the XML, hence a warning."""
+    loc_com = footnote.rfind(';')
+    if loc_com != -1:
+        footnote = footnote[:loc_com]
+    text, sep, variant = footnote.partition(']')
+    problem = None
+    if not sep:
+        problem = 'missing "]" after the text'
+    elif 'om.' in footnote:
+        if ']' in variant or 'om.' not in variant:
+            problem = 'omission should be "text] W1 om. W2"'
+    else:
+        for reason, sep in (('add', 'add.'), ('correxi', 'correxi:'),
+                            ('conieci', 'conieci:')):
+            if reason in footnote:
+                if sep not in variant:
+                    problem = '"{}" expected after "]"'.format(sep)
+                else:
+                    variant = variant.split(sep)[1]
+                break
+        if problem is None and not variant.split(':')[0].split(','
+                                                                )[0].split():
+            problem = 'missing witness'
+    if problem is not None:
+        issues.append(Issue(n, WARNING, 'Footnote *{}* not understood, '
+                            'added as a note: {}'.format(number, problem)))
+
+
+def _footnote_section(lines, first, issues):
+    """Check the footnote section (see
+    :meth:`exegis.footnotes.Footnotes._dictionary`).
+
+    Parameters
+    ----------
+    lines : list
+        lines of the footnote section.
+
+    first : int
+        number of the first line of the section in the file.
+
+    Returns
+    -------
+    dict
+        line of each footnote (key: number of the footnote).
+    """
+    footnotes = {}
+    expected = 1
+    for n, line in enumerate(lines, first):
+        if not line.strip():
+            issues.append(Issue(n, ERROR, 'Empty line in the footnote '
+                                'section'))
+            continue
+        if line[0].isspace():
+            issues.append(Issue(n, ERROR, 'Footnote line starting with a '
+                                'space'))
+            line = line.lstrip()
+        match = _SYMBOL.match(line)
+        if match is None:
+            issues.append(Issue(n, ERROR, 'Footnote line not starting with '
+                                '*n*: {}'.format(line[:30])))
+            continue
+        number = int(match.group(1))
+        if number in footnotes:
+            issues.append(Issue(n, ERROR, 'Footnote *{}* defined twice (line '
+                                '{})'.format(number, footnotes[number])))
+        elif number != expected:
+            issues.append(Issue(n, ERROR, 'Footnote *{}* out of order '
+                                '(expected *{}*)'.format(number, expected)))
+        footnotes.setdefault(number, n)
+        expected = number + 1
+        rest = line[match.end():]
+        if '*' in rest:
+            issues.append(Issue(n, WARNING, 'Footnote symbol inside the '
+                                'footnote *{}* (not treated)'.format(number)))
+        _footnote(n, number, rest.strip('. '), issues)
+    return footnotes
+
+
+def _aphorisms(numbers, issues):
+    """Check the numeration of the aphorisms (see
+    :meth:`exegis.aphorisms_to_xml.Process.aphorisms_dict`).
+
+    Parameters
+    ----------
+    numbers : list
+        ``(number, line)`` of the aphorisms found.
+    """
+    if not numbers:
+        issues.append(Issue(None, ERROR, 'There are no aphorisms detected'))
+        return
+    seen = {}
+    largest = 0
+    for number, n in numbers:
+        if number in seen:
+            issues.append(Issue(n, ERROR, 'Aphorism with same number: {} '
+                                '(line {})'.format(number, seen[number])))
+            continue
+        seen[number] = n
+        if number < largest:
+            issues.append(Issue(n, WARNING, 'Aphorism {} after the aphorism '
+                                '{}'.format(number, largest)))
+        largest = max(largest, number)
+    # Missing numbers reported at the line of the next aphorism
+    previous = 0
+    for number in sorted(seen):
+        if number > previous + 1:
+            if number - previous == 2:
+                description = str(previous + 1)
+            else:
+                description = '{} to {}'.format(previous + 1, number - 1)
+            issues.append(Issue(seen[number], ERROR, 'Missing or problematic '
+                                'aphorism: {}'.format(description)))
+        previous = number
+
+
+def lint(text):
+    """Check the structure of a document.
+
+    Parameters
+    ----------
+    text : str
+        content of the document.
+
+    Returns
+    -------
+    list
+        :class:`Issue` found, sorted by line.
+    """
+    issues = []
+    scanner = _Scanner(issues)
+    lines = text.split('\n')
+
+    # Footnote section: from the last *1* (see
+    # exegis.aphorisms_to_xml.Process.divide_document)
+    loc_footnotes = text.rfind('*1*')
+    if loc_footnotes == text.find('*1*'):
+        issues.append(Issue(None, ERROR, 'Footnote referenced in the text '
+                            'but no footnote section present'))
+        footnote_line = len(lines)
+        body = lines
+    else:
+        footnote_line = text.count('\n', 0, loc_footnotes)
+        start = loc_footnotes - text.rfind('\n', 0, loc_footnotes) - 1
+        body = lines[:footnote_line]
+        if lines[footnote_line][:start].strip():
+            issues.append(Issue(footnote_line + 1, WARNING, 'Footnote section '
+                                'not starting at the beginning of a line'))
+            body.append(lines[footnote_line][:start])
+        section = [lines[footnote_line][start:]] + lines[footnote_line + 1:]
+        while section and not section[-1].strip():
+            section.pop()
+
+    # Parts separated by ++: title, introduction, text or introduction, text
+    separators = [n for n, line in enumerate(body) if
+                  line.endswith(_INTRO_SEP)]
+
+    def content(n):
+        line = body[n]
+        if n in separators[:2]:
+            return line[:-len(_INTRO_SEP)]
+        return line
+
+    title, introduction = [], []
+    begin = 0
+    if len(separators) > 2:
+        for n in separators[2:]:
+            issues.append(Issue(n + 1, WARNING, 'More than two "++" '
+                                'separators, all of them ignored'))
+    elif len(separators) == 2:
+        # Without text before the first ++ the title is before the first
+        # aphorism
+        title = [n for n in range(0, separators[0] + 1)
+                 if content(n).strip()]
+        introduction = range(separators[0] + 1, separators[1] + 1)
+        begin = separators[1] + 1
+    elif len(separators) == 1:
+        introduction = range(0, separators[0] + 1)
+        begin = separators[0] + 1
+
+    # The introduction is converted before the title
+    for n in introduction:
+        if content(n):
+            scanner.line(n + 1, content(n))
+
+    numbers = []
+    text_lines = []
+    empty = None
+    # Title before the introduction: the text before the first aphorism is
+    # not used
+    title_part = bool(title)
+    ignored = False
+    for n in range(begin, len(body)):
+        line = content(n)
+        match = _NUMBER.fullmatch(line)
+        # The number has to be followed by a new line
+        if match is not None and (n + 1 < len(body) or
+                                  footnote_line < len(lines)):
+            if empty is not None:
+                issues.append(Issue(empty[1], ERROR, 'Aphorism {} without '
+                                    'text'.format(empty[0])))
+            numbers.append((int(match.group(1)), n + 1))
+            empty = numbers[-1]
+            continue
+        if _BAD_NUMBER.fullmatch(line):
+            issues.append(Issue(n + 1, WARNING, 'Aphorism number not well '
+                                'formed: "{}" (expected "N." alone on the '
+                                'line)'.format(line.strip())))
+        if not numbers:
+            if title_part:
+                if line.strip() and not ignored:
+                    issues.append(Issue(n + 1, WARNING, 'Text before the '
+                                        'first aphorism ignored'))
+                    ignored = True
+            else:
+                title.append(n)
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        if empty is not None:
+            # First line: the aphorism
+            text_lines.append((n + 1, line))
+            empty = None
+        else:
+            # Commentary (a space is added before the line)
+            text_lines.append((n + 1, ' ' + line))
+    if empty is not None:
+        issues.append(Issue(empty[1], ERROR, 'Aphorism {} without '
+                            'text'.format(empty[0])))
+
+    first_title = True
+    for n in title:
+        line = content(n)
+        if first_title:
+            line = line.strip(' \n')
+        if line:
+            first_title = False
+            scanner.line(n + 1, line)
+    for n, line in text_lines:
+        scanner.line(n, line)
+
+    _aphorisms(numbers, issues)
+
+    # Agreement between the footnote symbols and the footnote section
+    if footnote_line < len(lines):
+        footnotes = _footnote_section(section, footnote_line + 1, issues)
+        for number in sorted(set(scanner.symbols) - set(footnotes)):
+            issues.append(Issue(scanner.symbols[number], ERROR, 'Footnote '
+                                '*{}* not in the footnote '
+                                'section'.format(number)))
+        for number in sorted(set(footnotes) - set(scanner.symbols)):
+            issues.append(Issue(footnotes[number], ERROR, 'Footnote *{}* '
+                                'not referenced in the text'.format(number)))
+
+    issues.sort(key=lambda issue: (issue.line or 0))
+    return issues
+
+
+def lint_file(fname):
+    """Check the structure of a file (see :func:`lint`).
+
+    Returns
+    -------
+    list
+        :class:`Issue` found, sorted by line.
+    """
+    try:
+        with open(fname, 'r', encoding="utf-8") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return [Issue(None, ERROR, 'Unable to read the file: {}'.format(e))]
+    return lint(text)
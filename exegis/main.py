@@ -5,8 +5,13 @@
 
 :Copyright: IT Services, The University of Manchester
 """
+import io
 import sys
 import os
+import json
+import signal
+from itertools import chain
+from functools import partial
 
 try:
     from docopt import docopt
@@ -16,10 +21,248 @@ except ImportError:
 
 try:
     from .__init__ import __version__
-    from .aphorisms_to_xml import logger, Process, AphorismsToXMLException
+    from .conf import logger, setup_logging, stop_logging, log_fname
+    from .discovery import Discovery, DiscoveryException, largest_first
+    from .pipeline import (Job, Stage, Pipeline, read, convert, validate,
+                           write, warm)
+    from .pool import WorkerPool
+    from .shard import (parse_shard, select, save_manifest, merge,
+                        ShardException)
+    from .spool import Spool
+    from .timings import PhaseStatistics, TimingsFile
+    from .profiling import Profiler
+    from .metrics import Metrics, MetricsWriter
+    from .journal import Journal, JournalException
+    from .tuning import AutoTuner
+    from .fragments import FragmentCache, FragmentsException
 except ImportError:
     from __init__ import __version__
-    from aphorisms_to_xml import logger, Process, AphorismsToXMLException
+    from conf import logger, setup_logging, stop_logging, log_fname
+    from discovery import Discovery, DiscoveryException, largest_first
+    from pipeline import (Job, Stage, Pipeline, read, convert, validate,
+                          write, warm)
+    from pool import WorkerPool
+    from shard import (parse_shard, select, save_manifest, merge,
+                       ShardException)
+    from spool import Spool
+    from timings import PhaseStatistics, TimingsFile
+    from profiling import Profiler
+    from metrics import Metrics, MetricsWriter
+    from journal import Journal, JournalException
+    from tuning import AutoTuner
+    from fragments import FragmentCache, FragmentsException
+
+
+def _done(job, records, quarantine, spool=None, statistics=None,
+          timings=None, metrics=None, journal=None):
+    """Log the files which cannot be converted, keep the record of each file
+    and the files which crashed or timed out in the quarantine list, collect
+    the timings of the phases and the metrics, append the file to the
+    journal."""
+    if job.status != 'ok':
+        error = 'Error: unable to process "{}", ' \
+                'see log file.'.format(job.relpath)
+        logger.error(error)
+    records.append(job.record())
+    if statistics is not None or timings is not None:
+        timing_record = job.timing_record()
+        if statistics is not None:
+            statistics.add(timing_record['phases'],
+                           timing_record.get('memory'), job.relpath)
+        if timings is not None:
+            timings.write(timing_record)
+    if metrics is not None:
+        metrics.add_job(job)
+    if job.quarantined:
+        quarantine.append({'path': job.path, 'error': job.error})
+    if spool is not None:
+        spool.complete(job)
+    if journal is not None:
+        journal.add(job)
+
+
+def _merge(fnames, report_fname=None):
+    """Merge the manifests of the shards and print the summary."""
+    try:
+        report = merge(fnames)
+    except ShardException:
+        sys.exit(1)
+
+    if report_fname:
+        with open(report_fname, 'w', encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+    summary = report['summary']
+    print('{files} files ({bytes} bytes): {ok} ok, {invalid} invalid, '
+          '{failed} failed, {quarantined} in quarantine, '
+          '{elapsed:.3f} s'.format(**summary))
+    for spec in sorted(report['shards']):
+        print('  shard {}: {} files, {:.3f} s'.format(
+            spec, report['shards'][spec]['files'],
+            report['shards'][spec]['elapsed']))
+    if report['missing']:
+        print('Missing shards: {}'.format(', '.join(report['missing'])))
+    if report['duplicates']:
+        print('Files converted more than once: {}'.format(
+            ', '.join(report['duplicates'])))
+
+
+def _serve(arguments):
+    """Run the conversion server until it is interrupted."""
+    # Imported here: http.server is not needed to convert files
+    try:
+        from .server import Engine, Server, ServerException, PORT
+    except ImportError:
+        from server import Engine, Server, ServerException, PORT
+
+    port = _int(arguments['--port'])
+    if port is None and not arguments['--socket']:
+        port = PORT
+    try:
+        engine = Engine(arguments['--xml-template'], arguments['--relaxng'],
+                        workers=int(arguments['--workers']))
+        server = Server(engine, host=arguments['--host'], port=port,
+                        socket_fname=arguments['--socket'],
+                        interval=float(arguments['--reload-interval']))
+    except ServerException as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    # SIGTERM stops the server like Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server.start()
+    print('Serving on {}'.format(', '.join(server.addresses)))
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def _client(arguments):
+    """Send the files to the conversion server and write the XML."""
+    try:
+        from .client import Client, ClientException
+    except ImportError:
+        from client import Client, ClientException
+
+    failed = 0
+
+    def documents():
+        nonlocal failed
+        for path in arguments['<paths>']:
+            for f in Discovery(path, extensions=arguments['--extension']):
+                try:
+                    with open(f.path, 'r', encoding="utf-8") as text:
+                        content = text.read()
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.error('Unable to read %s: %s', f.path, e)
+                    failed += 1
+                    continue
+                yield f.relpath, content
+
+    try:
+        with Client(arguments['--server']) as client:
+            for result in client.convert_many(
+                    documents(), validate=not arguments['--no-validate']):
+                for level, message in result.diagnostics:
+                    if level not in ('WARNING', 'ERROR', 'CRITICAL'):
+                        continue
+                    print('{}: {}: {}'.format(result.name, level, message),
+                          file=sys.stderr)
+                if result.xml is None:
+                    failed += 1
+                    continue
+                if result.valid is False:
+                    failed += 1
+                output = os.path.join(arguments['--output'],
+                                      os.path.splitext(result.name)[0] +
+                                      '.xml')
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                with open(output, 'wb') as f:
+                    f.write(result.xml)
+    except (ClientException, DiscoveryException) as e:
+        logger.error(str(e))
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+def _stdio(arguments):
+    """Answer the requests read on the standard input (co-process)."""
+    try:
+        from .server import Engine, ServerException
+        from .stdio import run, StdioException
+    except ImportError:
+        from server import Engine, ServerException
+        from stdio import run, StdioException
+
+    try:
+        engine = Engine(arguments['--xml-template'], arguments['--relaxng'],
+                        workers=int(arguments['--workers']))
+    except ServerException as e:
+        logger.error(str(e))
+        sys.exit(1)
+    # The requests and the responses are in utf-8 whatever the locale, each
+    # request is decoded separately (a line not utf-8 is answered by an
+    # error)
+    stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    try:
+        count = run(engine, sys.stdin.buffer, stdout,
+                    ordered=not arguments['--unordered'])
+        logger.info('%d requests answered', count)
+    except StdioException as e:
+        logger.error(str(e))
+        sys.exit(1)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        engine.close()
+
+
+def _check(arguments):
+    """Check the structure of the files without converting them, print all
+    the problems found."""
+    try:
+        from .lint import lint_file, ERROR
+    except ImportError:
+        from lint import lint_file, ERROR
+
+    n_files = n_errors = n_warnings = n_failed = 0
+    try:
+        for path in arguments['<paths>']:
+            for f in Discovery(path, include=arguments['--include'],
+                               exclude=arguments['--exclude'],
+                               extensions=arguments['--extension']):
+                n_files += 1
+                issues = lint_file(f.path)
+                errors = sum(issue.level == ERROR for issue in issues)
+                n_errors += errors
+                n_warnings += len(issues) - errors
+                n_failed += errors > 0
+                for issue in issues:
+                    location = f.path if issue.line is None else \
+                        '{}:{}'.format(f.path, issue.line)
+                    print('{}: {}: {}'.format(location, issue.level,
+                                              issue.message))
+    except DiscoveryException:
+        sys.exit(2)
+    print('{} files checked: {} errors, {} warnings, {} files with '
+          'errors'.format(n_files, n_errors, n_warnings, n_failed),
+          file=sys.stderr)
+    if n_failed:
+        sys.exit(1)
+
+
+def _float(value):
+    """Convert an optional command line argument in float."""
+    return float(value) if value is not None else None
+
+
+def _int(value):
+    """Convert an optional command line argument in integer."""
+    return int(value) if value is not None else None
 
 
 def main(args=None):
@@ -28,7 +271,39 @@ def main(args=None):
     Command line::
 
         Usage:
-            exegis <files>  [--relaxng=<relax>]
+            exegis merge <manifests>... [--report=<file>]
+            exegis serve [--host=<host>] [--port=<port>] [--socket=<file>]
+                         [--xml-template=<name>] [--relaxng=<name>]
+                         [--workers=<n>] [--reload-interval=<s>]
+                         [--log-level=<level>] [--log-file=<file>]
+                         [--log-dir=<dir>]
+            exegis client <paths>... [--server=<address>] [--output=<dir>]
+                          [--no-validate] [--extension=<ext>...]
+            exegis --check <paths>... [--include=<glob>...]
+                           [--exclude=<glob>...] [--extension=<ext>...]
+            exegis --stdio [--xml-template=<name>] [--relaxng=<name>]
+                           [--workers=<n>] [--unordered]
+                           [--log-level=<level>] [--log-file=<file>]
+                           [--log-dir=<dir>]
+            exegis <files> [--xml-template=<name>] [--relaxng=<name>]
+                           [--include=<glob>...] [--exclude=<glob>...]
+                           [--extension=<ext>...] [--largest-first]
+                           [--read-ahead=<n>] [--io-workers=<n>]
+                           [--workers=<n>] [--validators=<n>]
+                           [--writers=<n>] [--queue-size=<n>]
+                           [--processes=<n>] [--tune-window=<s>]
+                           [--timeout=<s>] [--cpu-time=<s>]
+                           [--max-tasks=<n>] [--max-memory=<MB>]
+                           [--retries=<n>] [--quarantine=<file>]
+                           [--shard=<i/n>] [--manifest=<file>]
+                           [--spool=<dir> [--results=<dir>] [--stale=<s>]]
+                           [--log-level=<level>] [--log-file=<file>]
+                           [--log-dir=<dir>] [--timings=<file>]
+                           [--profile=<dir> [--profile-every=<n>]]
+                           [--trace-malloc]
+                           [--metrics=<file> [--metrics-interval=<s>]]
+                           [--journal=<file> [--resume]]
+                           [--fragments=<file>]
             exegis -h | --help
             exegis --version
 
@@ -37,12 +312,73 @@ def main(args=None):
             --version                   Show version.
             --xml-template=<name>       Name of the XML template
             --relaxng=<name>            Name of the Relaxng file use to validate the resulting XML
+            --include=<glob>            Treat only the files matching the pattern (can be repeated)
+            --exclude=<glob>            Do not treat the files or folders matching the pattern (can be repeated)
+            --extension=<ext>           Extension of the files to treat (can be repeated) [default: .txt]
+            --largest-first             Treat the largest files first
+            --read-ahead=<n>            Number of files read in advance [default: 4]
+            --io-workers=<n>            Number of threads reading the files [default: 2]
+            --workers=<n>               Number of threads converting the files [default: 1]
+            --validators=<n>            Number of threads validating the XML [default: 1]
+            --writers=<n>               Number of threads writing the XML [default: 1]
+            --queue-size=<n>            Size of the queues in front of the read, validate and write stages [default: 4]
+            --processes=<n>             Number of processes converting the files (0: use the threads, auto: chosen during the run) [default: 0]
+            --tune-window=<s>           Duration of each measurement of --processes=auto (seconds) [default: 5]
+            --timeout=<s>               Wall time budget to convert a file (seconds)
+            --cpu-time=<s>              CPU time budget to convert a file (seconds, Unix only)
+            --max-tasks=<n>             Replace a process after it converted n files
+            --max-memory=<MB>           Replace a process when its memory exceeds the value
+            --retries=<n>               Number of retries for a file which crashed or timed out [default: 0]
+            --quarantine=<file>         Save the list of files which crashed or timed out (JSON lines)
+            --shard=<i/n>               Convert only the part i (1 to n) of the corpus
+            --manifest=<file>           Save the status of each file and a summary (JSON)
+            --report=<file>             Save the report merging the manifests (JSON)
+            --host=<host>               Address of the conversion server [default: 127.0.0.1]
+            --port=<port>               Port of the conversion server (default: 8642 unless --socket is given)
+            --socket=<file>             Unix socket of the conversion server
+            --reload-interval=<s>       Time between two checks of the template and Relaxng files (0: never) [default: 2]
+            --server=<address>          Address of the server, http://host:port or unix:path (default: $EXEGIS_SERVER or http://127.0.0.1:8642)
+            --output=<dir>              Folder of the XML files written by the client [default: XML]
+            --no-validate               Do not validate the XML
+            --stdio                     Read one request per line (JSON) on the standard input, write the responses on the standard output
+            --unordered                 Write the responses as soon as they are ready
+            --check                     Check the structure of the files without converting them, print all the problems found
+            --spool=<dir>               Share the corpus with the other workers using the spool directory
+            --results=<dir>             Directory for the XML files and the timing records (default: <spool>/results)
+            --stale=<s>                 Time without heartbeat before a worker is considered dead [default: 60]
+            --log-level=<level>         Level of the messages written in the log file (DEBUG, INFO, WARNING, ERROR) [default: INFO]
+            --log-file=<file>           Name of the log file (default: exegis-<date>-<time>-<pid>.log)
+            --log-dir=<dir>             Directory of the log file named after the run
+            --timings=<file>            Save the time spent in each phase of the conversion of each file (JSON lines)
+            --profile=<dir>             Save the profile (cProfile) of the conversion of the files in the directory
+            --profile-every=<n>         Profile only one file every n files [default: 1]
+            --trace-malloc              Trace the memory allocated by each phase of the conversion (in worker processes)
+            --metrics=<file>            Write the metrics of the run in the file (Prometheus text format)
+            --metrics-interval=<s>      Time between two updates of the metrics file [default: 15]
+            --journal=<file>            Append each file converted to the journal of the run (JSON lines)
+            --resume                    Do not convert again the files finished in the journal
+            --fragments=<file>          Validate only the parts of the XML which changed since the previous runs (cache of the valid parts)
 
         Examples:
             exegis TextFiles
             exegis Textfiles --xml-template=template.xml
             exegis Textfiles --relaxng=tei.rng
             exegis Textfiles --xml-template=template.xml --relaxng=tei.rng
+            exegis Textfiles --exclude=drafts --include=*_1.txt
+            exegis Textfiles --shard=1/4 --manifest=shard1.json
+            exegis merge shard1.json shard2.json shard3.json shard4.json
+            exegis serve --socket=/tmp/exegis.sock --workers=2
+            exegis client Textfiles --server=unix:/tmp/exegis.sock
+            exegis --stdio --workers=2 < requests.jsonl > responses.jsonl
+            exegis --check Textfiles
+            exegis Textfiles --spool=/shared/spool --largest-first
+            exegis Textfiles --log-level=DEBUG --log-dir=logs
+            exegis Textfiles --timings=timings.jsonl
+            exegis Textfiles --profile=profiles --profile-every=10
+            exegis Textfiles --metrics=/var/lib/node_exporter/exegis.prom
+            exegis Textfiles --journal=run.jsonl --resume
+            exegis Textfiles --processes=auto
+            exegis Textfiles --fragments=fragments.cache
 
 
     Raises
@@ -53,38 +389,215 @@ def main(args=None):
 
     arguments = docopt(main.__doc__, argv=args,
                        version=__version__)
+    if arguments['--check']:
+        # Nothing is converted, hence no log file
+        _check(arguments)
+        return
+    setup_logging(level=arguments['--log-level'],
+                  fname=(arguments['--log-file'] or
+                         log_fname(arguments['--log-dir'])))
+    try:
+        if arguments['merge']:
+            _merge(arguments['<manifests>'], arguments['--report'])
+        elif arguments['serve']:
+            _serve(arguments)
+        elif arguments['client']:
+            _client(arguments)
+        elif arguments['--stdio']:
+            _stdio(arguments)
+        else:
+            _convert(arguments)
+    finally:
+        stop_logging()
 
+
+def _convert(arguments):
+    """Convert the corpus with the options of the command line."""
     # Convert docopt results in the proper variable (change type when needed)
 
     fname = arguments['<files>']
     template_file = arguments['--xml-template']
     relaxng_file = arguments['--relaxng']
 
+    # Find the files to treat (recursively if a folder is given)
+    discovery = Discovery(fname,
+                          include=arguments['--include'],
+                          exclude=arguments['--exclude'],
+                          extensions=arguments['--extension'])
+    files = discovery
+    if arguments['--shard']:
+        try:
+            index, count = parse_shard(arguments['--shard'])
+        except ShardException as e:
+            logger.error(str(e))
+            sys.exit(1)
     try:
-        if os.path.isdir(fname):
-            directory = fname.strip(os.pathsep)
-            files = os.listdir(directory)
-        else:
-            files, directory = [fname], ''
-    except FileNotFoundError:
-        error = 'Error: path {} for text files ' \
-                'not found'.format(directory)
-        logger.error(error)
+        if arguments['--shard']:
+            files = select(discovery, index, count)
+        if arguments['--largest-first']:
+            files = largest_first(files)
+    except DiscoveryException:
         sys.exit()
 
-    for fname in files:
+    # Journal of the run, the files finished by the previous run are skipped
+    journal = None
+    if arguments['--journal']:
+        try:
+            journal = Journal(arguments['--journal'],
+                              resume=arguments['--resume'])
+        except JournalException as e:
+            logger.error(str(e))
+            sys.exit(1)
+        if arguments['--resume']:
+            files = journal.pending(files)
+
+    # Fragments of the XML already found valid by the previous runs
+    fragments = None
+    if arguments['--fragments']:
         try:
-            comtoepi = Process(fname=fname, folder=directory)
-            if template_file:
-                comtoepi.template_fname = template_file
-            if relaxng_file:
-                comtoepi.relaxng_fname = relaxng_file
-            comtoepi.main()
-        except AphorismsToXMLException:
-            error = 'Error: unable to process "{}", ' \
-                    'see log file.'.format(fname)
-            logger.error(error)
+            fragments = FragmentCache(arguments['--fragments'])
+        except FragmentsException as e:
+            logger.error(str(e))
+            sys.exit(1)
+
+    # Claim the files in the spool directory shared with the other workers
+    spool = None
+    if arguments['--spool']:
+        spool = Spool(arguments['--spool'], results=arguments['--results'],
+                      stale=float(arguments['--stale']))
+        spool.start()
+        files = chain(spool.claim(files), spool.recover())
+
+    # Worker processes supervised for the conversion (time budget,
+    # recycling). They are used automatically if a limit is given.
+    # With auto the number of processes, validators, readers and writers is
+    # increased while the throughput improves
+    auto = arguments['--processes'] == 'auto'
+    processes = 1 if auto else int(arguments['--processes'])
+    limits = dict(timeout=_float(arguments['--timeout']),
+                  cpu_time=_float(arguments['--cpu-time']),
+                  max_tasks=_int(arguments['--max-tasks']),
+                  max_memory=_float(arguments['--max-memory']),
+                  retries=int(arguments['--retries']))
+    if limits['max_memory'] is not None:
+        limits['max_memory'] *= 1024 * 1024
+    if not processes and any(value for key, value in limits.items()
+                             if key != 'retries'):
+        processes = int(arguments['--workers'])
+    # The tracing of the memory is global to a process, each conversion is
+    # traced in its own process (the threads would mix their allocations)
+    if not processes and arguments['--trace-malloc']:
+        processes = int(arguments['--workers'])
+    pool = WorkerPool(processes, **limits) if processes else None
+
+    # Profile of the conversions (cProfile, in the worker processes too)
+    profiler = Profiler(arguments['--profile'],
+                        every=int(arguments['--profile-every'])) \
+        if arguments['--profile'] else None
+
+    # discovery -> read -> convert -> validate -> write, each stage has its
+    # own threads and a bounded queue
+    read_ahead = int(arguments['--read-ahead'])
+    queue_size = int(arguments['--queue-size'])
+    stages = [Stage('read', read, workers=int(arguments['--io-workers']),
+                    maxsize=queue_size),
+              Stage('convert', partial(convert,
+                                       template_fname=template_file,
+                                       relaxng_fname=relaxng_file,
+                                       pool=pool,
+                                       output_dir=(spool.output_dir
+                                                   if spool else None),
+                                       profiler=profiler,
+                                       trace_malloc=arguments[
+                                           '--trace-malloc']),
+                    workers=processes or int(arguments['--workers']),
+                    maxsize=read_ahead),
+              Stage('validate', partial(validate, fragments=fragments),
+                    workers=int(arguments['--validators']),
+                    maxsize=queue_size,
+                    # The validators added by the auto-tuning are measured
+                    # once their Relaxng schema is compiled
+                    initializer=(partial(warm, template_file, relaxng_file)
+                                 if auto and fragments is None else None)),
+              Stage('write', write, workers=int(arguments['--writers']),
+                    maxsize=queue_size)]
+    records, quarantine = [], []
+    statistics = PhaseStatistics()
+    timings = TimingsFile(arguments['--timings']) \
+        if arguments['--timings'] else None
+    metrics = Metrics()
+    metrics_writer = None
+    if arguments['--metrics']:
+        metrics_writer = MetricsWriter(
+            metrics, arguments['--metrics'],
+            interval=float(arguments['--metrics-interval']))
+        metrics_writer.start()
+    pipeline = Pipeline(stages, on_done=partial(_done, records=records,
+                                                quarantine=quarantine,
+                                                spool=spool,
+                                                statistics=statistics,
+                                                timings=timings,
+                                                metrics=metrics,
+                                                journal=journal))
+    tuner = AutoTuner(pipeline, pool,
+                      window=float(arguments['--tune-window'])) \
+        if auto else None
+
+    if tuner is not None:
+        tuner.start()
+    try:
+        pipeline.run(Job(f.path, f.relpath, f.size) for f in files)
+    except DiscoveryException:
+        sys.exit()
+    finally:
+        if tuner is not None:
+            tuner.stop()
+        if pool is not None:
+            pool.close()
+        if spool is not None:
+            spool.stop()
+        if timings is not None:
+            timings.close()
+        if metrics_writer is not None:
+            metrics_writer.stop()
+        if journal is not None:
+            journal.close()
+        if fragments is not None:
+            fragments.save()
+
+    if arguments['--manifest']:
+        save_manifest(arguments['--manifest'], records,
+                      shard=arguments['--shard'], elapsed=pipeline.elapsed)
+
+    if profiler is not None:
+        profile_fname = profiler.aggregate()
+        if profile_fname is not None:
+            print('Profile of the corpus saved in {}'.format(profile_fname))
+
+    if arguments['--quarantine']:
+        with open(arguments['--quarantine'], 'w', encoding="utf-8") as f:
+            for entry in quarantine:
+                f.write(json.dumps(entry) + '\n')
 
+    if os.path.isdir(fname):
+        print(discovery.summary())
+        print(pipeline.report())
+        print(statistics.report())
+        if arguments['--trace-malloc']:
+            print(statistics.memory_report())
+        if pool is not None:
+            print(pool.summary())
+        if tuner is not None:
+            print(tuner.summary())
+        if quarantine:
+            print('{} files in quarantine'.format(len(quarantine)))
+        if spool is not None:
+            print(spool.summary())
+        if journal is not None and journal.resume:
+            print(journal.summary())
+        if fragments is not None:
+            print(fragments.summary())
+        print(metrics.summary(pipeline.elapsed))
     logger.info("Finished " + logger.name)
 
 
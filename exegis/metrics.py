@@ -0,0 +1,221 @@
+"""Module which contains the metrics of the conversion of a corpus.
+
+The counters (files converted, failed, invalid, bytes read and written,
+footnotes of each kind) and the histograms (time spent in each phase) are
+written in a file with the text format of Prometheus. The file is replaced
+atomically at regular intervals during the run and can be read by the
+*textfile* collector of the node exporter::
+
+    exegis texts --metrics=/var/lib/node_exporter/exegis.prom
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import time
+import bisect
+import threading
+
+try:
+    from .baseclass import logger
+except ImportError:
+    from baseclass import logger
+
+# Upper bounds (seconds) of the buckets of the histograms
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1., 5., 10., 30., 60.)
+
+# Description of the metrics (HELP line)
+METRICS = {
+    'files_total': ('counter', 'Files treated by status'),
+    'input_bytes_total': ('counter', 'Bytes of the text files treated'),
+    'output_bytes_total': ('counter', 'Bytes of the XML files written'),
+    'footnotes_total': ('counter', 'Footnotes converted by kind'),
+    'quarantined_total': ('counter', 'Files which crashed or timed out'),
+    'phase_seconds': ('histogram', 'Time spent in each phase of the '
+                                   'conversion of a file'),
+    'elapsed_seconds': ('gauge', 'Duration of the run'),
+    'last_update_timestamp_seconds': ('gauge', 'Time of the last update '
+                                               'of the metrics'),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+class Metrics(object):
+    """Class which collects the counters and the histograms of a run.
+
+    The methods can be called by several threads.
+
+    Attributes
+    ----------
+    prefix : str, optional
+        prefix of the name of the metrics. Default: ``exegis``
+
+    counters : dict
+        value of each counter, the key is the name and the labels.
+
+    histograms : dict
+        number of observations in each bucket, sum and number of the
+        observations of each histogram.
+    """
+    def __init__(self, prefix='exegis'):
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add an observation to an histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(BUCKETS), 0., 0]
+            buckets, _, _ = histogram = self.histograms[key]
+            index = bisect.bisect_left(BUCKETS, value)
+            if index < len(BUCKETS):
+                buckets[index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def add_job(self, job):
+        """Update the metrics with a job at the end of the pipeline
+        (see :class:`~exegis.pipeline.Job`)."""
+        self.inc('files_total', status=job.status)
+        self.inc('input_bytes_total', job.size)
+        self.inc('output_bytes_total', job.output_size)
+        if job.quarantined:
+            self.inc('quarantined_total')
+        for kind, count in job.stats.get('footnote_kinds', {}).items():
+            self.inc('footnotes_total', count, kind=kind)
+        for phase, seconds in job.timing_record()['phases'].items():
+            self.observe('phase_seconds', seconds, phase=phase)
+
+    def total(self, name):
+        """Return the sum of a counter over all its labels."""
+        with self._lock:
+            return sum(value for (key, _), value in self.counters.items()
+                       if key == name)
+
+    def text(self):
+        """Return the metrics in the text format of Prometheus."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2]))
+                                for key, h in self.histograms.items())
+        now = time.time()
+        gauges = [(('elapsed_seconds', ()), now - self.start),
+                  (('last_update_timestamp_seconds', ()), now)]
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                kind, description = METRICS.get(name, ('untyped', name))
+                lines.append('# HELP {}_{} {}'.format(self.prefix, name,
+                                                      description))
+                lines.append('# TYPE {}_{} {}'.format(self.prefix, name,
+                                                      kind))
+                described.add(name)
+
+        for (name, labels), value in counters + gauges:
+            describe(name)
+            lines.append('{}_{}{} {}'.format(self.prefix, name,
+                                             _labels(labels), value))
+        for (name, labels), (buckets, total, count) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append('{}_{}_bucket{} {}'.format(
+                    self.prefix, name,
+                    _labels(labels + (('le', bound),)), cumulative))
+            lines.append('{}_{}_bucket{} {}'.format(
+                self.prefix, name, _labels(labels + (('le', '+Inf'),)),
+                count))
+            lines.append('{}_{}_sum{} {}'.format(self.prefix, name,
+                                                 _labels(labels), total))
+            lines.append('{}_{}_count{} {}'.format(self.prefix, name,
+                                                   _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, fname):
+        """Write the metrics in a file, the file is replaced atomically (a
+        reader never sees a partial file)."""
+        tmp = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp, 'w', encoding="utf-8") as f:
+            f.write(self.text())
+        os.replace(tmp, fname)
+
+    def summary(self, elapsed):
+        """Return a string with the throughput of the run."""
+        files = self.total('files_total')
+        size = self.total('input_bytes_total') / 1024. / 1024.
+        if elapsed <= 0:
+            return '{} files, {:.3f} MB'.format(files, size)
+        return ('{} files, {:.3f} MB in {:.3f} s: {:.2f} files/s, '
+                '{:.3f} MB/s'.format(files, size, elapsed, files / elapsed,
+                                     size / elapsed))
+
+
+class MetricsWriter(object):
+    """Class which writes the metrics in a file at regular intervals (in a
+    thread) until it is stopped.
+
+    Attributes
+    ----------
+    metrics : Metrics
+        metrics written.
+
+    fname : str
+        name of the file.
+
+    interval : float, optional
+        time (seconds) between two updates. Default: 15
+    """
+    def __init__(self, metrics, fname, interval=15.):
+        self.metrics = metrics
+        self.fname = fname
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            self.metrics.write(self.fname)
+        except OSError as e:
+            logger.warning('Unable to write the metrics in %s: %s',
+                           self.fname, e)
+
+    def start(self):
+        """Write the metrics and start the thread."""
+        self._write()
+        self._thread = threading.Thread(target=self._run, name='metrics',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write the final metrics."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write()
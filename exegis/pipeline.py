@@ -0,0 +1,678 @@
+"""Module which contains the classes used to convert a corpus of exegis
+text files as a pipeline.
+
+Each file found is wrapped in a :class:`Job` which goes through a succession
+of :class:`Stage`. Every stage has its own pool of threads and a bounded
+queue: the files are read in advance while the previous one is converted,
+validated and written by the next stages. When a stage is slower than the
+previous one, its queue is full and the previous stage waits
+(backpressure); the number of files in memory is limited by the size of the
+queues whatever the size of the corpus.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import time
+import queue
+import threading
+
+try:
+    from .aphorisms_to_xml import (Process, AphorismsToXMLException,
+                                   validate_xml, relaxng_validator)
+    from .baseclass import logger
+    from .pool import TaskError, WorkerTimeout, WorkerCrash
+    from .profiling import profile, start_trace_malloc
+    from .journal import text_hash
+    from .fragments import validate_fragments, FragmentsException
+except ImportError:
+    from aphorisms_to_xml import (Process, AphorismsToXMLException,
+                                  validate_xml, relaxng_validator)
+    from baseclass import logger
+    from pool import TaskError, WorkerTimeout, WorkerCrash
+    from profiling import profile, start_trace_malloc
+    from journal import text_hash
+    from fragments import validate_fragments, FragmentsException
+
+
+# Object put in the queues to stop the workers
+_STOP = object()
+
+
+# Define an Exception
+class PipelineException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+class Job(object):
+    """Class which contains a file going through the pipeline.
+
+    Attributes
+    ----------
+    path : str
+        path of the text file to convert.
+
+    relpath : str
+        path relative to the corpus folder (used in the messages).
+
+    size : int
+        size of the text file in bytes.
+
+    text : str
+        content of the text file once read.
+
+    text_hash : str
+        hash of the text (see :func:`exegis.journal.text_hash`).
+
+    xml : str
+        XML produced by the conversion.
+
+    output : str
+        name of the XML file to write.
+
+    output_size : int
+        size of the XML file written in bytes.
+
+    output_hash : str
+        hash of the XML written.
+
+    relaxng_fname : str
+        name of the Relaxng file used to validate the XML.
+
+    status : str
+        ``pending``, ``ok``, ``invalid`` (XML created but not valid) or
+        ``failed``.
+
+    error : str
+        description of the problem if the status is ``failed`` or
+        ``invalid``.
+
+    quarantined : bool
+        True if the conversion crashed or timed out.
+
+    timings : dict
+        time spent (seconds) by each stage on the job.
+
+    stats : dict
+        size of the document and time spent in the phases of the conversion
+        (see :meth:`exegis.timings.Timings.record`).
+    """
+    def __init__(self, path, relpath=None, size=0):
+        self.path = path
+        self.relpath = relpath if relpath is not None else path
+        self.size = size
+        self.text = None
+        self.text_hash = None
+        self.xml = None
+        self.output = None
+        self.output_size = 0
+        self.output_hash = None
+        self.relaxng_fname = None
+        self.status = 'pending'
+        self.error = None
+        self.quarantined = False
+        self.timings = {}
+        self.stats = {}
+
+    def record(self):
+        """Return a dictionary which describe the result of the job."""
+        return {'path': self.relpath,
+                'size': self.size,
+                'status': self.status,
+                'output': self.output,
+                'output_size': self.output_size,
+                'error': self.error,
+                'quarantined': self.quarantined,
+                'timings': self.timings}
+
+    def timing_record(self):
+        """Return a dictionary with the size of the document and the time
+        spent in each phase (the reading, the validation and the writing
+        are the stages of the pipeline)."""
+        record = {'path': self.relpath, 'size': self.size,
+                  'status': self.status}
+        record.update(self.stats)
+        phases = dict(self.stats.get('phases', {}))
+        for stage, phase in (('read', 'open_document'),
+                             ('validate', 'validate'),
+                             ('write', 'save_xml')):
+            if stage in self.timings:
+                phases[phase] = self.timings[stage]
+        record['phases'] = phases
+        return record
+
+    def fail(self, error):
+        """Mark the job as failed, the next stages will not treat it."""
+        self.status = 'failed'
+        self.error = error
+        self.text = None
+        self.xml = None
+
+
+class Stage(object):
+    """Class which apply a function to the jobs of a bounded queue with a
+    pool of threads.
+
+    The jobs are sent to the next stage when treated. A failed job is not
+    given to the function of the following stages but still goes through
+    them to reach the end of the pipeline.
+
+    Attributes
+    ----------
+    name : str
+        name of the stage (used in the report).
+
+    func : callable
+        function called with the job as argument. An exception raised by the
+        function marks the job as failed.
+
+    workers : int, optional
+        number of threads. Default: 1
+
+    maxsize : int, optional
+        size of the queue in front of the stage. Default: twice the number
+        of workers.
+
+    initializer : callable, optional
+        function called without argument by each thread when it starts,
+        before its first job (e.g. compilation of the Relaxng schema).
+
+    ready : int
+        number of threads running which have finished their initializer.
+
+    n_jobs : int
+        number of jobs treated.
+
+    n_bytes : int
+        size of the text files of the jobs treated.
+
+    busy : float
+        time spent in the function (seconds, summed over the threads).
+
+    starved : float
+        time spent by the threads waiting for a job.
+
+    blocked : float
+        time spent waiting for a free place in the queue of the next stage
+        (backpressure).
+
+    max_depth : int
+        maximum number of jobs seen waiting in the queue.
+
+    mean_depth : float
+        mean number of jobs seen waiting in the queue.
+    """
+    def __init__(self, name, func, workers=1, maxsize=None,
+                 initializer=None):
+        self.name = name
+        self.func = func
+        self.initializer = initializer
+        self.ready = 0
+        self.workers = max(1, int(workers))
+        if maxsize is None:
+            maxsize = 2 * self.workers
+        self.queue = queue.Queue(max(1, int(maxsize)))
+        self.next = None
+        self.on_done = None
+
+        self.n_jobs = 0
+        self.n_bytes = 0
+        self.busy = 0.
+        self.starved = 0.
+        self.blocked = 0.
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self._n_started = 0
+        self._retire = 0
+        self._stopping = False
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._run,
+                                  name='{}-{}'.format(self.name,
+                                                      self._n_started),
+                                  daemon=True)
+        self._n_started += 1
+        self._threads.append(thread)
+        thread.start()
+
+    def start(self):
+        """Start the threads of the stage."""
+        with self._lock:
+            for _ in range(self.workers):
+                self._start_thread()
+
+    def resize(self, workers):
+        """Change the number of threads of a running stage.
+
+        The threads in excess stop after their current job.
+        """
+        workers = max(1, int(workers))
+        with self._lock:
+            if self._stopping:
+                return
+            if not self._threads:
+                self.workers = workers
+                return
+            running = len(self._threads) - self._retire
+            if workers > running:
+                # Cancel the retirements first
+                cancelled = min(self._retire, workers - running)
+                self._retire -= cancelled
+                for _ in range(workers - running - cancelled):
+                    self._start_thread()
+            else:
+                self._retire += running - workers
+            self.workers = workers
+
+    def put(self, job):
+        """Put a job in the queue of the stage.
+
+        Returns
+        -------
+        float
+            time spent waiting for a free place in the queue.
+        """
+        start = time.perf_counter()
+        self.queue.put(job)
+        return time.perf_counter() - start
+
+    def stop(self):
+        """Stop the threads once the jobs already in the queue are treated
+        and wait for them.
+        """
+        with self._lock:
+            self._stopping = True
+            self._retire = 0
+            threads = list(self._threads)
+        for _ in threads:
+            self.queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+        self._threads = []
+        self._stopping = False
+
+    def _run(self):
+        if self.initializer is not None:
+            try:
+                self.initializer()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Initialisation of a thread of the stage '
+                                 '%s failed', self.name)
+        with self._lock:
+            self.ready += 1
+        try:
+            self._loop()
+        finally:
+            with self._lock:
+                self.ready -= 1
+
+    def _loop(self):
+        while True:
+            start = time.perf_counter()
+            depth = self.queue.qsize()
+            job = self.queue.get()
+            got = time.perf_counter()
+            if job is _STOP:
+                with self._lock:
+                    self.starved += got - start
+                return
+
+            if job.status != 'failed':
+                try:
+                    self.func(job)
+                except Exception as e:  # pylint: disable=broad-except
+                    error = str(e) or e.__class__.__name__
+                    job.fail(error)
+                    if not isinstance(e, (AphorismsToXMLException,
+                                          PipelineException)):
+                        logger.exception('Stage %s failed on %s',
+                                         self.name, job.relpath)
+            done = time.perf_counter()
+            job.timings[self.name] = done - got
+
+            if self.next is not None:
+                blocked = self.next.put(job)
+            else:
+                blocked = 0.
+                if self.on_done is not None:
+                    try:
+                        self.on_done(job)
+                    except Exception as e:  # pylint: disable=broad-except
+                        # The thread must survive to drain the pipeline
+                        job.fail(str(e) or e.__class__.__name__)
+                        logger.exception('End of the job %s failed',
+                                         job.relpath)
+
+            with self._lock:
+                self.n_jobs += 1
+                self.n_bytes += job.size
+                self.starved += got - start
+                self.busy += done - got
+                self.blocked += blocked
+                self.max_depth = max(self.max_depth, depth)
+                self._depth_sum += depth
+                # The stage has been resized, the thread is not needed
+                if self._retire > 0:
+                    self._retire -= 1
+                    self._threads.remove(threading.current_thread())
+                    return
+
+    @property
+    def mean_depth(self):
+        """Mean number of jobs waiting in the queue."""
+        return self._depth_sum / self.n_jobs if self.n_jobs else 0.
+
+    def throughput(self, elapsed):
+        """Number of jobs treated per second during ``elapsed`` seconds."""
+        return self.n_jobs / elapsed if elapsed > 0 else 0.
+
+    def utilisation(self, elapsed):
+        """Fraction of the time the threads spent working during
+        ``elapsed`` seconds.
+        """
+        if elapsed <= 0:
+            return 0.
+        return self.busy / (self.workers * elapsed)
+
+
+class Pipeline(object):
+    """Class which chain stages and feed them with jobs.
+
+    Attributes
+    ----------
+    stages : list
+        :class:`Stage` objects in the order the jobs go through them.
+
+    on_done : callable, optional
+        function called with each job at the end of the pipeline. An
+        exception raised by the function is logged and the job failed.
+
+    blocked : float
+        time spent by the feeder waiting for a free place in the first
+        queue.
+
+    elapsed : float
+        duration of the run (seconds).
+    """
+    def __init__(self, stages, on_done=None):
+        if not stages:
+            raise PipelineException('A pipeline needs at least one stage')
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next = next_stage
+        stages[-1].on_done = on_done
+        self.blocked = 0.
+        self.elapsed = 0.
+
+    def run(self, jobs):
+        """Treat the jobs and wait until they reach the end of the pipeline.
+
+        Parameters
+        ----------
+        jobs : iterable
+            :class:`Job` objects, consumed as the first queue has room.
+        """
+        start = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        try:
+            for job in jobs:
+                self.blocked += self.stages[0].put(job)
+        finally:
+            # Stop in order: a stage is stopped when the previous one
+            # has pushed all its jobs.
+            for stage in self.stages:
+                stage.stop()
+            self.elapsed = time.perf_counter() - start
+
+    def bottleneck(self):
+        """Return the stage with the highest utilisation."""
+        return max(self.stages, key=lambda st: st.utilisation(self.elapsed))
+
+    def report(self):
+        """Return a string with the statistics of the stages."""
+        lines = ['{:<10} {:>7} {:>7} {:>8} {:>6} {:>9} {:>11} {:>11} '
+                 '{:>9} {:>10}'.format('stage', 'workers', 'files',
+                                       'files/s', 'util', 'busy (s)',
+                                       'starved (s)', 'blocked (s)',
+                                       'max queue', 'mean queue')]
+        for stage in self.stages:
+            lines.append('{:<10} {:>7} {:>7} {:>8.2f} {:>5.0%} {:>9.3f} '
+                         '{:>11.3f} {:>11.3f} {:>9} {:>10.1f}'.format(
+                             stage.name, stage.workers, stage.n_jobs,
+                             stage.throughput(self.elapsed),
+                             stage.utilisation(self.elapsed), stage.busy,
+                             stage.starved, stage.blocked, stage.max_depth,
+                             stage.mean_depth))
+        lines.append('Feeder blocked {:.3f} s, total {:.3f} s, '
+                     'bottleneck: {}'.format(self.blocked, self.elapsed,
+                                             self.bottleneck().name))
+        return '\n'.join(lines)
+
+
+def read(job):
+    """Read and decode the text file of the job."""
+    try:
+        with open(job.path, 'r', encoding="utf-8") as f:
+            job.text = f.read()
+        job.text_hash = text_hash(job.text)
+        return
+    except UnicodeDecodeError:
+        error = 'File {} is not treatable by the software'.format(job.relpath)
+    except OSError as e:
+        error = 'File {} cannot be read: {}'.format(job.relpath, e)
+    logger.info(error)
+    raise PipelineException(error)
+
+
+def output_name(relpath, output_dir=None):
+    """Return the name of the XML file of a text file.
+
+    The relative path of the text file is kept, two files with the same name
+    in different folders of the corpus give different XML files.
+
+    Parameters
+    ----------
+    relpath : str
+        path of the text file relative to the folder of the corpus.
+
+    output_dir : str, optional
+        folder of the XML files. Default: ``XML``
+
+    Returns
+    -------
+    str
+        name of the XML file.
+    """
+    if os.path.isabs(relpath) or os.pardir in relpath.split(os.sep):
+        # Outside of the corpus, only the name of the file is kept
+        relpath = os.path.basename(relpath)
+    return os.path.join(output_dir or 'XML',
+                        os.path.splitext(relpath)[0] + '.xml')
+
+
+def render(path, text, template_fname=None, relaxng_fname=None,
+           profile_fname=None, trace_malloc=False):
+    """Convert a text in XML.
+
+    This function is executed in the worker processes when a
+    :class:`~exegis.pool.WorkerPool` is used.
+
+    Parameters
+    ----------
+    path : str
+        name of the text file (used for the document number and the name of
+        the XML file).
+
+    text : str
+        content of the file.
+
+    template_fname : str, optional
+        name of the XML template.
+
+    relaxng_fname : str, optional
+        name of the Relaxng file used for the validation (by default the
+        one declared in the template).
+
+    profile_fname : str, optional
+        if given the conversion is profiled (:mod:`cProfile`) and the
+        profile saved in this file.
+
+    trace_malloc : bool, optional
+        if True the memory allocated by each phase of the conversion is
+        traced. Default: False
+
+    Returns
+    -------
+    tuple
+        the XML, the name of the XML file, the name of the Relaxng file, the
+        timings of the conversion (see :meth:`exegis.timings.Timings.record`)
+        and True if the anchors and the apparatus correspond (see
+        :class:`exegis.anchors.Anchors`).
+    """
+    if profile_fname:
+        return profile(profile_fname, render, path, text, template_fname,
+                       relaxng_fname, None, trace_malloc)
+
+    comtoepi = Process(fname=os.path.basename(path),
+                       folder=os.path.dirname(path))
+    if trace_malloc:
+        start_trace_malloc()
+        comtoepi.timings.trace_malloc = True
+    if template_fname:
+        comtoepi.template_fname = template_fname
+    if relaxng_fname:
+        comtoepi.relaxng_fname = relaxng_fname
+    comtoepi.open_document(text=text)
+    comtoepi.convert()
+    return (comtoepi.xml, comtoepi.xml_file, comtoepi.relaxng_fname,
+            comtoepi.timings.record(), comtoepi.consistent)
+
+
+def convert(job, template_fname=None, relaxng_fname=None, pool=None,
+            output_dir=None, profiler=None, trace_malloc=False):
+    """Convert the text of the job in XML.
+
+    Parameters
+    ----------
+    job : Job
+        job with the text read.
+
+    template_fname : str, optional
+        name of the XML template.
+
+    relaxng_fname : str, optional
+        name of the Relaxng file used for the validation.
+
+    pool : WorkerPool, optional
+        pool of processes used for the conversion. If None the conversion
+        is done in the thread of the stage.
+
+    output_dir : str, optional
+        folder where the XML is written (see :func:`output_name`), the
+        relative path of the text file is kept. By default the XML is written
+        in the folder ``XML`` of the working directory.
+
+    profiler : Profiler, optional
+        chooses the files profiled and the name of their profile.
+
+    trace_malloc : bool, optional
+        if True the memory allocated by each phase of the conversion is
+        traced. The tracing is global to the process, the measures are right
+        only with a pool or with a single thread. Default: False
+    """
+    profile_fname = profiler.fname(job.relpath) if profiler else None
+    args = (job.path, job.text, template_fname, relaxng_fname,
+            profile_fname, trace_malloc)
+    if pool is None:
+        result = render(*args)
+    else:
+        try:
+            result = pool.run(render, *args)
+        except TaskError as e:
+            raise PipelineException(str(e) or e.name)
+        except (WorkerTimeout, WorkerCrash) as e:
+            job.quarantined = True
+            error = 'Conversion of {} stopped: {}'.format(job.relpath, e)
+            logger.error(error)
+            raise PipelineException(error)
+    job.text = None
+    job.xml, job.output, job.relaxng_fname, job.stats, consistent = result
+    if not consistent:
+        # Not valid whatever the Relaxng validation says
+        job.status = 'invalid'
+        job.error = 'Footnotes not consistent with the apparatus'
+    job.output = output_name(job.relpath, output_dir)
+
+
+def warm(template_fname=None, relaxng_fname=None):
+    """Compile the Relaxng schema used by :func:`validate` for the current
+    thread (initializer of the threads of the validation).
+
+    Parameters
+    ----------
+    template_fname : str, optional
+        name of the XML template, the Relaxng file declared in it is used
+        if ``relaxng_fname`` is not given.
+
+    relaxng_fname : str, optional
+        name of the Relaxng file.
+    """
+    if not relaxng_fname:
+        comtoepi = Process()
+        if template_fname:
+            comtoepi.template_fname = template_fname
+        comtoepi.read_template()
+        relaxng_fname = comtoepi.relaxng_fname
+    relaxng_validator(relaxng_fname)
+
+
+def validate(job, fragments=None):
+    """Validate the XML of the job with the Relaxng file.
+
+    An XML not valid is still written but the job has the status
+    ``invalid``. A job already ``invalid`` (see :func:`convert`) is not
+    validated.
+
+    Parameters
+    ----------
+    job : Job
+        job with the XML.
+
+    fragments : exegis.fragments.FragmentCache, optional
+        if given only the fragments of the XML which are not in the cache
+        are validated (see :func:`exegis.fragments.validate_fragments`),
+        otherwise the whole document.
+    """
+    if job.status == 'invalid':
+        return
+    try:
+        if fragments is not None:
+            validate_fragments(job.xml, job.relaxng_fname, fragments,
+                               job.output)
+        else:
+            validate_xml(job.xml, job.relaxng_fname, job.output)
+        job.status = 'ok'
+    except (AphorismsToXMLException, FragmentsException):
+        job.status = 'invalid'
+        job.error = 'XML not valid'
+
+
+def write(job):
+    """Write the XML of the job (also when not valid)."""
+    if job.xml is None:
+        return
+    folder = os.path.dirname(job.output)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(job.output, 'w', encoding="utf-8") as f:
+        f.write(job.xml)
+        job.output_size = f.tell()
+    job.output_hash = text_hash(job.xml)
+    job.xml = None
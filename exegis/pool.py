@@ -0,0 +1,371 @@
+"""Module which contains the pool of processes used to convert the files.
+
+The conversion of a pathological file (e.g. a gigantic line, a runaway
+footnote sequence) can take a very long time or crash the interpreter. The
+conversions are then done in worker processes supervised by the
+:class:`WorkerPool`:
+
+- a file which takes more than a wall time (or CPU time) budget is stopped
+  and the worker replaced,
+- a worker which dies is replaced,
+- a worker is recycled after a number of files or when its memory exceeds
+  a ceiling,
+- the files which crash or time out can be retried.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import sys
+import queue
+import logging
+import signal
+import threading
+import multiprocessing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from .baseclass import logger
+    from .conf import log_to_queue, worker_queue
+except ImportError:
+    from baseclass import logger
+    from conf import log_to_queue, worker_queue
+
+
+# Define an Exception
+class PoolException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+class WorkerTimeout(PoolException):
+    """Exception raised when a file exceeds its time budget"""
+    pass
+
+
+class WorkerCrash(PoolException):
+    """Exception raised when a worker dies while treating a file"""
+    pass
+
+
+class TaskError(PoolException):
+    """Exception raised in the parent when the function raised an exception
+    in the worker. The name of the class of the original exception is kept
+    in the attribute ``name``.
+    """
+    def __init__(self, name, message):
+        PoolException.__init__(self, message)
+        self.name = name
+
+
+def _peak_memory():
+    """Return the peak resident memory of the process in bytes (0 if
+    unknown)."""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _cpu_time_exceeded(signum, frame):
+    raise WorkerTimeout('CPU time budget exceeded')
+
+
+def _worker(conn, cpu_time, log_queue=None, log_level=logging.DEBUG):
+    """Loop executed by the worker processes.
+
+    Receive ``(func, args)`` from the connection, send back
+    ``(status, result, peak memory)``. Stop when ``None`` is received.
+    The log records are sent to ``log_queue`` if given.
+    """
+    if log_queue is not None:
+        log_to_queue(log_queue, log_level)
+    use_timer = cpu_time and hasattr(signal, 'setitimer')
+    if use_timer:
+        signal.signal(signal.SIGPROF, _cpu_time_exceeded)
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if task is None:
+            return
+
+        func, args = task
+        try:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_PROF, cpu_time)
+            try:
+                result = ('ok', func(*args))
+            finally:
+                if use_timer:
+                    signal.setitimer(signal.ITIMER_PROF, 0)
+        except WorkerTimeout as e:
+            result = ('timeout', str(e))
+        except Exception as e:  # pylint: disable=broad-except
+            result = ('error', (e.__class__.__name__, str(e)))
+        conn.send(result + (_peak_memory(),))
+
+
+class _Worker(object):
+    """A worker process and the end of the pipe used to talk to it."""
+    def __init__(self, context, cpu_time, log_queue=None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker,
+                                       args=(child_conn, cpu_time, log_queue,
+                                             logging.getLogger().level),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.n_tasks = 0
+
+    def stop(self, kill=False):
+        """Stop the process (immediately if kill is True)."""
+        if not kill:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                kill = True
+        if kill:
+            self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(object):
+    """Class which run functions in a pool of supervised processes.
+
+    :meth:`run` can be called from several threads at the same time, each
+    call uses one worker.
+
+    Attributes
+    ----------
+    workers : int, optional
+        number of processes. Default: 2
+
+    timeout : float, optional
+        wall time budget (seconds) of a call. Default: no limit
+
+    cpu_time : float, optional
+        CPU time budget (seconds) of a call (Unix only). Default: no limit
+
+    max_tasks : int, optional
+        number of calls after which a worker is replaced.
+        Default: no limit
+
+    max_memory : int, optional
+        peak memory (bytes) after which a worker is replaced.
+        Default: no limit
+
+    retries : int, optional
+        number of times a call which crashed or timed out is done again.
+        Default: 0
+
+    log_queue : multiprocessing.Queue, optional
+        queue where the workers send their log records (see
+        :func:`exegis.conf.worker_queue`). Default: the queue of
+        :func:`~exegis.conf.worker_queue` if the logging has been
+        configured by :func:`~exegis.conf.setup_logging`, otherwise the
+        workers use the logging configuration inherited from the parent.
+
+    start_method : str, optional
+        method used to start the processes (``fork``, ``spawn`` or
+        ``forkserver``). Default: the default of the platform.
+
+    n_timeouts, n_crashes, n_recycled : int
+        statistics of the pool.
+
+    peak_memory : int
+        highest peak memory (bytes) reported by a worker.
+    """
+    def __init__(self, workers=2, timeout=None, cpu_time=None,
+                 max_tasks=None, max_memory=None, retries=0,
+                 log_queue=None, start_method=None):
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.retries = retries
+        self.log_queue = log_queue if log_queue is not None \
+            else worker_queue()
+
+        self.n_timeouts = 0
+        self.n_crashes = 0
+        self.n_recycled = 0
+        self.peak_memory = 0
+        self._retire = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._all = []
+        for _ in range(self.workers):
+            self._idle.put(self._start())
+
+    def _start(self):
+        worker = _Worker(self._context, self.cpu_time, self.log_queue)
+        with self._lock:
+            self._all.append(worker)
+        return worker
+
+    def _replace(self, worker, kill):
+        worker.stop(kill=kill)
+        with self._lock:
+            self._all.remove(worker)
+        return self._start()
+
+    def _call(self, worker, func, args):
+        """Do one call with the worker.
+
+        Returns
+        -------
+        worker : _Worker
+            the worker to put back in the pool (a new one if the previous
+            has been replaced).
+
+        outcome : object
+            the value returned by func or the exception
+            (:class:`WorkerTimeout`, :class:`WorkerCrash` or
+            :class:`TaskError`) to raise.
+        """
+        try:
+            worker.conn.send((func, args))
+            if not worker.conn.poll(self.timeout):
+                with self._lock:
+                    self.n_timeouts += 1
+                worker = self._replace(worker, kill=True)
+                return worker, WorkerTimeout('wall time budget of {} s '
+                                             'exceeded'.format(self.timeout))
+            status, result, memory = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(1)
+            exitcode = worker.process.exitcode
+            with self._lock:
+                self.n_crashes += 1
+            worker = self._replace(worker, kill=True)
+            return worker, WorkerCrash('worker died (exit code '
+                                       '{})'.format(exitcode))
+
+        worker.n_tasks += 1
+        with self._lock:
+            self.peak_memory = max(self.peak_memory, memory)
+        if (self.max_tasks and worker.n_tasks >= self.max_tasks) or \
+                (self.max_memory and memory > self.max_memory):
+            logger.debug('Recycle worker %d after %d files (%d bytes)',
+                         worker.process.pid, worker.n_tasks, memory)
+            with self._lock:
+                self.n_recycled += 1
+            worker = self._replace(worker, kill=False)
+
+        if status == 'timeout':
+            with self._lock:
+                self.n_timeouts += 1
+            return worker, WorkerTimeout(result)
+        if status == 'error':
+            return worker, TaskError(*result)
+        return worker, result
+
+    def run(self, func, *args):
+        """Call ``func(*args)`` in a worker and return the result.
+
+        ``func`` and the arguments have to be picklable.
+
+        Raises
+        ------
+        WorkerTimeout
+            if the call exceeded the time budget (after the retries).
+
+        WorkerCrash
+            if the worker died (after the retries).
+
+        TaskError
+            if func raised an exception (never retried).
+        """
+        attempt = 0
+        while True:
+            worker = self._idle.get()
+            try:
+                worker, outcome = self._call(worker, func, args)
+            finally:
+                self._release(worker)
+
+            if isinstance(outcome, (WorkerTimeout, WorkerCrash)) and \
+                    attempt < self.retries:
+                attempt += 1
+                logger.warning('%s, retry %d/%d', outcome, attempt,
+                               self.retries)
+                continue
+            if isinstance(outcome, PoolException):
+                raise outcome
+            return outcome
+
+    def _release(self, worker):
+        """Put the worker back in the pool, or stop it if the pool has been
+        reduced."""
+        with self._lock:
+            retire = self._retire > 0 and worker in self._all
+            if retire:
+                self._retire -= 1
+                self._all.remove(worker)
+        if retire:
+            worker.stop()
+        else:
+            self._idle.put(worker)
+
+    def resize(self, workers):
+        """Change the number of processes.
+
+        The processes in excess are stopped when they are idle.
+        """
+        workers = max(1, int(workers))
+        with self._lock:
+            if self._closed:
+                return
+            running = len(self._all) - self._retire
+            cancelled = min(self._retire, max(0, workers - running))
+            self._retire -= cancelled
+            self.workers = workers
+        for _ in range(workers - running - cancelled):
+            self._idle.put(self._start())
+        for _ in range(running - workers):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    self._retire += 1
+                continue
+            with self._lock:
+                self._all.remove(worker)
+            worker.stop()
+
+    def close(self):
+        """Stop all the workers."""
+        with self._lock:
+            self._closed = True
+            workers, self._all = self._all, []
+        for worker in workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self):
+        """Return a string which summarise the incidents of the pool."""
+        return ('{} worker processes: {} timeouts, {} crashes, '
+                '{} recycled'.format(self.workers, self.n_timeouts,
+                                     self.n_crashes, self.n_recycled))
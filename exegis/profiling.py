@@ -0,0 +1,108 @@
+"""Module which contains the tools used to profile the conversion of the
+files of a corpus.
+
+The conversion of a file can be done under :mod:`cProfile`, the profile is
+saved in a ``.pstats`` file (one per file) which can be read with
+:mod:`pstats` or tools like snakeviz. Only one file every ``n`` files can
+be profiled to keep the overhead low on a large corpus, the profiles are
+merged in one profile for the corpus at the end of the run.
+
+The profiles are created where the conversion is done: in the worker
+processes when a :class:`~exegis.pool.WorkerPool` is used.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import threading
+
+try:
+    from .baseclass import logger
+except ImportError:
+    from baseclass import logger
+
+
+def profile(fname, func, *args):
+    """Call ``func(*args)`` under :mod:`cProfile` and save the profile in
+    the file ``fname`` (also when func raises an exception).
+
+    Returns
+    -------
+    object
+        the value returned by func.
+    """
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(fname)
+
+
+def start_trace_malloc(frames=1):
+    """Start to trace the memory allocations of the process (if not already
+    done)."""
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+class Profiler(object):
+    """Class which chooses the files profiled and the name of their profile.
+
+    Attributes
+    ----------
+    folder : str
+        folder of the profiles (created if needed).
+
+    every : int, optional
+        one file every ``every`` files is profiled. Default: 1 (all)
+
+    fnames : list
+        names of the profiles asked.
+    """
+    def __init__(self, folder, every=1):
+        self.folder = folder
+        self.every = max(1, int(every))
+        self.fnames = []
+        self._count = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def fname(self, relpath):
+        """Return the name of the profile of a file, None if the file is not
+        profiled.
+
+        Parameters
+        ----------
+        relpath : str
+            path of the file relative to the corpus folder.
+        """
+        with self._lock:
+            count = self._count
+            self._count += 1
+            if count % self.every:
+                return None
+            name = os.path.splitext(relpath)[0].replace(os.sep, '__')
+            fname = os.path.join(self.folder, name + '.pstats')
+            self.fnames.append(fname)
+        return fname
+
+    def aggregate(self, name='all.pstats'):
+        """Merge the profiles of the files in one profile.
+
+        Returns
+        -------
+        str
+            name of the profile created, None if there are no profile.
+        """
+        import pstats
+        fnames = [fname for fname in self.fnames if os.path.exists(fname)]
+        if not fnames:
+            return None
+        fname = os.path.join(self.folder, name)
+        pstats.Stats(*fnames).dump_stats(fname)
+        logger.info('%d profiles merged in %s', len(fnames), fname)
+        return fname
@@ -0,0 +1,563 @@
+"""Module which contains the conversion server (``exegis serve``).
+
+Starting the command line interface for each file costs the start of the
+interpreter, the imports, the reading of the template and the compilation of
+the Relaxng schema (several seconds). The server does it once and converts
+the documents sent over HTTP, on localhost or on a Unix socket:
+
+``POST /convert``
+    the body is the text of a document, the answer the result in JSON (see
+    :meth:`exegis.api.Result.to_dict`). Query parameters: ``name``,
+    ``doc_num`` (default: taken from the name) and ``validate=0`` to skip
+    the validation.
+
+``POST /batch``
+    the body contains one document per line in JSON (``{"name": ...,
+    "text": ...}``), the answer one result per line, sent as soon as they
+    are ready (in the order of the documents unless ``ordered=0``).
+
+``POST /validate``
+    the body is an XML document, the answer the result of its validation.
+
+``POST /reload``
+    read the template and compile the Relaxng schema again.
+
+``GET /status``
+    version, files used and number of requests.
+
+The template and the Relaxng file are read again when they change, the
+documents are converted with the previous version until the new schema is
+compiled. :class:`exegis.client.Client` is the client of the server.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import stat
+import json
+import time
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    from .__init__ import __version__
+    from .api import Context, Result, load_template, doc_number
+    from .aphorisms_to_xml import AphorismsToXMLException, relaxng_validator
+    from .baseclass import logger, TEMPLATE_FNAME
+except ImportError:
+    from __init__ import __version__
+    from api import Context, Result, load_template, doc_number
+    from aphorisms_to_xml import AphorismsToXMLException, relaxng_validator
+    from baseclass import logger, TEMPLATE_FNAME
+
+# Port used by default
+PORT = 8642
+
+
+# Define an Exception
+class ServerException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+def _mtime(fname):
+    """Return the time of the last modification of a file, None if it does
+    not exist."""
+    try:
+        return os.stat(fname).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+class _Generation(object):
+    """Template and compiled schema used by the server: the context and the
+    threads which keep the compiled schema."""
+    def __init__(self, context, executor, files, number):
+        self.context = context
+        self.executor = executor
+        self.files = files
+        self.number = number
+
+    def changed(self):
+        """Return True if one of the files changed."""
+        return any(_mtime(fname) != mtime
+                   for fname, mtime in self.files.items())
+
+
+class Engine(object):
+    """Class which converts the documents for the server.
+
+    The conversions and the validations are done by a pool of threads, each
+    one compiles the Relaxng schema once. When the template or the Relaxng
+    file change (see :meth:`check`) a new pool is prepared, the conversions
+    use the previous one until it is ready.
+
+    Attributes
+    ----------
+    template_fname : str, optional
+        name of the XML template. Default: the template provided with the
+        software.
+
+    relaxng : str, optional
+        name of the Relaxng file. Default: the one declared in the template.
+
+    workers : int, optional
+        number of threads converting the documents. Default: 1
+
+    Raises
+    ------
+    ServerException
+        if the template or the Relaxng file cannot be read.
+    """
+    def __init__(self, template_fname=None, relaxng=None, workers=1):
+        self.template_fname = template_fname or TEMPLATE_FNAME
+        self.relaxng = relaxng
+        self.workers = max(1, workers)
+        self.reloads = 0
+        self._current = None
+        self._lock = threading.Lock()
+        if not self.reload():
+            raise ServerException('Unable to load {}'.format(
+                self.template_fname))
+
+    def _load(self, number):
+        """Read the template and compile the schema in each thread of a new
+        pool."""
+        load_template(self.template_fname, reload=True)
+        context = Context(self.template_fname, True, self.relaxng)
+        executor = ThreadPoolExecutor(self.workers)
+        barrier = threading.Barrier(self.workers)
+
+        def warm():
+            # The barrier keeps the thread busy: each task goes to its own
+            # thread
+            try:
+                return relaxng_validator(context.relaxng_fname)[1]
+            finally:
+                barrier.wait()
+
+        futures = [executor.submit(warm) for _ in range(self.workers)]
+        try:
+            relaxng_fname = [future.result() for future in futures][0]
+        except Exception:
+            executor.shutdown(wait=False)
+            raise
+        files = {fname: _mtime(fname)
+                 for fname in (self.template_fname, relaxng_fname)}
+        return _Generation(context, executor, files, number)
+
+    def reload(self):
+        """Read the template and compile the schema again.
+
+        Returns
+        -------
+        bool
+            True if the files are loaded. If they cannot be, the error is
+            logged and the previous ones are kept.
+        """
+        from lxml import etree
+        with self._lock:
+            previous = self._current
+            number = previous.number + 1 if previous else 1
+            start = time.perf_counter()
+            try:
+                self._current = self._load(number)
+            except (AphorismsToXMLException, etree.LxmlError) as e:
+                logger.error('Unable to load the template %s or its Relaxng '
+                             'file: %s', self.template_fname, e)
+                if previous is not None:
+                    # Try again when the files change again
+                    previous.files = {fname: _mtime(fname)
+                                      for fname in previous.files}
+                return False
+            logger.info('Template %s and Relaxng file loaded in %.3f s',
+                        self.template_fname, time.perf_counter() - start)
+            if previous is not None:
+                self.reloads += 1
+                # The conversions already submitted are finished
+                previous.executor.shutdown(wait=False)
+            return True
+
+    def check(self):
+        """Reload the files if they changed, return True if they were."""
+        if self._current.changed():
+            logger.info('Template or Relaxng file changed')
+            return self.reload()
+        return False
+
+    def _submit(self, method, *args):
+        """Submit a method of the context to the threads."""
+        while True:
+            current = self._current
+            try:
+                return current.executor.submit(
+                    getattr(current.context, method), *args)
+            except RuntimeError:
+                # The files were reloaded since, use the new threads
+                if current is self._current:
+                    raise
+
+    def convert(self, text, doc_num=1, name=None, validate=True):
+        """Submit the conversion of a text.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            the future of the :class:`~exegis.api.Result`.
+        """
+        return self._submit('convert' if validate else 'parse', text,
+                            doc_num, name)
+
+    def convert_many(self, documents, validate=True, ordered=True):
+        """Convert several documents (``(name, text, doc_num)``), yield the
+        results. The conversions not started are cancelled when the
+        generator is closed."""
+        documents = iter(documents)
+        pending = deque()
+        window = 2 * self.workers
+        try:
+            while True:
+                for name, text, doc_num in documents:
+                    pending.append(self.convert(text, doc_num, name,
+                                                validate))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                    future = next(f for f in pending if f in done)
+                    pending.remove(future)
+                yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def validate(self, xml, name=None):
+        """Submit the validation of an XML document (bytes).
+
+        Returns
+        -------
+        concurrent.futures.Future
+            the future of the :class:`~exegis.api.Result`.
+        """
+        result = Result(xml=xml, name=name,
+                        relaxng_fname=self._current.context.relaxng_fname)
+        return self._submit('check', result)
+
+    def status(self):
+        """Return a dictionary which describes the engine."""
+        current = self._current
+        return {'version': __version__,
+                'template': self.template_fname,
+                'relaxng': sorted(set(current.files) -
+                                  {self.template_fname}),
+                'workers': self.workers,
+                'generation': current.number,
+                'reloads': self.reloads}
+
+    def close(self):
+        """Stop the threads."""
+        if self._current is not None:
+            self._current.executor.shutdown(wait=True)
+
+
+def _flag(params, key, default=True):
+    """Return the value of a boolean query parameter."""
+    value = params.get(key, [None])[0]
+    if value is None:
+        return default
+    return value.lower() not in ('0', 'false', 'no', 'off')
+
+
+class _BadRequest(Exception):
+    """Error of the client, answered with the status 400."""
+    pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handler of the requests sent to the server."""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'exegis/' + __version__
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+    def _body(self, required=True):
+        """Read the body of the request."""
+        length = self.headers.get('Content-Length')
+        if length is None:
+            if not required:
+                return b''
+            raise _BadRequest('Content-Length required')
+        try:
+            return self.rfile.read(int(length))
+        except ValueError:
+            raise _BadRequest('Content-Length must be an integer')
+
+    def _text(self):
+        """Read the body of the request as an utf-8 text."""
+        try:
+            return self._body().decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise _BadRequest('Body is not an utf-8 text: {}'.format(e))
+
+    def _send_json(self, data, status=200):
+        body = (json.dumps(data) + '\n').encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send_json({'error': message}, status)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.requests += 1
+        if url.path == '/status':
+            status = self.server.engine.status()
+            status['requests'] = self.server.requests
+            self._send_json(status)
+        else:
+            self._error(404, 'Unknown path {}'.format(url.path))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        self.server.requests += 1
+        routes = {'/convert': self._convert, '/batch': self._batch,
+                  '/validate': self._validate, '/reload': self._reload}
+        if url.path not in routes:
+            self._error(404, 'Unknown path {}'.format(url.path))
+            return
+        try:
+            routes[url.path](params)
+        except _BadRequest as e:
+            self._error(400, str(e))
+
+    def _convert(self, params):
+        text = self._text()
+        name = params.get('name', [None])[0]
+        try:
+            doc_num = int(params['doc_num'][0]) if 'doc_num' in params \
+                else doc_number(name)
+        except ValueError:
+            raise _BadRequest('doc_num must be an integer')
+        future = self.server.engine.convert(text, doc_num, name,
+                                            _flag(params, 'validate'))
+        self._send_json(future.result().to_dict())
+
+    def _batch(self, params):
+        documents = []
+        for line in self._text().splitlines():
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+                name = document.get('name')
+                documents.append((name, document['text'],
+                                  int(document.get('doc_num') or
+                                      doc_number(name))))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                raise _BadRequest('Each line must be a JSON object with a '
+                                  '"text"')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        results = self.server.engine.convert_many(
+            documents, _flag(params, 'validate'), _flag(params, 'ordered'))
+        try:
+            for result in results:
+                line = (json.dumps(result.to_dict()) + '\n').encode('utf-8')
+                self.wfile.write('{:x}\r\n'.format(len(line)).encode() +
+                                 line + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        finally:
+            results.close()
+
+    def _validate(self, params):
+        xml = self._body()
+        future = self.server.engine.validate(xml,
+                                             params.get('name', [None])[0])
+        self._send_json(future.result().to_dict())
+
+    def _reload(self, params):
+        # pylint: disable=unused-argument
+        self._body(required=False)
+        ok = self.server.engine.reload()
+        status = self.server.engine.status()
+        status['reloaded'] = ok
+        self._send_json(status, 200 if ok else 500)
+
+
+class _TCPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        # Only the user can send documents
+        os.chmod(self.server_address, 0o600)
+
+
+def _remove_stale_socket(fname):
+    """Remove the socket file left by a server which stopped.
+
+    Raises
+    ------
+    ServerException
+        if a server uses the socket.
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(fname).st_mode):
+            raise ServerException('{} is not a socket'.format(fname))
+    except FileNotFoundError:
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(fname)
+    except OSError:
+        os.remove(fname)
+        return
+    finally:
+        sock.close()
+    raise ServerException('A server already uses {}'.format(fname))
+
+
+class Server(object):
+    """Class which serves the conversions over HTTP.
+
+    Attributes
+    ----------
+    engine : Engine
+        engine converting the documents.
+
+    host : str, optional
+        address of the HTTP server. Default: 127.0.0.1
+
+    port : int, optional
+        port of the HTTP server (0: a free port), None to not listen on a
+        port. Default: 8642
+
+    socket_fname : str, optional
+        name of the Unix socket to listen on.
+
+    interval : float, optional
+        time (seconds) between two checks of the template and Relaxng
+        files, 0 to not check them. Default: 2
+
+    Raises
+    ------
+    ServerException
+        if the server cannot listen on the address.
+    """
+    def __init__(self, engine, host='127.0.0.1', port=PORT,
+                 socket_fname=None, interval=2.):
+        self.engine = engine
+        self.interval = interval
+        self._servers = []
+        self._threads = []
+        self._stop = threading.Event()
+
+        try:
+            if port is not None:
+                self._servers.append(_TCPServer((host, port), _Handler))
+            if socket_fname is not None:
+                _remove_stale_socket(socket_fname)
+                self._servers.append(_UnixServer(socket_fname, _Handler))
+        except OSError as e:
+            self._close_servers()
+            raise ServerException('Unable to listen: {}'.format(e))
+        for server in self._servers:
+            server.engine = engine
+            server.requests = 0
+
+    @property
+    def requests(self):
+        """Number of requests received."""
+        return sum(server.requests for server in self._servers)
+
+    @property
+    def addresses(self):
+        """Addresses of the server (``http://host:port`` or
+        ``unix:path``)."""
+        addresses = []
+        for server in self._servers:
+            if isinstance(server, _UnixServer):
+                addresses.append('unix:' + server.server_address)
+            else:
+                addresses.append('http://{}:{}'.format(
+                    *server.server_address[:2]))
+        return addresses
+
+    def _watch(self):
+        """Check the template and the Relaxng file regularly."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.engine.check()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Unable to check the template')
+
+    def start(self):
+        """Start the threads of the server."""
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever,
+                                      name='exegis-serve', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.interval:
+            thread = threading.Thread(target=self._watch,
+                                      name='exegis-watch', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info('Serving on %s', ', '.join(self.addresses))
+
+    def wait(self):
+        """Wait until :meth:`stop` is called."""
+        while not self._stop.wait(0.5):
+            pass
+
+    def _close_servers(self):
+        for server in self._servers:
+            server.server_close()
+            if isinstance(server, _UnixServer):
+                try:
+                    os.remove(server.server_address)
+                except OSError:
+                    pass
+
+    def stop(self):
+        """Stop the server."""
+        self._stop.set()
+        if self._threads:
+            for server in self._servers:
+                server.shutdown()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._close_servers()
+        self.engine.close()
@@ -0,0 +1,215 @@
+"""Module which contains the functions used to share the conversion of a
+corpus between several machines.
+
+Every machine explores the same corpus (shared file system) and computes
+the same assignment of the files to the shards: the shard of a file is given
+by a stable hash of its relative path only. A file added to (or removed from)
+the corpus does not move the other files, the machines agree even when they
+do not explore the corpus at the same time. The hash does not depend on the
+size, with many files the shards have about the same amount of text; when the
+sizes are very different the spool (:mod:`exegis.spool`) balances the work
+better.
+
+Each shard writes a manifest (JSON) with the status of its files, the
+manifests are merged in one report for the corpus.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import json
+import hashlib
+
+try:
+    from .baseclass import logger
+except ImportError:
+    from baseclass import logger
+
+
+# Define an Exception
+class ShardException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+def parse_shard(spec):
+    """Parse a shard specification ``i/n`` (``1 <= i <= n``).
+
+    Returns
+    -------
+    tuple
+        (i, n) as integers.
+
+    Raises
+    ------
+    ShardException
+        if the specification is not valid.
+    """
+    try:
+        index, count = (int(value) for value in spec.split('/'))
+    except (ValueError, AttributeError):
+        raise ShardException('Shard should be given as i/n, '
+                             'got {}'.format(spec)) from None
+    if not 1 <= index <= count:
+        raise ShardException('Shard {} is not between 1 and {}'.format(
+            index, count))
+    return index, count
+
+
+def stable_hash(relpath):
+    """Hash of a relative path, identical on every machine and every run
+    (the path separator is normalised)."""
+    relpath = relpath.replace(os.sep, '/')
+    return int(hashlib.sha1(relpath.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def shard_of(relpath, count):
+    """Return the shard (0 to ``count - 1``) of a file from its relative
+    path."""
+    return stable_hash(relpath) % count
+
+
+def assign(files, count):
+    """Assign each file to one shard.
+
+    Parameters
+    ----------
+    files : iterable
+        :class:`~exegis.discovery.TextFile` objects.
+
+    count : int
+        number of shards.
+
+    Returns
+    -------
+    list
+        ``count`` lists of files (in the order of their relative path), the
+        shard of a file does not depend on the other files.
+    """
+    shards = [[] for _ in range(count)]
+    for text_file in sorted(files, key=lambda f: f.relpath):
+        shards[shard_of(text_file.relpath, count)].append(text_file)
+    return shards
+
+
+def select(files, index, count):
+    """Return the files of the shard ``index`` (1 to ``count``).
+
+    The whole list of files is needed to compute the assignment.
+    """
+    shard = assign(files, count)[index - 1]
+    logger.info('Shard %d/%d: %d files, %d bytes', index, count, len(shard),
+                sum(f.size for f in shard))
+    return shard
+
+
+def summarise(records, elapsed=0.):
+    """Create the summary of a list of file records.
+
+    Parameters
+    ----------
+    records : list
+        dictionaries with at least the keys ``status`` and ``size``.
+
+    elapsed : float, optional
+        duration of the conversion (seconds).
+
+    Returns
+    -------
+    dict
+        number of files by status, number of bytes and duration.
+    """
+    summary = {'files': len(records), 'ok': 0, 'invalid': 0, 'failed': 0,
+               'quarantined': 0, 'bytes': 0, 'elapsed': elapsed}
+    for record in records:
+        summary[record['status']] = summary.get(record['status'], 0) + 1
+        summary['bytes'] += record.get('size', 0)
+        if record.get('quarantined'):
+            summary['quarantined'] += 1
+    return summary
+
+
+def save_manifest(fname, records, shard=None, elapsed=0.):
+    """Save the manifest of a run.
+
+    Parameters
+    ----------
+    fname : str
+        name of the manifest file (JSON).
+
+    records : list
+        dictionaries which describe each file treated.
+
+    shard : str, optional
+        shard treated (``i/n``).
+
+    elapsed : float, optional
+        duration of the conversion (seconds).
+    """
+    manifest = {'shard': shard,
+                'files': records,
+                'summary': summarise(records, elapsed)}
+    with open(fname, 'w', encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def merge(fnames):
+    """Merge the manifests of the shards in one report.
+
+    Parameters
+    ----------
+    fnames : list
+        names of the manifest files.
+
+    Returns
+    -------
+    dict
+        report with the files of all the shards, the summary of the corpus
+        and the summary of each shard. The key ``missing`` lists the shards
+        without manifest and ``duplicates`` the files converted by more
+        than one shard.
+
+    Raises
+    ------
+    ShardException
+        if a manifest cannot be read.
+    """
+    files = []
+    shards = {}
+    count = None
+    for fname in fnames:
+        try:
+            with open(fname, 'r', encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            error = 'Unable to read manifest {}: {}'.format(fname, e)
+            logger.error(error)
+            raise ShardException(error)
+        spec = manifest.get('shard') or fname
+        shards[spec] = manifest['summary']
+        files.extend(manifest['files'])
+        if manifest.get('shard'):
+            count = parse_shard(manifest['shard'])[1]
+
+    seen = set()
+    duplicates = set()
+    for record in files:
+        if record['path'] in seen:
+            duplicates.add(record['path'])
+        seen.add(record['path'])
+
+    missing = []
+    if count is not None:
+        missing = ['{}/{}'.format(i, count) for i in range(1, count + 1)
+                   if '{}/{}'.format(i, count) not in shards]
+
+    # The shards run in parallel, the corpus took the time of the slowest
+    elapsed = max([s['elapsed'] for s in shards.values()] or [0.])
+    return {'files': files,
+            'summary': summarise(files, elapsed),
+            'shards': shards,
+            'missing': missing,
+            'duplicates': sorted(duplicates)}
@@ -0,0 +1,350 @@
+"""Module which contains the classes used by several workers to share the
+conversion of a corpus through a spool directory.
+
+All the workers (on one machine or on several machines sharing a file
+system) explore the same corpus and claim the files one by one: the first
+worker which creates the claim file (``open`` with ``O_CREAT | O_EXCL``,
+atomic on a POSIX file system) converts the file. A fast worker claims more
+files than a slow one, nobody waits while there is work left.
+
+The spool directory contains::
+
+    claims/<hash>.claim     file being converted (owner and file treated)
+    done/<hash>.json        record of a file converted
+    workers/<worker>        heartbeat of each worker (modification time)
+
+A worker which stopped updating its heartbeat is considered dead, its
+claims are broken (atomic rename) and the files converted by another
+worker. A claim left empty or partially written (worker died while
+claiming) is considered dead when it has not been modified for the stale
+time. The XML files and the timing records (one JSON lines file per
+worker) are saved in the results directory.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import json
+import time
+import socket
+import threading
+import multiprocessing
+
+try:
+    from .baseclass import logger
+    from .discovery import TextFile
+    from .shard import stable_hash
+except ImportError:
+    from baseclass import logger
+    from discovery import TextFile
+    from shard import stable_hash
+
+
+# Define an Exception
+class SpoolException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+def _write_atomic(fname, text):
+    """Write a file atomically (temporary file renamed)."""
+    tmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'w', encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, fname)
+
+
+def _heartbeat(fname, interval, parent):
+    """Update the heartbeat file while the parent process is alive.
+
+    The heartbeat is done by a separate process: a worker busy in a long
+    call which keeps the GIL (e.g. the compilation of the Relaxng schema)
+    is still seen alive.
+    """
+    while os.getppid() == parent:
+        try:
+            with open(fname, 'w', encoding="utf-8") as f:
+                f.write(str(time.time()))
+        except OSError as e:
+            logger.warning('Unable to update heartbeat: %s', e)
+        time.sleep(interval)
+
+
+class Spool(object):
+    """Class which claim the files of a corpus in a spool directory.
+
+    Attributes
+    ----------
+    path : str
+        name of the spool directory (created if needed).
+
+    results : str, optional
+        name of the results directory. Default: ``<path>/results``
+
+    stale : float, optional
+        time (seconds) without heartbeat after which a worker is considered
+        dead. Default: 60
+
+    worker : str, optional
+        identifier of the worker. Default: host name and process id.
+
+    n_claimed, n_skipped, n_recovered : int
+        number of files claimed, already treated (or claimed by another
+        worker) and recovered from dead workers.
+    """
+    def __init__(self, path, results=None, stale=60., worker=None):
+        self.path = path
+        self.results = results or os.path.join(path, 'results')
+        self.stale = stale
+        self.worker = worker or '{}-{}'.format(socket.gethostname(),
+                                               os.getpid())
+
+        self.n_claimed = 0
+        self.n_skipped = 0
+        self.n_recovered = 0
+
+        self._claims = os.path.join(path, 'claims')
+        self._done = os.path.join(path, 'done')
+        self._workers = os.path.join(path, 'workers')
+        self._timings = os.path.join(self.results, 'timings')
+        for folder in (self._claims, self._done, self._workers,
+                       self._timings):
+            os.makedirs(folder, exist_ok=True)
+
+        self._heartbeat = os.path.join(self._workers, self.worker)
+        # Files claimed by the other workers, to recover the claims which
+        # cannot be read
+        self._others = {}
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def output_dir(self):
+        """Folder where the XML files are written."""
+        return os.path.join(self.results, 'XML')
+
+    def start(self):
+        """Start the heartbeat of the worker."""
+        with open(self._heartbeat, 'w', encoding="utf-8") as f:
+            f.write(str(time.time()))
+        context = multiprocessing.get_context()
+        self._process = context.Process(target=_heartbeat,
+                                        args=(self._heartbeat,
+                                              self.stale / 4,
+                                              os.getpid()),
+                                        daemon=True)
+        self._process.start()
+
+    def stop(self):
+        """Stop the heartbeat (the other workers will not recover the
+        claims left, the worker has finished)."""
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+        try:
+            os.remove(self._heartbeat)
+        except OSError:
+            pass
+
+    def _alive(self, worker):
+        """Return True if the worker updated its heartbeat recently."""
+        if worker == self.worker:
+            return True
+        try:
+            age = time.time() - os.path.getmtime(
+                os.path.join(self._workers, worker))
+        except OSError:
+            return False
+        return age < self.stale
+
+    def _key(self, text_file):
+        return '{:016x}'.format(stable_hash(text_file.relpath))
+
+    def _is_done(self, key):
+        return os.path.exists(os.path.join(self._done, key + '.json'))
+
+    def _try_claim(self, key, text_file):
+        """Create the claim file, return True if the worker got it."""
+        fname = os.path.join(self._claims, key + '.claim')
+        try:
+            fd = os.open(fname, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            json.dump({'worker': self.worker, 'path': text_file.path,
+                       'relpath': text_file.relpath,
+                       'size': text_file.size, 'time': time.time()}, f)
+        # Finished by another worker between the test and the claim
+        if self._is_done(key):
+            self._release(key)
+            return False
+        return True
+
+    def _release(self, key):
+        try:
+            os.remove(os.path.join(self._claims, key + '.claim'))
+        except OSError:
+            pass
+
+    def _read_claim(self, fname):
+        """Read a claim file.
+
+        Returns
+        -------
+        tuple
+            content of the claim (None if it cannot be read) and status of
+            the file (None if it does not exist).
+        """
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None, None
+        try:
+            with open(fname, 'r', encoding="utf-8") as f:
+                return json.load(f), st
+        except (OSError, ValueError):
+            return None, st
+
+    def _dead(self, claim, st):
+        """Return True if the claim has been left by a dead worker."""
+        if st is None:
+            return False
+        if claim is None:
+            # Empty or partially written: the worker died while claiming
+            return time.time() - st.st_mtime >= self.stale
+        return not self._alive(claim['worker'])
+
+    def _break(self, key, claim, st):
+        """Break the claim of a dead worker.
+
+        The claim is renamed (only one worker can succeed), then checked
+        against the file read (inode and modification time): if it has been
+        claimed again in between it is put back, without replacing a claim
+        created meanwhile (``os.link`` fails if the file exists).
+
+        Parameters
+        ----------
+        key : str
+            key of the file claimed.
+
+        claim, st : dict, os.stat_result
+            content and status of the claim file read (see `_read_claim`).
+
+        Returns
+        -------
+        bool
+            True if the claim has been removed.
+        """
+        fname = os.path.join(self._claims, key + '.claim')
+        broken = '{}.{}.broken'.format(fname, self.worker)
+        try:
+            os.rename(fname, broken)
+        except OSError:
+            return False
+        moved = os.stat(broken)
+        if (moved.st_ino, moved.st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+            try:
+                os.link(broken, fname)
+            except FileExistsError:
+                logger.warning('Claim of %s replaced while put back', key)
+            os.remove(broken)
+            return False
+        os.remove(broken)
+        logger.warning('Claim of %s by dead worker %s broken', key,
+                       claim['worker'] if claim else 'unknown')
+        return True
+
+    def claim(self, files):
+        """Yield the files of the corpus claimed by the worker.
+
+        The files already converted or claimed by a live worker are skipped.
+        """
+        for text_file in files:
+            key = self._key(text_file)
+            if self._is_done(key):
+                self.n_skipped += 1
+                continue
+            if not self._try_claim(key, text_file):
+                fname = os.path.join(self._claims, key + '.claim')
+                claim, st = self._read_claim(fname)
+                if not self._dead(claim, st) or \
+                        not self._break(key, claim, st) or \
+                        not self._try_claim(key, text_file):
+                    self._others[key] = text_file
+                    self.n_skipped += 1
+                    continue
+                self.n_recovered += 1
+            self.n_claimed += 1
+            yield text_file
+
+    def recover(self, interval=None):
+        """Yield the files claimed by the workers which died.
+
+        Wait until all the claims of the other workers are done or
+        recovered. A claim which cannot be read is recovered only if the
+        file is in the corpus explored by `claim`.
+        """
+        if interval is None:
+            interval = self.stale / 4
+        while True:
+            others = []
+            for entry in os.scandir(self._claims):
+                if not entry.name.endswith('.claim'):
+                    continue
+                key = entry.name[:-len('.claim')]
+                claim, st = self._read_claim(entry.path)
+                if claim is not None:
+                    if claim['worker'] != self.worker:
+                        others.append((key, claim, st,
+                                       TextFile(claim['path'],
+                                                claim['relpath'],
+                                                claim['size'])))
+                elif st is not None and key in self._others:
+                    others.append((key, claim, st, self._others[key]))
+            if not others:
+                return
+
+            dead = []
+            for key, claim, st, text_file in others:
+                if not self._dead(claim, st) or \
+                        not self._break(key, claim, st):
+                    continue
+                dead.append(text_file)
+            recovered = list(self.claim(dead))
+            self.n_recovered += len(recovered)
+            for text_file in recovered:
+                yield text_file
+            if not dead:
+                time.sleep(interval)
+
+    def complete(self, job):
+        """Record the job as done, save its timing record and release its
+        claim.
+
+        Parameters
+        ----------
+        job : Job
+            job at the end of the pipeline.
+        """
+        key = '{:016x}'.format(stable_hash(job.relpath))
+        record = job.record()
+        record['worker'] = self.worker
+        record['time'] = time.time()
+        text = json.dumps(record)
+        _write_atomic(os.path.join(self._done, key + '.json'), text)
+        with self._lock:
+            with open(os.path.join(self._timings, self.worker + '.jsonl'),
+                      'a', encoding="utf-8") as f:
+                f.write(text + '\n')
+        self._release(key)
+
+    def summary(self):
+        """Return a string which summarise the work of the worker."""
+        return ('Worker {}: {} files claimed ({} recovered from dead '
+                'workers), {} skipped'.format(self.worker, self.n_claimed,
+                                              self.n_recovered,
+                                              self.n_skipped))
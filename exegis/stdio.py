@@ -0,0 +1,214 @@
+"""Module which contains the co-process mode of exegis (``exegis --stdio``).
+
+A program drives exegis through its standard input and output, without
+starting a process for each file nor a network service. Each line of the
+input is a request in JSON::
+
+    {"id": 1, "name": "file_2.txt", "text": "...", "validate": true}
+
+``name``, ``doc_num`` (default: taken from the name), ``validate`` (default:
+true) and ``id`` (returned with the response) are optional. Each line of
+the output is the response to a request, in the order of the requests (or
+as soon as they are ready with ``--unordered``)::
+
+    {"id": 1, "name": "file_2.txt", "status": "ok", "xml": "...",
+     "errors": [], "diagnostics": [...], "timings": {...}, ...}
+
+``status`` is ``ok``, ``invalid`` (XML not valid), ``failed`` (the document
+cannot be converted) or ``error`` (the request cannot be read, e.g. a line
+which is not utf-8). The requests
+are read while the previous ones are converted, the template is read and the
+Relaxng schema compiled once (see :class:`exegis.server.Engine`).
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import json
+import queue
+import threading
+from concurrent.futures import Future
+
+try:
+    from .api import doc_number
+    from .baseclass import logger
+except ImportError:
+    from api import doc_number
+    from baseclass import logger
+
+
+# Define an Exception
+class StdioException(Exception):
+    """Class for exception
+    """
+    pass
+
+
+def status(result):
+    """Return the status of a result (``ok``, ``invalid`` or ``failed``)."""
+    if result.xml is None:
+        return 'failed'
+    if result.valid is False:
+        return 'invalid'
+    return 'ok'
+
+
+def response(result, request_id=None):
+    """Return the response (dictionary) to a request from the result of the
+    conversion."""
+    data = result.to_dict()
+    del data['ok']
+    data['status'] = status(result)
+    data['errors'] = result.errors
+    data['id'] = request_id
+    return data
+
+
+def _error(message, request_id=None):
+    """Return a future with the response to a request which cannot be
+    read."""
+    future = Future()
+    future.set_result({'id': request_id, 'status': 'error',
+                       'errors': [message]})
+    return future
+
+
+def submit(engine, line):
+    """Submit the conversion of the request read on a line.
+
+    Parameters
+    ----------
+    engine : exegis.server.Engine
+        engine converting the documents.
+
+    line : bytes or str
+        line of the request (bytes decoded from utf-8).
+
+    Returns
+    -------
+    concurrent.futures.Future
+        the future of the response.
+    """
+    if isinstance(line, bytes):
+        try:
+            line = line.decode('utf-8')
+        except UnicodeDecodeError as e:
+            return _error('Request not utf-8: {}'.format(e))
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return _error('Request not valid JSON: {}'.format(e))
+    if not isinstance(request, dict):
+        return _error('Request must be a JSON object')
+
+    request_id = request.get('id')
+    name = request.get('name')
+    text = request.get('text')
+    if not isinstance(text, str):
+        return _error('Request without "text"', request_id)
+    try:
+        doc_num = int(request.get('doc_num') or doc_number(name))
+    except (ValueError, TypeError):
+        return _error('doc_num must be an integer', request_id)
+
+    conversion = engine.convert(text, doc_num, name,
+                                bool(request.get('validate', True)))
+    future = Future()
+
+    def done(conversion):
+        try:
+            future.set_result(response(conversion.result(), request_id))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception('Conversion of %s failed', name)
+            future.set_result({'id': request_id, 'name': name,
+                               'status': 'error', 'errors': [str(e)]})
+
+    conversion.add_done_callback(done)
+    return future
+
+
+def run(engine, stdin, stdout, ordered=True, window=None):
+    """Answer the requests read on ``stdin`` until the end of the input.
+
+    Parameters
+    ----------
+    engine : exegis.server.Engine
+        engine converting the documents.
+
+    stdin : file
+        file of the requests, binary (each line decoded separately) or
+        text.
+
+    stdout : file
+        text file of the responses.
+
+    ordered : bool, optional
+        if True the responses are written in the order of the requests,
+        otherwise as soon as they are ready. Default: True
+
+    window : int, optional
+        number of requests read in advance. Default: 2 * workers of the
+        engine.
+
+    Returns
+    -------
+    int
+        number of requests answered.
+
+    Raises
+    ------
+    StdioException
+        if the requests cannot be read, after answering the requests read.
+    """
+    window = threading.Semaphore(window or 2 * engine.workers)
+    responses = queue.Queue()
+    stop = threading.Event()
+    submitted = []
+    failures = []
+    end = object()
+
+    def read():
+        count = 0
+        try:
+            for line in stdin:
+                if not line.strip():
+                    continue
+                window.acquire()
+                if stop.is_set():
+                    break
+                future = submit(engine, line)
+                count += 1
+                if ordered:
+                    responses.put(future)
+                else:
+                    future.add_done_callback(responses.put)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception('Reading of the requests failed')
+            failures.append(e)
+        finally:
+            submitted.append(count)
+            responses.put(end)
+
+    reader = threading.Thread(target=read, name='exegis-stdio', daemon=True)
+    reader.start()
+
+    count = 0
+    try:
+        # Without order the end of the input can arrive before the last
+        # responses
+        while not submitted or count < submitted[0]:
+            future = responses.get()
+            if future is end:
+                continue
+            stdout.write(json.dumps(future.result()) + '\n')
+            stdout.flush()
+            count += 1
+            window.release()
+    finally:
+        stop.set()
+        window.release()
+    if failures:
+        raise StdioException('Reading of the requests failed after {} '
+                             'requests: {}'.format(count, failures[0]))
+    return count
@@ -0,0 +1,237 @@
+"""Module which contains the classes used to measure the time spent in the
+phases of the conversion of a file.
+
+Each conversion (:class:`~exegis.aphorisms_to_xml.Process`) records the
+duration of its phases (``divide_document``, ``treat_footnotes``, ``body``,
+...) with a :class:`Timings` object and the size of the document (number of
+aphorisms, footnotes and witnesses). For a corpus, one record per file is
+saved as a JSON line and :class:`PhaseStatistics` summarises the phases
+(median, 95th percentile and maximum).
+
+When the memory allocations are traced (:mod:`tracemalloc`), the peak of
+memory of each phase and the lines which allocated the most are recorded
+too. The tracing is global to the process: the allocations of the other
+threads are counted with the phase, only one conversion should run in the
+process (the worker processes of :mod:`exegis.pool`). A snapshot of the
+memory is taken at the start and at the end of each phase, which costs a
+time proportional to the number of blocks allocated.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Phases of the conversion of a file in the order they are done
+PHASES = ('open_document', 'divide_document', 'treat_footnotes',
+          'aphorisms_dict', 'introduction', 'title', 'body', 'create_xml',
+          'anchors', 'validate', 'save_xml')
+
+
+class Timings(object):
+    """Class which records the time spent in each phase of a conversion.
+
+    Attributes
+    ----------
+    phases : OrderedDict
+        time (seconds) spent in each phase, the time of a phase done several
+        times is summed.
+
+    counts : dict
+        size of the document (e.g. ``size``, ``units``, ``footnotes``,
+        ``witnesses``).
+
+    trace_malloc : bool, optional
+        if True the memory allocated by each phase is traced (the tracing
+        has to be started with :func:`tracemalloc.start`). Default: False
+
+    top : int, optional
+        number of allocation sites kept for each phase. Default: 5
+
+    memory : OrderedDict
+        for each phase, the peak of memory (bytes above the memory used at
+        the start of the phase) and the lines which allocated the most
+        (``file:line``, bytes, number of blocks).
+    """
+    def __init__(self, trace_malloc=False, top=5):
+        self.phases = OrderedDict()
+        self.counts = {}
+        self.trace_malloc = trace_malloc
+        self.top = top
+        self.memory = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager which measures the time spent in a phase (also
+        when it raises an exception)."""
+        snapshot = self._start_trace() if self.trace_malloc else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            if snapshot is not None:
+                self._stop_trace(name, *snapshot)
+
+    def _start_trace(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return snapshot, tracemalloc.get_traced_memory()[0]
+
+    def _stop_trace(self, name, before, current):
+        import tracemalloc
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+        # The allocations of the tracing itself are not reported
+        ignore = (tracemalloc.__file__, __file__)
+        sites = []
+        for stat in after.compare_to(before, 'lineno'):
+            frame = stat.traceback[0]
+            if stat.size_diff <= 0 or frame.filename in ignore:
+                continue
+            sites.append(('{}:{}'.format(frame.filename, frame.lineno),
+                          stat.size_diff, stat.count_diff))
+            if len(sites) == self.top:
+                break
+        memory = self.memory.setdefault(name, {'peak': 0, 'top': []})
+        memory['peak'] = max(memory['peak'], peak - current)
+        memory['top'] = sites
+
+    def add(self, name, seconds):
+        """Add the time spent in a phase."""
+        self.phases[name] = self.phases.get(name, 0.) + seconds
+
+    def record(self):
+        """Return a dictionary with the counts and the phases (JSON
+        serialisable)."""
+        record = dict(self.counts)
+        record['phases'] = dict(self.phases)
+        if self.memory:
+            record['memory'] = dict(self.memory)
+        return record
+
+
+def percentile(values, q):
+    """Return the percentile ``q`` (0 to 100) of a list of values (nearest
+    rank, 0 for an empty list)."""
+    if not values:
+        return 0.
+    values = sorted(values)
+    rank = max(1, int(math.ceil(q / 100. * len(values))))
+    return values[rank - 1]
+
+
+class PhaseStatistics(object):
+    """Class which collects the timings of the files of a corpus.
+
+    Attributes
+    ----------
+    durations : dict
+        list of the durations (seconds) of each phase.
+
+    memory : dict
+        for each phase, the highest peak of memory seen, the file and its
+        main allocation sites.
+    """
+    def __init__(self):
+        self.durations = {}
+        self.memory = {}
+        self._lock = threading.Lock()
+
+    def add(self, phases, memory=None, path=None):
+        """Add the phases (dictionary name: seconds) and the memory traced
+        (see :attr:`Timings.memory`) of one file."""
+        with self._lock:
+            for name, seconds in phases.items():
+                self.durations.setdefault(name, []).append(seconds)
+            for name, traced in (memory or {}).items():
+                if traced['peak'] >= self.memory.get(name, {}).get('peak',
+                                                                    -1):
+                    self.memory[name] = dict(traced, path=path)
+
+    def _names(self, phases):
+        return [p for p in PHASES if p in phases] + \
+            sorted(p for p in phases if p not in PHASES)
+
+    def summary(self):
+        """Return a dictionary with, for each phase, the number of files,
+        the median, the 95th percentile, the maximum and the total
+        (seconds)."""
+        summary = OrderedDict()
+        for name in self._names(self.durations):
+            values = self.durations[name]
+            summary[name] = {'files': len(values),
+                             'p50': percentile(values, 50),
+                             'p95': percentile(values, 95),
+                             'max': max(values),
+                             'total': sum(values)}
+        return summary
+
+    def report(self):
+        """Return a string with the statistics of the phases (milliseconds).
+        """
+        lines = ['{:<16} {:>7} {:>10} {:>10} {:>10} {:>10}'.format(
+            'phase', 'files', 'p50 (ms)', 'p95 (ms)', 'max (ms)', 'total (s)')]
+        for name, stats in self.summary().items():
+            lines.append('{:<16} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} '
+                         '{:>10.3f}'.format(name, stats['files'],
+                                            stats['p50'] * 1000,
+                                            stats['p95'] * 1000,
+                                            stats['max'] * 1000,
+                                            stats['total']))
+        return '\n'.join(lines)
+
+    def memory_report(self):
+        """Return a string with the highest peak of memory of each phase
+        and the lines which allocated the most."""
+        lines = ['{:<16} {:>10}  {}'.format('phase', 'peak (MB)',
+                                             'file / top allocations')]
+        for name in self._names(self.memory):
+            traced = self.memory[name]
+            lines.append('{:<16} {:>10.3f}  {}'.format(
+                name, traced['peak'] / 1024. / 1024., traced['path'] or ''))
+            for site, size, count in traced['top']:
+                lines.append('{:<27}  {} ({} bytes, {} blocks)'.format(
+                    '', site, size, count))
+        return '\n'.join(lines)
+
+
+class TimingsFile(object):
+    """Class which writes the timing records in a file (one JSON object per
+    line), it can be used by several threads.
+
+    Attributes
+    ----------
+    fname : str
+        name of the file (JSON lines).
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self._file = open(fname, 'w', encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        """Write one record."""
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -35,12 +35,16 @@ class Title(Exegis):
     next_footnote : int
         integer which contains the footnote reference number which
         can be present.
+
+    anchors : exegis.anchors.Anchors, optional
+        collects the anchors created (see :func:`exegis.analysis.footnotes`).
     """
-    def __init__(self, title, next_footnote=1, doc_num=1):
+    def __init__(self, title, next_footnote=1, doc_num=1, anchors=None):
         Exegis.__init__(self)
         self.title = title
         self.doc_num = doc_num
         self.next_footnote = next_footnote
+        self.anchors = anchors
 
     def xml_main(self):
         """Method to treat the title.
@@ -78,7 +82,8 @@ class Title(Exegis):
             try:
                 self.xml_n_offset += 2
                 xml_main_to_add, self.next_footnote = \
-                    footnotes(line_ref, self.next_footnote)
+                    footnotes(line_ref, self.next_footnote,
+                              self.anchors)
                 self.xml_n_offset -= 2
             except(TitleException, TypeError):
                 error = ('Unable to process title footnote '
@@ -0,0 +1,285 @@
+"""Module which contains the automatic choice of the number of workers of a
+run (``exegis --processes=auto``).
+
+The best number of workers depends on the corpus: with small files the
+reading and the validation dominate, the large files are limited by the
+conversion (pure Python, one process per conversion). The
+:class:`AutoTuner` measures the throughput (bytes of text per second
+reaching the end of the pipeline) during windows of a few seconds at the
+beginning of the run. After each window the busiest stage, the conversion,
+the validation or the input/output, gets one more worker while the
+throughput improves and the limits (CPUs, available memory) are not reached.
+A new worker starts with the initializer of its stage (e.g. a validation
+thread compiles the Relaxng schema), the next window starts when it is
+ready. The best settings found are kept for the rest of the run and logged,
+they can be given on the command line of the next runs.
+
+:Authors: Nicolas Gruel <nicolas.gruel@manchester.ac.uk>
+
+:Copyright: IT Services, The University of Manchester
+"""
+# pylint: disable=locally-disabled, invalid-name
+import os
+import time
+import threading
+
+try:
+    from .baseclass import logger
+except ImportError:
+    from baseclass import logger
+
+
+def available_memory():
+    """Return the memory available on the machine (bytes), None if it is
+    not known (``MemAvailable`` of ``/proc/meminfo``, Linux only)."""
+    try:
+        with open('/proc/meminfo', 'r', encoding="utf-8") as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class AutoTuner(object):
+    """Class which adjusts the number of workers of the stages of a running
+    pipeline.
+
+    Attributes
+    ----------
+    pipeline : exegis.pipeline.Pipeline
+        pipeline of the run.
+
+    pool : exegis.pool.WorkerPool, optional
+        pool of processes of the conversion, resized with the stage
+        ``convert``.
+
+    convert : str, optional
+        name of the stage of the conversion. Default: ``convert``
+
+    validate : str, optional
+        name of the stage of the validation. Default: ``validate``
+
+    io : tuple, optional
+        names of the input/output stages. Default: ``('read', 'write')``
+
+    max_workers : int, optional
+        maximum number of conversion workers. Default: number of CPUs
+
+    max_validators : int, optional
+        maximum number of validation threads (each one keeps its compiled
+        Relaxng schema in memory). Default: 4
+
+    max_io_workers : int, optional
+        maximum number of workers of an input/output stage. Default: 8
+
+    window : float, optional
+        duration of a measurement (seconds). Default: 5
+
+    tolerance : float, optional
+        relative improvement of the throughput needed to keep a new worker.
+        Default: 0.05
+
+    max_windows : int, optional
+        maximum number of measurements. Default: 20
+
+    memory_fraction : float, optional
+        fraction of the available memory the new processes can use.
+        Default: 0.5
+
+    clock : callable, optional
+        function which returns the time (seconds). Default:
+        :func:`time.perf_counter`
+
+    settings : dict
+        number of workers of each stage chosen (once settled).
+
+    history : list
+        ``(workers of each stage, throughput)`` of each measurement.
+    """
+    def __init__(self, pipeline, pool=None, convert='convert',
+                 validate='validate', io=('read', 'write'), max_workers=None,
+                 max_validators=4, max_io_workers=8, window=5.,
+                 tolerance=0.05, max_windows=20, memory_fraction=0.5,
+                 clock=time.perf_counter):
+        self.stages = {stage.name: stage for stage in pipeline.stages}
+        self.last = pipeline.stages[-1]
+        self.pool = pool
+        self.convert = convert
+        self.validate = validate
+        self.io = [name for name in io if name in self.stages]
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_validators = max_validators
+        self.max_io_workers = max_io_workers
+        self.window = window
+        self.tolerance = tolerance
+        self.max_windows = max_windows
+        self.memory_fraction = memory_fraction
+        self.clock = clock
+
+        self.settings = None
+        self.throughput = 0.
+        self.history = []
+        self._best = 0.
+        self._best_settings = None
+        self._previous = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _workers(self):
+        return {name: stage.workers for name, stage in self.stages.items()}
+
+    def _snapshot(self):
+        """Cumulative counters of the stages."""
+        return (self.clock(), self.last.n_bytes,
+                {name: stage.busy for name, stage in self.stages.items()})
+
+    def _memory_allows(self):
+        """Return True if one more conversion process fits in memory."""
+        if self.pool is None or not self.pool.peak_memory:
+            return True
+        available = available_memory()
+        if available is None:
+            return True
+        return self.pool.peak_memory < available * self.memory_fraction
+
+    def _resize(self, name, workers):
+        self.stages[name].resize(workers)
+        if name == self.convert and self.pool is not None:
+            self.pool.resize(workers)
+
+    def _apply(self, settings):
+        for name, workers in settings.items():
+            if self.stages[name].workers != workers:
+                self._resize(name, workers)
+
+    def _grow(self, busy):
+        """Add a worker to the busiest stage which can grow.
+
+        Parameters
+        ----------
+        busy : dict
+            utilisation of each stage during the window.
+
+        Returns
+        -------
+        bool
+            True if a stage got a new worker.
+        """
+        candidates = sorted(((busy.get(name, 0.), name)
+                             for name in [self.convert, self.validate] +
+                             self.io if name in self.stages), reverse=True)
+        for _, name in candidates:
+            stage = self.stages[name]
+            if name == self.convert:
+                if stage.workers >= self.max_workers or \
+                        not self._memory_allows():
+                    continue
+            elif name == self.validate:
+                if stage.workers >= self.max_validators:
+                    continue
+            elif stage.workers >= self.max_io_workers:
+                continue
+            self._resize(name, stage.workers + 1)
+            return True
+        return False
+
+    def _ready(self):
+        """Return True when the workers of all the stages are ready."""
+        return all(stage.ready >= stage.workers
+                   for stage in self.stages.values())
+
+    def update(self):
+        """Measure the throughput since the previous call and adjust the
+        number of workers (the first call starts the measure).
+
+        Returns
+        -------
+        bool
+            True while the tuning continues, False once the settings are
+            chosen.
+        """
+        current = self._snapshot()
+        previous, self._previous = self._previous, current
+        if previous is None:
+            self._best_settings = self._workers()
+            return True
+
+        elapsed = current[0] - previous[0]
+        throughput = (current[1] - previous[1]) / elapsed
+        busy = {name: (current[2][name] - previous[2][name]) /
+                (self.stages[name].workers * elapsed)
+                for name in current[2]}
+        settings = self._workers()
+        self.history.append((settings, throughput))
+        logger.debug('Auto-tuning: %s, %.0f bytes/s', settings, throughput)
+
+        if throughput > self._best * (1 + self.tolerance):
+            self._best, self._best_settings = throughput, settings
+            if len(self.history) < self.max_windows and self._grow(busy):
+                return True
+        else:
+            # The last worker added did not help
+            self._apply(self._best_settings)
+
+        self.settings = self._best_settings
+        self.throughput = self._best
+        logger.info('Auto-tuning chose %s (%.0f bytes/s): %s',
+                    self.options(), self._best, self._best_settings)
+        return False
+
+    def _run(self):
+        # The first files take longer (compilation of the Relaxng schema)
+        while self.last.n_jobs == 0:
+            if self._stop.wait(0.1):
+                return
+
+        self.update()
+        while True:
+            if self._stop.wait(self.window):
+                # End of the run before the end of the measurements
+                return
+            if not self.update():
+                return
+            # The new worker is measured once it is initialised
+            if not self._ready():
+                while not self._ready():
+                    if self._stop.wait(0.1):
+                        return
+                self._previous = self._snapshot()
+
+    def options(self):
+        """Return the command line options which give the settings
+        chosen."""
+        settings = self.settings or self._workers()
+        options = []
+        for name, option in ((self.convert, '--processes' if self.pool
+                              else '--workers'),
+                             (self.validate, '--validators'),
+                             ('read', '--io-workers'),
+                             ('write', '--writers')):
+            if name in settings:
+                options.append('{}={}'.format(option, settings[name]))
+        return ' '.join(options)
+
+    def start(self):
+        """Start the measurements in a thread."""
+        self._thread = threading.Thread(target=self._run,
+                                        name='exegis-tuning', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the measurements (the settings are kept)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def summary(self):
+        """Return a string which summarise the choice."""
+        if self.settings is None:
+            return 'Auto-tuning not finished, last settings: {}'.format(
+                self.options())
+        return 'Auto-tuning chose {} ({:.0f} bytes/s after {} ' \
+               'measurements)'.format(self.options(), self.throughput,
+                                      len(self.history))
@@ -17,4 +17,49 @@ from exegis.aphorisms_to_xml import Process, \
 # Module
 from exegis.footnotes import Footnote, Footnotes, FootnotesException
 import exegis.analysis as analysis
-import exegis.title as title
\ No newline at end of file
+import exegis.title as title
+from exegis.discovery import Discovery, DiscoveryException, largest_first
+from exegis.pipeline import Job, Stage, Pipeline, PipelineException
+import exegis.pipeline as pipeline
+from exegis.pool import (WorkerPool, PoolException, WorkerTimeout,
+                         WorkerCrash, TaskError)
+from exegis.discovery import TextFile
+import exegis.shard as shard
+from exegis.spool import Spool
+import exegis.timings as timings
+import exegis.profiling as profiling
+import exegis.metrics as metrics
+import exegis.conf as conf
+import exegis.api as api
+import exegis.aio as aio
+from exegis.server import Engine, Server, ServerException
+from exegis.client import Client, ClientException, connection
+import exegis.stdio as stdio
+from exegis.stdio import StdioException
+from exegis.journal import Journal, JournalException
+import exegis.journal as journal
+from exegis.tuning import AutoTuner
+import exegis.tuning as tuning
+import exegis.lint as lint
+from exegis.anchors import Anchors
+from exegis.fragments import FragmentCache, FragmentsException
+import exegis.fragments as fragments
+import exegis.main as main
+
+path_testdata = os.path.join(os.path.dirname(file_path), 'test_files')
+
+
+def read_text(name):
+    """Return the content of a file of the test data."""
+    with open(os.path.join(path_testdata, name), 'r',
+              encoding="utf-8") as f:
+        return f.read()
+
+
+def make_inputs(n):
+    """Return n documents ``(name, text)``, one in three cannot be
+    converted."""
+    good = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    bad = read_text('aphorisms_wrong_numeration.txt')
+    return [('doc_{}.txt'.format(i), bad if i % 3 == 0 else good)
+            for i in range(1, n + 1)]
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+from .conftest import exegis, api, aio, read_text, make_inputs
+
+
+def test_convert_async():
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+
+    async def main():
+        return await exegis.convert_async(text, doc_num=2)
+
+    result = asyncio.run(main())
+    assert result.ok
+    assert result.valid is True
+    assert result.xml == api.convert(text, doc_num=2).xml
+
+
+def test_converter_processes():
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+
+    async def main():
+        async with aio.AsyncConverter(processes=2, validate=False) as conv:
+            return await asyncio.gather(*[conv.convert(text, i)
+                                          for i in range(1, 5)])
+
+    results = asyncio.run(main())
+    for i, result in enumerate(results, 1):
+        assert result.ok
+        assert result.valid is None
+        assert result.xml == api.convert(text, i, validate=False).xml
+
+
+def test_converter_several_loops():
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    converter = aio.AsyncConverter(processes=0, limit=1, validate=False)
+    results = []
+
+    async def other():
+        results.append(await converter.convert(text, 2))
+        return converter._semaphore()
+
+    async def main():
+        results.append(await converter.convert(text, 1))
+        semaphore = converter._semaphore()
+        # Another event loop uses the converter in the meantime
+        thread = threading.Thread(
+            target=lambda: results.append(asyncio.run(other())))
+        thread.start()
+        thread.join()
+        assert converter._semaphore() is semaphore
+        return semaphore
+
+    semaphore = asyncio.run(main())
+    converter.close()
+
+    assert [result.ok for result in results[:2]] == [True, True]
+    # One semaphore for each event loop
+    assert results[2] is not semaphore
+
+
+def test_convert_many_async_ordered():
+    inputs = make_inputs(7)
+
+    async def source():
+        for document in inputs:
+            yield document
+
+    async def main():
+        async with aio.AsyncConverter(processes=0, threads=2,
+                                      validate=False) as conv:
+            return [result async for result in conv.convert_many(source())]
+
+    results = asyncio.run(main())
+    assert [result.name for result in results] == \
+        [name for name, _ in inputs]
+    assert [result.ok for result in results] == \
+        [i % 3 != 0 for i in range(1, 8)]
+
+
+def test_convert_many_async_unordered():
+    inputs = make_inputs(6)
+
+    async def main():
+        return [result async for result in
+                exegis.convert_many_async(inputs, ordered=False,
+                                          validate=False)]
+
+    results = asyncio.run(main())
+    assert sorted(result.name for result in results) == \
+        sorted(name for name, _ in inputs)
+
+
+def test_convert_many_async_cancel():
+    read = []
+
+    def source():
+        for name, text in make_inputs(50):
+            read.append(name)
+            yield name, text
+
+    async def main():
+        async with aio.AsyncConverter(processes=0, limit=2,
+                                      validate=False) as conv:
+            results = conv.convert_many(source())
+            first = await results.__anext__()
+            await results.aclose()
+            return first
+
+    assert asyncio.run(main()).name == 'doc_1.txt'
+    assert len(read) < 5
@@ -0,0 +1,99 @@
+import os
+
+from .conftest import (Anchors, Process, Footnotes, analysis, api, pipeline,
+                       Job, read_text, path_testdata)
+
+
+def _anchors(n):
+    anchors = Anchors()
+    for i in range(1, n + 1):
+        anchors.anchor('begin_fn{}'.format(i))
+        anchors.anchor('end_fn{}'.format(i))
+    return anchors
+
+
+def test_anchors_consistent():
+    anchors = _anchors(3)
+    for i in (1, 2, 3):
+        anchors.app('begin_fn{}'.format(i), 'end_fn{}'.format(i))
+    assert anchors.consistent
+    assert anchors.problems() == []
+
+
+def test_anchors_orphans_duplicates():
+    anchors = _anchors(3)
+    anchors.anchor('begin_fn2')
+    anchors.app('begin_fn1', 'end_fn1')
+    anchors.app('begin_fn1', 'end_fn1')
+    anchors.app('begin_fn4', 'end_fn4')
+    assert not anchors.consistent
+    assert anchors.orphans() == ['begin_fn2', 'end_fn2', 'begin_fn3',
+                                 'end_fn3']
+    assert anchors.missing() == ['begin_fn4', 'end_fn4']
+    assert anchors.problems() == [
+        'Anchors without apparatus: begin_fn2, end_fn2, begin_fn3, end_fn3',
+        'Apparatus referencing missing anchors: begin_fn4, end_fn4',
+        'Anchors created twice: begin_fn2',
+        'Apparatus created twice: begin_fn1-end_fn1']
+
+
+def test_footnotes_anchors():
+    anchors = Anchors()
+    xml, next_footnote = analysis.footnotes('one *1* two #three four*2*', 1,
+                                            anchors)
+    assert next_footnote == 3
+    assert list(anchors.anchors) == ['begin_fn1', 'end_fn1', 'begin_fn2',
+                                     'end_fn2']
+
+    footnotes = Footnotes('*1*aaaa ] W1 om. W2.\n*2*bbbb ] add. cccc W1.')
+    footnotes.xml_app(anchors)
+    assert anchors.apps == {('begin_fn1', 'end_fn1'), ('begin_fn2', 'end_fn2')}
+    assert anchors.consistent
+
+
+def test_process_consistent():
+    comtoepi = Process()
+    comtoepi._text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    comtoepi.convert()
+    assert comtoepi.consistent
+    assert len(comtoepi.anchors.anchors) == 2 * len(comtoepi.anchors.apps)
+
+    # The footnote *2* is missing in the text: the next symbols are not
+    # found and the apparatus 2 to 20 have no anchors
+    comtoepi = Process()
+    comtoepi._text = read_text('aphorisms_references_failed.txt').strip()
+    comtoepi.convert()
+    assert not comtoepi.consistent
+    assert comtoepi.anchors.missing()[:2] == ['begin_fn2', 'end_fn2']
+    assert 'anchors' in comtoepi.timings.record()['phases']
+
+
+def test_convert_not_consistent(tmpdir):
+    text = read_text('aphorisms_references_failed.txt')
+    result = api.convert(text, validate=False)
+    assert result.xml is not None
+    assert result.valid is False
+    assert not result.ok
+    assert any(error.startswith('Footnotes not consistent with the '
+                                'apparatus: Apparatus referencing missing')
+               for error in result.errors)
+
+    # The Relaxng validation is not done
+    relaxng = tmpdir.join('schema.rng')
+    relaxng.write('not a schema')
+    result = api.convert(text, relaxng=str(relaxng))
+    assert result.valid is False
+    assert 'validate' not in result.timings['phases']
+
+
+def test_pipeline_not_consistent(tmpdir):
+    fname = os.path.join(path_testdata, 'aphorisms_references_failed.txt')
+    job = Job(fname, 'aphorisms_1.txt')
+    pipeline.read(job)
+    pipeline.convert(job, output_dir=str(tmpdir))
+    assert job.status == 'invalid'
+    assert job.error == 'Footnotes not consistent with the apparatus'
+    # Not validated
+    job.relaxng_fname = str(tmpdir.join('missing.rng'))
+    pipeline.validate(job)
+    assert job.status == 'invalid'
@@ -0,0 +1,118 @@
+import os
+import threading
+
+from .conftest import exegis, api, pipeline, read_text, make_inputs
+
+
+def test_convert_in_memory(tmpdir):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    with tmpdir.as_cwd():
+        result = exegis.convert(text)
+        assert os.listdir('.') == []
+        xml = pipeline.render('aphorism_1.txt', text)[0]
+
+    assert result.ok
+    assert result.valid is True
+    assert result.errors == []
+    assert result.xml == xml.encode('utf-8')
+    assert 'validate' in result.timings['phases']
+    assert result.timings['units'] > 0
+
+
+def test_convert_doc_num_no_validation():
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    result = api.convert(text, doc_num=3, validate=False)
+    assert result.ok
+    assert result.valid is None
+    assert b'<div n="3" type="Title_section">' in result.xml
+
+
+def test_convert_error():
+    result = api.convert(read_text('aphorisms_wrong_numeration.txt'),
+                         validate=False)
+    assert not result.ok
+    assert result.xml is None
+    assert 'Missing or problematic aphorism: [1]' in result.errors
+
+
+def test_convert_threads():
+    good = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    bad = read_text('aphorisms_wrong_numeration.txt')
+    results = {}
+
+    def convert(i):
+        results[i] = api.convert(bad if i % 2 else good, doc_num=i + 1,
+                                 validate=False)
+
+    threads = [threading.Thread(target=convert, args=(i,))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, result in results.items():
+        if i % 2:
+            assert not result.ok
+            assert 'Conversion of the document {} failed'.format(i + 1) \
+                in result.errors
+            assert len(result.errors) == 3
+        else:
+            assert result.ok
+            assert result.errors == []
+
+
+def test_load_template_cached():
+    assert api.load_template() is api.load_template()
+
+
+def test_doc_number():
+    assert api.doc_number('texts/file_2.txt') == 2
+    assert api.doc_number('file.txt') == 1
+    assert api.doc_number(None) == 1
+
+
+def test_convert_many_ordered():
+    inputs = make_inputs(10)
+    results = list(api.convert_many(iter(inputs), jobs=2))
+    assert [result.name for result in results] == \
+        [name for name, _ in inputs]
+    for i, result in enumerate(results, 1):
+        assert result.ok == (i % 3 != 0)
+        if result.ok:
+            assert result.valid is True
+            assert '<div n="{}" type="Title_section">'.format(i).encode() \
+                in result.xml
+
+
+def test_convert_many_unordered_serial():
+    inputs = make_inputs(6)
+    results = list(exegis.convert_many(inputs, jobs=2, ordered=False,
+                                       validate=False))
+    assert sorted(result.name for result in results) == \
+        sorted(name for name, _ in inputs)
+    serial = list(api.convert_many(inputs, validate=False))
+    assert {r.name: r.xml for r in results} == \
+        {r.name: r.xml for r in serial}
+
+
+def test_convert_many_cancel():
+    read = []
+
+    def inputs():
+        for name, text in make_inputs(50):
+            read.append(name)
+            yield name, text
+
+    results = api.convert_many(inputs(), jobs=2, validate=False)
+    assert next(results).name == 'doc_1.txt'
+    results.close()
+    assert len(read) < 10
+
+    cancel = threading.Event()
+    done = []
+    for result in api.convert_many(make_inputs(20), cancel=cancel,
+                                   validate=False):
+        done.append(result)
+        cancel.set()
+    assert len(done) == 1
@@ -0,0 +1,46 @@
+import os
+import logging
+
+from .conftest import conf, WorkerPool
+
+
+def log_in_worker(message):
+    logging.getLogger('exegis').warning('%s from %d', message, os.getpid())
+    return os.getpid()
+
+
+def test_log_fname(tmpdir):
+    fname = conf.log_fname(str(tmpdir.join('logs')))
+    assert os.path.isdir(str(tmpdir.join('logs')))
+    assert os.path.basename(fname).startswith('exegis-')
+    assert fname.endswith('-{}.log'.format(os.getpid()))
+
+
+def test_setup_logging_level(tmpdir):
+    fname = str(tmpdir.join('run.log'))
+    try:
+        conf.setup_logging(level='info', fname=fname)
+        conf.logger.debug('not written %s', 'debug')
+        conf.logger.info('written %s', 'info')
+    finally:
+        conf.stop_logging()
+    with open(fname) as f:
+        text = f.read()
+    assert 'written info' in text
+    assert 'not written' not in text
+    assert not logging.getLogger().handlers
+
+
+def test_worker_logs_sent_to_parent(tmpdir):
+    fname = str(tmpdir.join('run.log'))
+    try:
+        conf.setup_logging(fname=fname)
+        with WorkerPool(2) as pool:
+            assert pool.log_queue is not None
+            pids = {pool.run(log_in_worker, 'hello') for _ in range(4)}
+    finally:
+        conf.stop_logging()
+    with open(fname) as f:
+        text = f.read()
+    for pid in pids:
+        assert 'hello from {}'.format(pid) in text
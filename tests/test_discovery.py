@@ -0,0 +1,60 @@
+import os
+import pytest
+
+from .conftest import Discovery, DiscoveryException, largest_first
+
+
+def create_corpus(folder):
+    """Create a small corpus with subfolders and files to ignore"""
+    folder.join('aphorisms_1.txt').write('a' * 10)
+    folder.join('binary.bin').write('b')
+    folder.mkdir('sub').join('aphorisms_2.txt').write('a' * 30)
+    folder.join('sub').mkdir('subsub').join('aphorisms_3.TXT').write('a')
+    folder.mkdir('drafts').join('draft_1.txt').write('a' * 20)
+
+
+def test_discovery_recursive(tmpdir):
+    create_corpus(tmpdir)
+    discovery = Discovery(str(tmpdir))
+    relpaths = [f.relpath for f in discovery]
+    assert relpaths == ['aphorisms_1.txt',
+                        os.path.join('drafts', 'draft_1.txt'),
+                        os.path.join('sub', 'aphorisms_2.txt'),
+                        os.path.join('sub', 'subsub', 'aphorisms_3.TXT')]
+    assert discovery.n_files == 4
+    assert discovery.n_bytes == 61
+    assert discovery.n_skipped == 1
+
+
+def test_discovery_include_exclude(tmpdir):
+    create_corpus(tmpdir)
+    discovery = Discovery(str(tmpdir), include=['aphorisms_*'],
+                          exclude=['subsub'])
+    relpaths = [f.relpath for f in discovery]
+    assert relpaths == ['aphorisms_1.txt',
+                        os.path.join('sub', 'aphorisms_2.txt')]
+
+
+def test_discovery_extensions(tmpdir):
+    create_corpus(tmpdir)
+    discovery = Discovery(str(tmpdir), extensions=['.bin'])
+    assert [f.relpath for f in discovery] == ['binary.bin']
+    discovery = Discovery(str(tmpdir), extensions=[])
+    assert len(list(discovery)) == 5
+
+
+def test_discovery_file(tmpdir):
+    create_corpus(tmpdir)
+    fname = str(tmpdir.join('aphorisms_1.txt'))
+    assert [f.path for f in Discovery(fname)] == [fname]
+
+
+def test_discovery_path_not_found():
+    with pytest.raises(DiscoveryException):
+        list(Discovery('do not exist'))
+
+
+def test_largest_first(tmpdir):
+    create_corpus(tmpdir)
+    sizes = [f.size for f in largest_first(Discovery(str(tmpdir)))]
+    assert sizes == [30, 20, 10, 1]
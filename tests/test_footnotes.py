@@ -582,5 +582,13 @@ def test_footnotes_xml_app():
     pass
 
 
+def test_footnotes_kinds():
+    footnotes = Footnotes(['*1*ssss tttt ] conieci: aaaa bbbb L5: om. Y',
+                           '*2*ssss tttt ] add. L5',
+                           '*3*ssss tttt ] aaaa L5'])
+    footnotes.xml_app()
+    assert footnotes.kinds == {'omission': 1, 'addition': 1, 'standard': 1}
+
+
 def test_save_xml():
     pass
@@ -0,0 +1,184 @@
+import pytest
+
+from .conftest import (api, pipeline, fragments, FragmentCache,
+                       FragmentsException, read_text)
+
+
+# Relaxng schema compiled quickly, the element bogus is not valid
+SCHEMA = '''<grammar xmlns="http://relaxng.org/ns/structure/1.0"
+  ns="http://www.tei-c.org/ns/1.0">
+<start><ref name="TEI"/></start>
+<define name="TEI"><element name="TEI"><ref name="content"/></element></define>
+<define name="teiHeader"><element name="teiHeader"><ref name="content"/>
+</element></define>
+<define name="div"><element name="div"><ref name="content"/></element>
+</define>
+<define name="app"><element name="app"><ref name="content"/></element>
+</define>
+<define name="content"><zeroOrMore><choice>
+<attribute><anyName/></attribute><text/>
+<element><anyName><except><nsName/><name>bogus</name></except></anyName>
+<ref name="content"/></element>
+<element><nsName><except><name>bogus</name></except></nsName>
+<ref name="content"/></element>
+</choice></zeroOrMore></define>
+</grammar>'''
+
+
+@pytest.fixture
+def relaxng(tmpdir):
+    fname = tmpdir.join('schema.rng')
+    fname.write(SCHEMA)
+    return str(fname)
+
+
+@pytest.fixture
+def xml():
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    return pipeline.render('aphorism_1.txt', text)[0]
+
+
+def _edit(xml, old, new):
+    assert old in xml
+    return xml.replace(old, new, 1)
+
+
+def test_only_changed_fragments_validated(relaxng, xml):
+    cache = FragmentCache()
+    n_fragments = fragments.validate_fragments(xml, relaxng, cache)
+    assert n_fragments > 3
+    assert cache.n_validated == n_fragments
+
+    # Nothing changed
+    assert fragments.validate_fragments(xml, relaxng, cache) == 0
+
+    # One div changed
+    xml = _edit(xml, '<p>', '<p>changed ')
+    assert fragments.validate_fragments(xml, relaxng, cache) == 1
+    assert cache.n_fragments == 3 * n_fragments
+    assert cache.n_validated == n_fragments + 1
+
+
+def test_fragment_not_valid(relaxng, xml):
+    cache = FragmentCache()
+    fragments.validate_fragments(xml, relaxng, cache)
+    invalid = _edit(xml, '</app>', '<bogus/></app>')
+    with pytest.raises(FragmentsException):
+        fragments.validate_fragments(invalid, relaxng, cache)
+    # The fragment not valid is not cached
+    with pytest.raises(FragmentsException):
+        fragments.validate_fragments(invalid, relaxng, cache)
+
+
+def test_frame_not_valid(relaxng, xml):
+    invalid = _edit(xml, '</teiHeader>', '</teiHeader><bogus/>')
+    cache = FragmentCache()
+    with pytest.raises(FragmentsException):
+        fragments.validate_fragments(invalid, relaxng, cache)
+    assert len(cache) == 0
+
+
+def test_schema_changed(relaxng, xml):
+    cache = FragmentCache()
+    n_fragments = fragments.validate_fragments(xml, relaxng, cache)
+    with open(relaxng, 'a', encoding="utf-8") as f:
+        f.write('\n')
+    assert fragments.validate_fragments(xml, relaxng, cache) == n_fragments
+
+
+def test_schema_changed_during_run(tmpdir, relaxng, xml):
+    any_relaxng = tmpdir.join('any.rng')
+    any_relaxng.write(SCHEMA.replace('<name>bogus</name>',
+                                     '<name>nothing</name>'))
+    invalid = _edit(xml, '</app>', '<bogus/></app>')
+    cache = FragmentCache()
+    fragments.validate_fragments(invalid, str(any_relaxng), cache)
+
+    # The new version of the file is compiled
+    any_relaxng.write(SCHEMA)
+    with pytest.raises(FragmentsException):
+        fragments.validate_fragments(invalid, str(any_relaxng), cache)
+
+
+def test_cache_file(tmpdir, relaxng, xml):
+    fname = str(tmpdir.join('fragments.cache'))
+    cache = FragmentCache(fname)
+    n_fragments = fragments.validate_fragments(xml, relaxng, cache)
+    cache.save()
+    # A line partially written is ignored
+    with open(fname, 'a', encoding="utf-8") as f:
+        f.write('0123')
+
+    cache = FragmentCache(fname)
+    assert len(cache) == n_fragments + 1
+    assert fragments.validate_fragments(xml, relaxng, cache) == 0
+    assert '0 validated' in cache.summary()
+
+
+def test_pipeline_validate(relaxng, xml):
+    cache = FragmentCache()
+    job = pipeline.Job('aphorism_1.txt')
+    job.xml, job.relaxng_fname, job.output = xml, relaxng, 'aphorism_1.xml'
+    pipeline.validate(job, fragments=cache)
+    assert job.status == 'ok'
+    n_validated = cache.n_validated
+
+    job.xml = _edit(xml, '</app>', '<bogus/></app>')
+    pipeline.validate(job, fragments=cache)
+    assert job.status == 'invalid'
+    assert job.error == 'XML not valid'
+    assert cache.n_validated == n_validated + 1
+
+
+def test_context_check(relaxng):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    cache = FragmentCache()
+    context = api.Context(relaxng=relaxng, fragments=cache)
+    result = context.check(context.parse(text, name='aphorism_1.txt'))
+    assert result.valid is True
+    assert len(cache) > 0
+
+    n_validated = cache.n_validated
+    result = context.check(context.parse(text, name='aphorism_1.txt'))
+    assert result.valid is True
+    assert cache.n_validated == n_validated
+
+    result = context.check(context.parse(text, name='aphorism_1.txt'),
+                           full=True)
+    assert result.valid is True
+    assert cache.n_validated == n_validated
+
+
+def test_tei_all(xml):
+    # Schema of the template (tei_all), compiled once by thread
+    relaxng = pipeline.render('aphorism_1.txt', read_text(
+        'aphorism_with_intro_title_text_footnotes.txt'))[2]
+    cache = FragmentCache()
+    n_fragments = fragments.validate_fragments(xml, relaxng, cache)
+    assert fragments.validate_fragments(xml, relaxng, cache) == 0
+
+    # Text in the last paragraph of an aphorism and in an apparatus
+    index = xml.index('</div>', xml.index('type="aphorism"'))
+    edited = xml[:index].rstrip()[:-len('</p>')] + 'changed </p>' + \
+        xml[index:]
+    edited = _edit(edited, '</rdg>', ' changed</rdg>')
+    assert fragments.validate_fragments(edited, relaxng, cache) == 2
+    assert len(cache) == n_fragments + 1 + 2
+
+
+def test_tei_all_not_valid(xml):
+    relaxng = pipeline.render('aphorism_1.txt', read_text(
+        'aphorism_with_intro_title_text_footnotes.txt'))[2]
+    cache = FragmentCache()
+    fragments.validate_fragments(xml, relaxng, cache)
+
+    # Text directly in a div is not valid TEI, the other change is
+    invalid = _edit(xml, 'type="aphorism">', 'type="aphorism">changed ')
+    invalid = _edit(invalid, '</rdg>', ' changed</rdg>')
+    with pytest.raises(FragmentsException, match='1 fragments'):
+        fragments.validate_fragments(invalid, relaxng, cache)
+    # Only the valid fragment is in the cache
+    n_validated = cache.n_validated
+    with pytest.raises(FragmentsException):
+        fragments.validate_fragments(invalid, relaxng, cache)
+    assert cache.n_validated == n_validated + 1
@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+
+file_path = os.path.realpath(__file__)
+root = os.path.join(os.path.dirname(file_path), '..')
+
+
+def run_python(code, cwd):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env,
+                          stdout=subprocess.PIPE, check=True,
+                          universal_newlines=True).stdout
+
+
+def test_import_without_side_effect(tmpdir):
+    """Importing the command line interface must not import lxml or
+    pkg_resources and must not create the log file."""
+    out = run_python('import sys, exegis.main;'
+                     'print(" ".join(sorted(sys.modules)))', str(tmpdir))
+    modules = out.split()
+    assert 'lxml' not in modules
+    assert 'pkg_resources' not in modules
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_version_no_log_file(tmpdir):
+    out = run_python('import exegis.main\n'
+                     'try:\n'
+                     '    exegis.main.main(["--version"])\n'
+                     'except SystemExit:\n'
+                     '    pass', str(tmpdir))
+    assert out.strip() == run_python('import exegis;'
+                                     'print(exegis.__version__)',
+                                     str(tmpdir)).strip()
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_template_files_exist():
+    from exegis.conf import TEMPLATE_FNAME, RELAXNG_FNAME
+    assert os.path.isfile(TEMPLATE_FNAME)
+    assert os.path.isfile(RELAXNG_FNAME)
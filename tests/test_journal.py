@@ -0,0 +1,140 @@
+import os
+import json
+
+import pytest
+
+import exegis.main
+from .conftest import Job, TextFile, Journal, JournalException, journal
+
+file_path = os.path.realpath(__file__)
+path_testdata = os.path.join(os.path.dirname(file_path), 'test_files')
+
+# Relaxng schema compiled quickly which accepts any document
+ANY = '''<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+<start><ref name="any"/></start>
+<define name="any"><element><anyName/><zeroOrMore><choice>
+<attribute><anyName/></attribute><text/><ref name="any"/>
+</choice></zeroOrMore></element></define>
+</grammar>'''
+
+
+def _job(path, status='ok', output=None, text='text'):
+    job = Job(path, os.path.basename(path), len(text))
+    job.text_hash = journal.text_hash(text)
+    job.status = status
+    job.output = output
+    return job
+
+
+def test_batch_and_close(tmpdir):
+    fname = str(tmpdir.join('journal.jsonl'))
+    with Journal(fname, batch=2, interval=60) as j:
+        j.add(_job('a.txt'))
+        assert os.path.getsize(fname) == 0
+        j.add(_job('b.txt'))
+        assert len(journal.load(fname)) == 2
+        j.add(_job('c.txt', status='failed'))
+    records = journal.load(fname)
+    assert sorted(records) == ['a.txt', 'b.txt', 'c.txt']
+    assert records['c.txt']['status'] == 'failed'
+    assert records['a.txt']['hash'] == journal.text_hash('text')
+
+    # Without resume the journal is started again
+    Journal(fname).close()
+    assert journal.load(fname) == {}
+
+
+def test_interval(tmpdir):
+    fname = str(tmpdir.join('journal.jsonl'))
+    j = Journal(fname, batch=100, interval=0.01)
+    j.add(_job('a.txt'))
+    j._stop.wait(0.5)
+    assert 'a.txt' in journal.load(fname)
+    j.close()
+
+
+def test_torn_last_line(tmpdir):
+    fname = tmpdir.join('journal.jsonl')
+    fname.write(json.dumps({'path': 'a.txt', 'status': 'ok'}) + '\n' +
+                '{"path": "b.t')
+    with Journal(str(fname), resume=True) as j:
+        assert sorted(j.records) == ['a.txt']
+        j.add(_job('c.txt'))
+    assert sorted(journal.load(str(fname))) == ['a.txt', 'c.txt']
+
+    fname.write('{"path"')
+    with Journal(str(fname), resume=True) as j:
+        assert j.records == {}
+    assert fname.read() == ''
+
+
+def test_open_error(tmpdir):
+    with pytest.raises(JournalException):
+        Journal(str(tmpdir.join('missing', 'journal.jsonl')))
+
+
+def test_pending(tmpdir):
+    texts = tmpdir.mkdir('texts')
+    outputs = tmpdir.mkdir('XML')
+    files = []
+    for name in ('a', 'b', 'c', 'd', 'e'):
+        texts.join(name + '.txt').write('text')
+        outputs.join(name + '.xml').write('<xml/>')
+        files.append(TextFile(str(texts.join(name + '.txt')), name + '.txt',
+                              4))
+
+    fname = str(tmpdir.join('journal.jsonl'))
+    with Journal(fname) as j:
+        for name, status in (('a', 'ok'), ('b', 'invalid'), ('c', 'ok'),
+                             ('d', 'failed'), ('e', 'ok')):
+            job = _job(str(texts.join(name + '.txt')), status,
+                       str(outputs.join(name + '.xml')))
+            job.output_size = 6
+            job.quarantined = name == 'e'
+            j.add(job)
+
+    # c changed (same size), its XML is converted again
+    texts.join('c.txt').write('TEXT')
+    outputs.join('b.xml').remove()
+    with Journal(fname, resume=True) as j:
+        pending = [f.relpath for f in j.pending(files)]
+        assert pending == ['b.txt', 'c.txt', 'e.txt']
+        assert j.n_skipped == 2
+
+
+def test_resume_run(tmpdir):
+    texts = tmpdir.mkdir('texts')
+    with open(os.path.join(path_testdata,
+                           'aphorism_with_intro_title_text_footnotes.txt'),
+              'r', encoding="utf-8") as f:
+        text = f.read()
+    for i in range(1, 5):
+        texts.join('text_{}.txt'.format(i)).write(text)
+    tmpdir.join('any.rng').write(ANY)
+    args = [str(texts), '--relaxng=any.rng', '--journal=journal.jsonl']
+
+    with tmpdir.as_cwd():
+        exegis.main.main(args)
+        records = journal.load('journal.jsonl')
+        assert sorted(records) == ['text_{}.txt'.format(i)
+                                   for i in range(1, 5)]
+        assert all(record['status'] == 'ok' for record in records.values())
+        with open(records['text_2.txt']['output'], 'r',
+                  encoding="utf-8") as f:
+            assert records['text_2.txt']['output_hash'] == \
+                journal.text_hash(f.read())
+
+        # Interrupted run: the last record is lost, the file is changed
+        with open('journal.jsonl', 'r', encoding="utf-8") as f:
+            lines = f.readlines()
+        with open('journal.jsonl', 'w', encoding="utf-8") as f:
+            f.writelines(lines[:-1])
+        last = json.loads(lines[-1])['path']
+        texts.join('text_1.txt').write(text + '\n')
+
+        exegis.main.main(args + ['--resume', '--manifest=manifest.json'])
+        with open('manifest.json', 'r', encoding="utf-8") as f:
+            converted = [record['path']
+                         for record in json.load(f)['files']]
+        assert sorted(converted) == sorted({'text_1.txt', last})
+        assert len(journal.load('journal.jsonl')) == 4
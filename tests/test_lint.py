@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+import exegis.main
+from .conftest import api, lint, read_text, path_testdata
+
+
+# Document with one problem of each kind
+BROKEN = '''The title*1*
+1.
+*2*First aphorism [W1 12r].
+A commentary with a reference [W1W2] and *4*.
+3.
+Third aphorism with a reference [W2 13v.
+3.
+Again the third aphorism*5*.
+*1*aaaa ] W1 om. W2.
+*2*bbbb ] correxi: cccc W1.
+*3*dddd ] add. eeee W2.
+*4*ffff W3.
+'''
+
+
+@pytest.mark.parametrize('name', [
+    'aphorisms.txt',
+    'aphorism_no_intro_title_text_footnotes.txt',
+    'aphorism_with_intro_title_text_footnotes.txt'])
+def test_lint_valid(name):
+    assert lint.lint(read_text(name)) == []
+
+
+def test_lint_all_problems():
+    issues = [(issue.line, issue.level) + (issue.message,)
+              for issue in lint.lint(BROKEN)]
+    assert issues == [
+        (3, 'error', 'Missing a space or "#" before the footnote *2* to '
+                     'determine the word(s) it applies to'),
+        (4, 'error', 'Reference [W1W2] without space between the witness '
+                     'and the location'),
+        (4, 'error', 'Footnote *3* missing before *4*'),
+        (5, 'error', 'Missing or problematic aphorism: 2'),
+        (6, 'error', 'Reference not closed (missing "]"): [W2 13v.'),
+        (7, 'error', 'Aphorism with same number: 3 (line 5)'),
+        (8, 'error', 'Footnote *5* not in the footnote section'),
+        (11, 'error', 'Footnote *3* not referenced in the text'),
+        (12, 'warning', 'Footnote *4* not understood, added as a note: '
+                        'missing "]" after the text')]
+
+
+def test_lint_footnote_section():
+    issues = lint.lint('Title\n1.\nAphorism *1*.\n')
+    assert [issue.message for issue in issues] == \
+        ['Footnote referenced in the text but no footnote section present']
+    assert issues[0].line is None
+
+    text = 'Title\n1.\nAphorism *1*. Text *2*.\n*1*aaaa ] W1 om. W2.\n\n' \
+           '*3*bbbb ] add. cccc W2.\n'
+    assert [(issue.line, issue.message) for issue in lint.lint(text)] == [
+        (3, 'Footnote *2* not in the footnote section'),
+        (5, 'Empty line in the footnote section'),
+        (6, 'Footnote *3* out of order (expected *2*)'),
+        (6, 'Footnote *3* not referenced in the text')]
+
+
+def test_lint_numeration():
+    issues = lint.lint(read_text('aphorisms_wrong_numeration.txt'))
+    assert [issue.level for issue in issues] == \
+        ['warning', 'warning', 'error']
+    assert issues[0].message.startswith('Aphorism number not well formed')
+    assert issues[2].message == 'Missing or problematic aphorism: 1'
+
+
+def test_lint_conversion():
+    # The files which cannot be converted have errors
+    for name in sorted(os.listdir(path_testdata)):
+        if not name.startswith('aphorism'):
+            continue
+        text = read_text(name)
+        errors = [issue for issue in lint.lint(text)
+                  if issue.level == lint.ERROR]
+        if api.convert(text, validate=False).xml is None:
+            assert errors, name
+
+
+def test_lint_file(tmpdir):
+    issues = lint.lint_file(str(tmpdir.join('missing.txt')))
+    assert issues[0].level == 'error'
+    assert issues[0].message.startswith('Unable to read the file')
+
+
+def test_main_check(tmpdir, capsys, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('good_1.txt').write(read_text('aphorisms.txt'))
+    exegis.main.main(['--check', str(tmpdir)])
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert err.startswith('1 files checked: 0 errors')
+
+    tmpdir.join('bad_2.txt').write(BROKEN)
+    with pytest.raises(SystemExit) as e:
+        exegis.main.main(['--check', str(tmpdir)])
+    assert e.value.code == 1
+    out, err = capsys.readouterr()
+    assert '{}:4: error: Footnote *3* missing before *4*'.format(
+        tmpdir.join('bad_2.txt')) in out.splitlines()
+    assert err.startswith('2 files checked: 8 errors, 1 warnings, 1 files')
+    # Nothing is converted, no log file
+    assert sorted(os.listdir(str(tmpdir))) == ['bad_2.txt', 'good_1.txt']
@@ -0,0 +1,88 @@
+import os
+import json
+import tracemalloc
+
+import pytest
+
+from .conftest import main, shard, Discovery, read_text
+
+
+# Relaxng schema compiled quickly which accepts any document
+ANY = '''<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+<start><ref name="any"/></start>
+<define name="any"><element><anyName/><zeroOrMore><choice>
+<attribute><anyName/></attribute><text/><ref name="any"/>
+</choice></zeroOrMore></element></define>
+</grammar>'''
+
+
+def test_missing_folder_largest_first(tmpdir):
+    with tmpdir.as_cwd():
+        with pytest.raises(SystemExit):
+            main.main(['missing_dir', '--largest-first',
+                       '--log-file=exegis.log'])
+        assert 'not found' in tmpdir.join('exegis.log').read()
+
+
+def test_shard_largest_first(tmpdir):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    corpus = tmpdir.mkdir('corpus')
+    for i in range(1, 7):
+        # Different sizes
+        corpus.join('file_{}.txt'.format(i)).write_text(
+            text + '\n' * i, encoding='utf-8')
+    relaxng = tmpdir.join('schema.rng')
+    relaxng.write(ANY)
+    selected = shard.select(Discovery(str(corpus)), 1, 3)
+    assert 0 < len(selected) < 6
+
+    with tmpdir.as_cwd():
+        main.main(['corpus', '--shard=1/3', '--largest-first',
+                   '--manifest=shard1.json', '--relaxng=schema.rng',
+                   '--log-file=exegis.log'])
+        with open('shard1.json', 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    assert sorted(record['path'] for record in manifest['files']) == \
+        sorted(f.relpath for f in selected)
+    assert sorted(os.listdir(str(tmpdir.join('XML')))) == \
+        sorted(os.path.splitext(f.relpath)[0] + '.xml' for f in selected)
+
+
+def test_trace_malloc_in_processes(tmpdir):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    corpus = tmpdir.mkdir('corpus')
+    for i in range(1, 4):
+        corpus.join('file_{}.txt'.format(i)).write_text(text,
+                                                        encoding='utf-8')
+    tmpdir.join('schema.rng').write(ANY)
+
+    with tmpdir.as_cwd():
+        main.main(['corpus', '--trace-malloc', '--workers=2',
+                   '--timings=timings.jsonl', '--relaxng=schema.rng',
+                   '--log-file=exegis.log'])
+        with open('timings.jsonl', 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+
+    # The threads of this process do not share the tracing
+    assert not tracemalloc.is_tracing()
+    assert len(records) == 3
+    assert all(record['memory']['body']['peak'] > 0 for record in records)
+
+
+def test_processes_auto(tmpdir):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    corpus = tmpdir.mkdir('corpus')
+    for i in range(1, 5):
+        corpus.join('file_{}.txt'.format(i)).write_text(text,
+                                                        encoding='utf-8')
+    tmpdir.join('schema.rng').write(ANY)
+
+    with tmpdir.as_cwd():
+        main.main(['corpus', '--processes=auto', '--tune-window=0.1',
+                   '--relaxng=schema.rng', '--manifest=manifest.json',
+                   '--log-file=exegis.log'])
+        with open('manifest.json', 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    assert manifest['summary']['ok'] == 4
@@ -0,0 +1,59 @@
+import os
+
+from .conftest import metrics, Job
+
+
+def test_counters_and_summary():
+    m = metrics.Metrics()
+    m.inc('files_total', status='ok')
+    m.inc('files_total', status='ok')
+    m.inc('files_total', status='failed')
+    m.inc('input_bytes_total', 2 * 1024 * 1024)
+    assert m.total('files_total') == 3
+    assert m.summary(2.) == ('3 files, 2.000 MB in 2.000 s: 1.50 files/s, '
+                             '1.000 MB/s')
+    text = m.text()
+    assert '# TYPE exegis_files_total counter' in text
+    assert 'exegis_files_total{status="ok"} 2' in text
+    assert 'exegis_files_total{status="failed"} 1' in text
+
+
+def test_histogram():
+    m = metrics.Metrics()
+    for value in (0.0005, 0.003, 0.2, 100.):
+        m.observe('phase_seconds', value, phase='body')
+    lines = m.text().splitlines()
+    assert '# TYPE exegis_phase_seconds histogram' in lines
+    assert 'exegis_phase_seconds_bucket{phase="body",le="0.001"} 1' in lines
+    assert 'exegis_phase_seconds_bucket{phase="body",le="0.005"} 2' in lines
+    assert 'exegis_phase_seconds_bucket{phase="body",le="60.0"} 3' in lines
+    assert 'exegis_phase_seconds_bucket{phase="body",le="+Inf"} 4' in lines
+    assert 'exegis_phase_seconds_count{phase="body"} 4' in lines
+
+
+def test_add_job():
+    job = Job('a_1.txt', size=100)
+    job.status = 'ok'
+    job.output_size = 400
+    job.stats = {'footnote_kinds': {'omission': 2},
+                 'phases': {'body': 0.01}}
+    job.timings = {'validate': 0.5}
+    m = metrics.Metrics()
+    m.add_job(job)
+    text = m.text()
+    assert 'exegis_output_bytes_total 400' in text
+    assert 'exegis_footnotes_total{kind="omission"} 2' in text
+    assert 'exegis_phase_seconds_count{phase="validate"} 1' in text
+
+
+def test_metrics_writer(tmpdir):
+    fname = str(tmpdir.join('exegis.prom'))
+    m = metrics.Metrics()
+    writer = metrics.MetricsWriter(m, fname, interval=60)
+    writer.start()
+    assert os.path.exists(fname)
+    m.inc('files_total', status='ok')
+    writer.stop()
+    with open(fname) as f:
+        assert 'exegis_files_total{status="ok"} 1' in f.read()
+    assert os.listdir(str(tmpdir)) == ['exegis.prom']
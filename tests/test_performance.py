@@ -0,0 +1,81 @@
+"""Tests of the analysis of pathological inputs.
+
+The inputs are the worst cases of the scans of the text (thousands of
+footnotes on one line, references starting with repeated ``[``, aphorisms
+separated by many empty lines...), the tests check the results. The growth
+of the time with the size of these inputs is measured by
+``benchmarks/bench_pathological.py`` (the measures of time are not reliable
+on a loaded machine).
+"""
+import pytest
+
+from .conftest import analysis, Process, AphorismsToXMLException
+
+
+def _footnotes_one_line(n):
+    """footnotes on one line"""
+    return ' ' + ' '.join('aaaa bbbb cccc dddd*{}*'.format(i)
+                          for i in range(1, n + 1))
+
+
+def _references_one_line(n):
+    """references on one line"""
+    return ' '.join('aaaa [W{} {}r] bbbb'.format(i % 5, i)
+                    for i in range(n))
+
+
+def _aphorisms(n):
+    """aphorisms"""
+    return '\n'.join('{}.\nAphorism aaaa.'.format(i)
+                     for i in range(1, n + 1))
+
+
+def _blank_lines(n):
+    """empty lines between aphorisms"""
+    return '1.\nAphorism aaaa.' + '\n' * n + '\n2.\nAphorism bbbb.'
+
+
+def _brackets(n):
+    """references starting with repeated ["""
+    return ' '.join('aaaa {}W1 {}r]'.format('[' * 10, i) for i in range(n))
+
+
+def test_footnotes_one_line():
+    xml, next_footnote = analysis.footnotes(_footnotes_one_line(2000), 1)
+    assert next_footnote == 2001
+    assert xml.count('            <anchor xml:id="begin_fn2000"/>') == 1
+    assert sum('<anchor' in line for line in xml) == 4000
+
+
+def test_references_one_line():
+    xml = analysis.references(_references_one_line(1000))
+    assert xml.count('<locus') == 1000
+    assert '<locus target="W4">999r</locus>' in xml
+
+
+def test_brackets():
+    xml = analysis.references(_brackets(2000))
+    assert xml.count('<locus') == 2000
+    assert '<locus target="[[[[[[[[[W1">1999r</locus>' in xml
+
+
+@pytest.mark.parametrize('make, n_aphorisms', [(_aphorisms, 2000),
+                                               (_blank_lines, 2)])
+def test_aphorisms_dict(make, n_aphorisms):
+    comtoepi = Process()
+    comtoepi._text = 'Title aaaa*1*\n' + make(2000) + '\n\n*1*aaaa ] W1.'
+    comtoepi.divide_document()
+    comtoepi.aphorisms_dict()
+    assert sorted(comtoepi._aph_com) == list(range(1, n_aphorisms + 1))
+
+
+def test_aphorisms_dict_errors():
+    comtoepi = Process()
+    comtoepi._text = '1.\naaaa\n3.\nbbbb\n3.\ncccc\n5.\ndddd'
+    with pytest.raises(AphorismsToXMLException,
+                       match='Aphorism with same number: \\[3\\]'):
+        comtoepi.aphorisms_dict()
+    comtoepi._text = '1.\naaaa\n3.\nbbbb\n4.\ncccc'
+    with pytest.raises(AphorismsToXMLException,
+                       match='Missing or problematic aphorism: \\[2\\]'):
+        comtoepi.aphorisms_dict()
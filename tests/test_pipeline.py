@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+import pytest
+
+from .conftest import (Job, Stage, Pipeline, PipelineException, pipeline,
+                       Discovery, read_text)
+
+
+def test_pipeline_order_of_stages():
+    done = []
+
+    def first(job):
+        job.text = 'first'
+
+    def second(job):
+        job.text += ' second'
+
+    stages = [Stage('first', first, workers=3, maxsize=2),
+              Stage('second', second, maxsize=1)]
+    pipe = Pipeline(stages, on_done=done.append)
+    pipe.run(Job(str(i)) for i in range(20))
+
+    assert len(done) == 20
+    assert {job.text for job in done} == {'first second'}
+    assert stages[0].n_jobs == 20
+    assert stages[1].n_jobs == 20
+    assert stages[0].max_depth <= 2
+    assert 'first' in pipe.report()
+
+
+def test_pipeline_failed_job_skip_next_stages():
+    done = []
+    called = []
+
+    def failing(job):
+        raise PipelineException('failed')
+
+    stages = [Stage('failing', failing),
+              Stage('next', called.append)]
+    Pipeline(stages, on_done=done.append).run([Job('a')])
+
+    assert called == []
+    assert done[0].status == 'failed'
+    assert done[0].error == 'failed'
+
+
+def test_pipeline_on_done_raises():
+    def on_done(job):
+        raise OSError('No space left on device')
+
+    stages = [Stage('first', lambda job: None, maxsize=1),
+              Stage('last', lambda job: None, maxsize=1)]
+    pipe = Pipeline(stages, on_done=on_done)
+    jobs = [Job(str(i)) for i in range(10)]
+    thread = threading.Thread(target=pipe.run, args=(jobs,), daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert {job.status for job in jobs} == {'failed'}
+    assert jobs[0].error == 'No space left on device'
+
+
+def test_stage_initializer():
+    initialised = []
+    release = threading.Event()
+
+    def initializer():
+        release.wait(10)
+        initialised.append(threading.current_thread().name)
+
+    stage = Stage('validate', lambda job: None, workers=2,
+                  initializer=initializer)
+    stage.start()
+    assert stage.ready == 0
+    release.set()
+    stage.stop()
+    assert sorted(initialised) == ['validate-0', 'validate-1']
+    assert stage.ready == 0
+
+
+def test_pipeline_no_stage():
+    with pytest.raises(PipelineException):
+        Pipeline([])
+
+
+def test_read_write(tmpdir):
+    fname = tmpdir.join('aphorisms_1.txt')
+    fname.write_text('1.\nAphorism', encoding='utf-8')
+    job = Job(str(fname))
+    pipeline.read(job)
+    assert job.text == '1.\nAphorism'
+
+    job.xml = '<TEI/>'
+    job.output = str(tmpdir.join('XML', 'aphorisms_1.xml'))
+    pipeline.write(job)
+    assert os.path.isfile(job.output)
+
+
+def test_same_name_in_subfolders(tmpdir):
+    corpus = tmpdir.mkdir('corpus')
+    for folder, name in (('a', 'aphorisms.txt'),
+                         ('b', 'aphorism_with_intro_title_text_footnotes.txt')):
+        corpus.mkdir(folder).join('x_1.txt').write_text(read_text(name),
+                                                        encoding='utf-8')
+
+    stages = [Stage('read', pipeline.read), Stage('convert', pipeline.convert),
+              Stage('write', pipeline.write)]
+    done = []
+    with tmpdir.as_cwd():
+        Pipeline(stages, on_done=done.append).run(
+            Job(f.path, f.relpath, f.size)
+            for f in Discovery(str(corpus)))
+
+    assert sorted(job.output for job in done) == \
+        [os.path.join('XML', 'a', 'x_1.xml'),
+         os.path.join('XML', 'b', 'x_1.xml')]
+    assert tmpdir.join('XML', 'a', 'x_1.xml').read() != \
+        tmpdir.join('XML', 'b', 'x_1.xml').read()
+
+
+def test_output_name():
+    assert pipeline.output_name('x_1.txt') == os.path.join('XML', 'x_1.xml')
+    assert pipeline.output_name(os.path.join('a', 'x_1.txt'), 'out') == \
+        os.path.join('out', 'a', 'x_1.xml')
+    assert pipeline.output_name(os.path.abspath('x_1.txt')) == \
+        os.path.join('XML', 'x_1.xml')
+
+
+def test_read_not_treatable(tmpdir):
+    fname = tmpdir.join('binary.txt')
+    fname.write_binary(b'\xff\xfe\xfa')
+    with pytest.raises(PipelineException):
+        pipeline.read(Job(str(fname)))
+
+
+def test_stage_throughput_utilisation():
+    stage = Stage('stage', None, workers=2)
+    stage.n_jobs = 10
+    stage.busy = 4.
+    assert stage.throughput(5.) == 2.
+    assert stage.utilisation(5.) == 0.4
+    assert stage.throughput(0) == 0.
+    assert stage.utilisation(0) == 0.
+
+
+def test_stage_resize():
+    names = set()
+
+    def work(job):
+        names.add(threading.current_thread().name)
+        time.sleep(0.001)
+
+    stage = Stage('work', work, workers=1)
+    done = []
+    pipe = Pipeline([stage], on_done=done.append)
+
+    def jobs():
+        for i in range(100):
+            if i == 10:
+                stage.resize(3)
+                assert len(stage._threads) == 3
+            if i == 50:
+                stage.resize(1)
+            yield Job(str(i), size=1)
+
+    pipe.run(jobs())
+    assert len(done) == 100
+    assert stage.n_bytes == 100
+    assert stage.workers == 1
+    assert len(names) == 3
+    assert stage._threads == []
@@ -0,0 +1,85 @@
+import os
+import time
+import pytest
+
+from .conftest import (WorkerPool, WorkerTimeout, WorkerCrash, TaskError,
+                       AphorismsToXMLException)
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def spin():
+    while True:
+        pass
+
+
+def crash():
+    os._exit(3)
+
+
+def failed():
+    raise AphorismsToXMLException('conversion failed')
+
+
+def test_pool_run():
+    with WorkerPool(2) as pool:
+        assert pool.run(sleep, 0) == 0
+        assert pool.run(max, 1, 2) == 2
+
+
+def test_pool_timeout_retries():
+    with WorkerPool(1, timeout=0.2, retries=1) as pool:
+        with pytest.raises(WorkerTimeout):
+            pool.run(sleep, 5)
+        assert pool.n_timeouts == 2
+        # The worker has been replaced
+        assert pool.run(sleep, 0) == 0
+
+
+@pytest.mark.skipif(not hasattr(__import__('signal'), 'setitimer'),
+                    reason='CPU time budget only available on Unix')
+def test_pool_cpu_time():
+    with WorkerPool(1, cpu_time=0.2) as pool:
+        with pytest.raises(WorkerTimeout):
+            pool.run(spin)
+        assert pool.run(sleep, 0) == 0
+
+
+def test_pool_crash():
+    with WorkerPool(1) as pool:
+        with pytest.raises(WorkerCrash):
+            pool.run(crash)
+        assert pool.n_crashes == 1
+        assert pool.run(sleep, 0) == 0
+
+
+def test_pool_task_error_not_retried():
+    with WorkerPool(1, retries=3) as pool:
+        with pytest.raises(TaskError) as e:
+            pool.run(failed)
+        assert e.value.name == 'AphorismsToXMLException'
+        assert str(e.value) == 'conversion failed'
+
+
+def test_pool_recycle_max_tasks():
+    with WorkerPool(1, max_tasks=2) as pool:
+        for _ in range(5):
+            pool.run(sleep, 0)
+        assert pool.n_recycled == 2
+
+
+def test_pool_resize():
+    with WorkerPool(1) as pool:
+        pool.resize(3)
+        assert pool.workers == 3
+        assert len(pool._all) == 3
+        assert pool.run(sleep, 0) == 0
+        pool.resize(1)
+        assert len(pool._all) == 1
+        assert pool.run(max, 1, 2) == 2
+        assert pool.peak_memory > 0
+    pool.resize(2)
+    assert pool._all == []
@@ -0,0 +1,41 @@
+import os
+import pstats
+
+from .conftest import profiling, pipeline, WorkerPool
+
+file_path = os.path.realpath(__file__)
+path_testdata = os.path.join(os.path.dirname(file_path), 'test_files')
+
+
+def test_profile(tmpdir):
+    fname = str(tmpdir.join('max.pstats'))
+    assert profiling.profile(fname, max, 1, 2) == 2
+    assert pstats.Stats(fname).total_calls > 0
+
+
+def test_profiler_every(tmpdir):
+    profiler = profiling.Profiler(str(tmpdir.join('profiles')), every=2)
+    fnames = [profiler.fname(os.path.join('sub', 'file_{}.txt'.format(i)))
+              for i in range(5)]
+    assert fnames[1] is None and fnames[3] is None
+    assert os.path.basename(fnames[0]) == 'sub__file_0.pstats'
+    assert len(profiler.fnames) == 3
+    # No profile saved yet
+    assert profiler.aggregate() is None
+
+
+def test_profile_in_worker(tmpdir):
+    fname = os.path.join(path_testdata, 'aphorisms.txt')
+    with open(fname, encoding='utf-8') as f:
+        text = f.read()
+    profiler = profiling.Profiler(str(tmpdir.join('profiles')))
+    with WorkerPool(1) as pool:
+        for relpath in ('a_1.txt', 'b_1.txt'):
+            result = pool.run(pipeline.render, fname, text, None, None,
+                              profiler.fname(relpath), True)
+    memory = result[3]['memory']
+    assert memory['body']['peak'] > 0
+    assert memory['body']['top']
+    aggregated = profiler.aggregate()
+    assert os.path.basename(aggregated) == 'all.pstats'
+    assert pstats.Stats(aggregated).total_calls > 0
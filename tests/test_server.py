@@ -0,0 +1,191 @@
+import os
+
+import pytest
+
+import exegis.main
+from .conftest import (api, Engine, Server, ServerException, Client,
+                       ClientException, connection, read_text, make_inputs,
+                       path_testdata)
+
+
+# Relaxng schemas compiled quickly: any document, and only <foo/>
+ANY = '''<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+<start><ref name="any"/></start>
+<define name="any"><element><anyName/><zeroOrMore><choice>
+<attribute><anyName/></attribute><text/><ref name="any"/>
+</choice></zeroOrMore></element></define>
+</grammar>'''
+FOO = '''<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+<start><element name="foo"><empty/></element></start>
+</grammar>'''
+
+
+@pytest.fixture
+def server(tmpdir):
+    relaxng = tmpdir.join('schema.rng')
+    relaxng.write(ANY)
+    engine = Engine(relaxng=str(relaxng), workers=2)
+    server = Server(engine, port=0, socket_fname=str(tmpdir.join('sock')),
+                    interval=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_convert(server):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    expected = api.convert(text, doc_num=2, validate=False).xml
+    for address in server.addresses:
+        with Client(address) as client:
+            result = client.convert(text, name='text_2.txt')
+            assert result.ok
+            assert result.valid is True
+            assert result.name == 'text_2.txt'
+            assert result.xml == expected
+            # Same connection
+            result = client.convert(text, doc_num=3, validate=False)
+            assert result.valid is None
+            assert b'<div n="3" type="Title_section">' in result.xml
+    assert server.requests == 4
+
+
+def test_batch(server):
+    documents = make_inputs(7)
+    with Client(server.addresses[1]) as client:
+        results = list(client.convert_many(documents))
+        assert [result.name for result in results] == \
+            [name for name, _ in documents]
+        assert [result.ok for result in results] == \
+            [i % 3 != 0 for i in range(1, 8)]
+        assert 'Conversion of the document doc_3.txt failed' in \
+            results[2].errors
+        # Status, then batches of 2 * workers documents
+        assert client.status()['requests'] == 1 + 2 + 1
+
+        results = client.convert_many(documents, ordered=False,
+                                      validate=False, batch=3)
+        next(results)
+        results.close()
+        assert client.status()['requests'] == 4 + 1 + 1
+
+
+def test_batch_lazy(server):
+    good = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    read = []
+
+    def documents():
+        for i in range(1, 11):
+            read.append(i)
+            yield 'doc_{}.txt'.format(i), good
+
+    with Client(server.addresses[0]) as client:
+        results = client.convert_many(documents(), batch=3)
+        assert next(results).name == 'doc_1.txt'
+        # Only the first batch has been read and sent
+        assert read == [1, 2, 3]
+        assert len(list(results)) == 9
+
+
+def test_validate_and_errors(server):
+    with Client(server.addresses[0]) as client:
+        assert client.validate('<a b="c"/>').valid is True
+        result = client.validate(b'<a>')
+        assert result.valid is False
+        assert len(result.errors) == 1
+
+        with pytest.raises(ClientException) as e:
+            client._json('GET', '/unknown')
+        assert 'Error 404' in str(e.value)
+        with pytest.raises(ClientException) as e:
+            client._json('POST', '/batch', b'not json\n')
+        assert 'Error 400' in str(e.value)
+        for path in ('/convert', '/batch'):
+            with pytest.raises(ClientException) as e:
+                client._json('POST', path, b'\xff\xfe not utf-8')
+            assert 'Error 400' in str(e.value)
+            assert 'utf-8' in str(e.value)
+        # The connection is still usable
+        assert client.status()['generation'] == 1
+
+
+def test_reload(server, tmpdir):
+    relaxng = tmpdir.join('schema.rng')
+    engine = server.engine
+    assert not engine.check()
+
+    relaxng.write(FOO)
+    os.utime(str(relaxng), ns=(0, 0))
+    assert engine.check()
+    with Client(server.addresses[0]) as client:
+        assert client.validate('<a/>').valid is False
+        assert client.validate('<foo/>').valid is True
+
+        # A schema which cannot be compiled keeps the previous one
+        relaxng.write('<grammar')
+        status = engine.status()
+        assert not engine.check()
+        assert engine.status() == status
+        assert client.validate('<foo/>').valid is True
+
+        relaxng.write(ANY)
+        status = client.reload()
+        assert status['reloaded']
+        assert status['generation'] == 3
+        assert status['reloads'] == 2
+        assert client.validate('<a/>').valid is True
+
+
+def test_engine_errors(tmpdir):
+    with pytest.raises(ServerException):
+        Engine(template_fname=str(tmpdir.join('missing.xml')))
+
+
+def test_socket_in_use(server):
+    with pytest.raises(ServerException):
+        Server(server.engine, port=None,
+               socket_fname=server.addresses[1][len('unix:'):])
+
+
+def test_client_address(monkeypatch):
+    assert connection('http://localhost:9000').port == 9000
+    assert connection('localhost:9000').host == 'localhost'
+    assert connection('unix:/tmp/exegis.sock').socket_fname == \
+        '/tmp/exegis.sock'
+    monkeypatch.setenv('EXEGIS_SERVER', '127.0.0.1:9001')
+    assert connection().port == 9001
+    with pytest.raises(ClientException):
+        connection('http://localhost')
+    with pytest.raises(ClientException):
+        Client('unix:' + os.path.join(path_testdata, 'missing')).status()
+
+
+def test_client_command(server, tmpdir, capfd):
+    texts = tmpdir.mkdir('texts')
+    texts.join('text_2.txt').write(
+        read_text('aphorism_with_intro_title_text_footnotes.txt'))
+    with tmpdir.as_cwd():
+        exegis.main.main(['client', str(texts),
+                          '--server=' + server.addresses[1],
+                          '--output=out'])
+        with open(os.path.join('out', 'text_2.xml'), 'rb') as f:
+            assert b'<div n="2" type="Title_section">' in f.read()
+
+        texts.join('text_3.txt').write(
+            read_text('aphorisms_wrong_numeration.txt'))
+        with pytest.raises(SystemExit):
+            exegis.main.main(['client', str(texts),
+                              '--server=' + server.addresses[0],
+                              '--output=out'])
+        assert not os.path.exists(os.path.join('out', 'text_3.xml'))
+
+        # A file which is not utf-8 is reported, the others are converted
+        texts.join('text_3.txt').remove()
+        texts.join('text_4.txt').write_binary(b'x\xff\n')
+        texts.join('text_5.txt').write(
+            read_text('aphorism_with_intro_title_text_footnotes.txt'))
+        with pytest.raises(SystemExit):
+            exegis.main.main(['client', str(texts),
+                              '--server=' + server.addresses[0],
+                              '--output=out'])
+        assert os.path.exists(os.path.join('out', 'text_5.xml'))
+        assert 'Unable to read' in capfd.readouterr().err
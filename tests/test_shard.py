@@ -0,0 +1,75 @@
+import json
+import pytest
+
+from .conftest import TextFile, shard
+
+
+def corpus(n=50):
+    return [TextFile('/corpus/file_{}.txt'.format(i),
+                     'file_{}.txt'.format(i), (i * 7919) % 1000 + 1)
+            for i in range(n)]
+
+
+def test_parse_shard():
+    assert shard.parse_shard('2/4') == (2, 4)
+    for spec in ['0/4', '5/4', '1-4', 'a/b', None]:
+        with pytest.raises(shard.ShardException):
+            shard.parse_shard(spec)
+
+
+def test_stable_hash():
+    assert shard.stable_hash('a/b.txt') == shard.stable_hash('a/b.txt')
+    assert shard.stable_hash('a/b.txt') != shard.stable_hash('a/c.txt')
+    # Computed once, must never change between runs or machines
+    assert shard.stable_hash('file_1.txt') == 0xbb862d7ccad0c082
+
+
+def test_assign_each_file_once_and_balanced():
+    files = corpus(1000)
+    shards = shard.assign(files, 4)
+    relpaths = [f.relpath for s in shards for f in s]
+    assert sorted(relpaths) == sorted(f.relpath for f in files)
+
+    loads = [sum(f.size for f in s) for s in shards]
+    mean = sum(loads) / 4
+    assert max(loads) - min(loads) < 0.1 * mean
+
+
+def test_assign_stable_when_corpus_changes():
+    files = corpus()
+    before = shard.assign(files, 3)
+    new = TextFile('/corpus/new.txt', 'new.txt', 100000)
+    after = shard.assign(files + [new], 3)
+    for old, shard_files in zip(before, after):
+        assert [f for f in shard_files if f is not new] == old
+
+
+def test_select_independent_of_order():
+    files = corpus()
+    first = shard.select(files, 2, 3)
+    second = shard.select(list(reversed(files)), 2, 3)
+    assert first == second
+
+
+def test_manifest_merge(tmpdir):
+    fnames = []
+    for i in (1, 2):
+        records = [{'path': f.relpath, 'size': f.size, 'status': 'ok',
+                    'output': None, 'error': None, 'quarantined': False}
+                   for f in shard.select(corpus(10), i, 3)]
+        fname = str(tmpdir.join('shard{}.json'.format(i)))
+        shard.save_manifest(fname, records, shard='{}/3'.format(i),
+                            elapsed=float(i))
+        fnames.append(fname)
+
+    report = shard.merge(fnames)
+    assert report['missing'] == ['3/3']
+    assert report['duplicates'] == []
+    assert report['summary']['elapsed'] == 2.
+    assert report['summary']['ok'] == len(report['files'])
+    json.dumps(report)
+
+
+def test_merge_manifest_not_found():
+    with pytest.raises(shard.ShardException):
+        shard.merge(['do not exist.json'])
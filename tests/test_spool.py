@@ -0,0 +1,118 @@
+import os
+import json
+import time
+
+from .conftest import Spool, TextFile, Job
+
+
+def corpus(n=5):
+    return [TextFile('/corpus/file_{}.txt'.format(i),
+                     'file_{}.txt'.format(i), 10) for i in range(n)]
+
+
+def complete(spool, text_file):
+    job = Job(text_file.path, text_file.relpath, text_file.size)
+    job.status = 'ok'
+    spool.complete(job)
+
+
+def test_spool_claim_exclusive(tmpdir):
+    first = Spool(str(tmpdir), worker='first')
+    second = Spool(str(tmpdir), worker='second')
+    first.start()
+    second.start()
+    try:
+        claimed_first = list(first.claim(corpus()[:3]))
+        claimed_second = list(second.claim(corpus()))
+    finally:
+        first.stop()
+        second.stop()
+    assert [f.relpath for f in claimed_first] == \
+        ['file_0.txt', 'file_1.txt', 'file_2.txt']
+    assert [f.relpath for f in claimed_second] == ['file_3.txt',
+                                                   'file_4.txt']
+    assert second.n_skipped == 3
+
+
+def test_spool_complete_skip_done(tmpdir):
+    spool = Spool(str(tmpdir), worker='worker')
+    for text_file in spool.claim(corpus(2)):
+        complete(spool, text_file)
+    assert os.listdir(str(tmpdir.join('claims'))) == []
+    assert list(Spool(str(tmpdir), worker='other').claim(corpus(2))) == []
+
+    timings = tmpdir.join('results', 'timings', 'worker.jsonl')
+    records = [json.loads(line) for line in timings.readlines()]
+    assert [r['path'] for r in records] == ['file_0.txt', 'file_1.txt']
+    assert records[0]['worker'] == 'worker'
+
+
+def test_spool_recover_dead_worker(tmpdir):
+    dead = Spool(str(tmpdir), worker='dead', stale=10)
+    claimed = list(dead.claim(corpus(2)))
+    assert len(claimed) == 2
+    heartbeat = tmpdir.join('workers', 'dead')
+    heartbeat.write('')
+
+    spool = Spool(str(tmpdir), worker='alive', stale=10)
+    spool.start()
+    try:
+        # The worker is alive, its files are not claimed
+        assert list(spool.claim(corpus(2))) == []
+        # No heartbeat since more than the stale time
+        old = time.time() - 20
+        os.utime(str(heartbeat), (old, old))
+        recovered = list(spool.recover(interval=0.1))
+    finally:
+        spool.stop()
+    assert sorted(f.relpath for f in recovered) == ['file_0.txt',
+                                                    'file_1.txt']
+    assert spool.n_recovered == 2
+
+
+def test_spool_empty_claim(tmpdir):
+    spool = Spool(str(tmpdir), worker='alive', stale=10)
+    files = corpus(3)
+    # Worker died between the creation of the claim and its content
+    empty = tmpdir.join('claims', spool._key(files[1]) + '.claim')
+    empty.write('')
+
+    # Claimed recently, maybe still being written
+    assert [f.relpath for f in spool.claim(files)] == ['file_0.txt',
+                                                       'file_2.txt']
+    old = time.time() - 20
+    os.utime(str(empty), (old, old))
+    recovered = list(spool.recover(interval=0.1))
+    assert [f.relpath for f in recovered] == ['file_1.txt']
+    assert spool.n_recovered == 1
+
+    # Old when the corpus is explored
+    other = Spool(str(tmpdir.mkdir('other')), worker='other', stale=10)
+    other_empty = tmpdir.join('other', 'claims',
+                              other._key(files[0]) + '.claim')
+    other_empty.write('{"worker": ')
+    os.utime(str(other_empty), (old, old))
+    assert len(list(other.claim(files))) == 3
+    assert other.n_recovered == 1
+
+
+def test_spool_break_claimed_again(tmpdir):
+    dead = Spool(str(tmpdir), worker='dead', stale=10)
+    text_file = list(dead.claim(corpus(1)))[0]
+    key = dead._key(text_file)
+    fname = str(tmpdir.join('claims', key + '.claim'))
+
+    spool = Spool(str(tmpdir), worker='alive', stale=10)
+    claim, st = spool._read_claim(fname)
+    # Broken and claimed again by a live worker since it was read
+    os.remove(fname)
+    live = Spool(str(tmpdir), worker='live', stale=10)
+    live.start()
+    try:
+        time.sleep(0.01)
+        assert list(live.claim(corpus(1))) == [text_file]
+        assert not spool._break(key, claim, st)
+    finally:
+        live.stop()
+    assert spool._read_claim(fname)[0]['worker'] == 'live'
+    assert os.listdir(str(tmpdir.join('claims'))) == [key + '.claim']
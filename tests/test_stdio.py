@@ -0,0 +1,116 @@
+import io
+import json
+import queue
+
+import pytest
+
+from .conftest import (api, Engine, stdio, StdioException, read_text,
+                       make_inputs)
+
+
+# Relaxng schema compiled quickly which accepts any document
+ANY = '''<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+<start><ref name="any"/></start>
+<define name="any"><element><anyName/><zeroOrMore><choice>
+<attribute><anyName/></attribute><text/><ref name="any"/>
+</choice></zeroOrMore></element></define>
+</grammar>'''
+
+
+@pytest.fixture(scope='module')
+def engine(tmpdir_factory):
+    relaxng = tmpdir_factory.mktemp('stdio').join('schema.rng')
+    relaxng.write(ANY)
+    engine = Engine(relaxng=str(relaxng), workers=2)
+    yield engine
+    engine.close()
+
+
+def _requests(n):
+    return [json.dumps({'id': i, 'name': name, 'text': text})
+            for i, (name, text) in enumerate(make_inputs(n), 1)]
+
+
+def _run(engine, lines, **kwargs):
+    stdout = io.StringIO()
+    count = stdio.run(engine, io.StringIO('\n'.join(lines) + '\n'), stdout,
+                      **kwargs)
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert count == len(responses)
+    return responses
+
+
+def test_run_ordered(engine):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    responses = _run(engine, _requests(7))
+    assert [response['id'] for response in responses] == list(range(1, 8))
+    assert [response['status'] for response in responses] == \
+        ['failed' if i % 3 == 0 else 'ok' for i in range(1, 8)]
+    assert responses[1]['xml'] == \
+        api.convert(text, 2, validate=False).xml.decode('utf-8')
+    assert 'validate' in responses[1]['timings']['phases']
+    assert 'Conversion of the document doc_3.txt failed' in \
+        responses[2]['errors']
+
+
+def test_run_unordered(engine):
+    responses = _run(engine, _requests(9), ordered=False, window=3)
+    assert sorted(response['id'] for response in responses) == \
+        list(range(1, 10))
+
+
+def test_run_errors(engine):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    responses = _run(engine, [
+        'not json', '[1]', json.dumps({'id': 'a'}), '',
+        json.dumps({'id': 'b', 'text': text, 'doc_num': 'x'}),
+        json.dumps({'id': 'c', 'text': text, 'doc_num': 4,
+                    'validate': False})])
+    assert [(r['id'], r['status']) for r in responses] == \
+        [(None, 'error'), (None, 'error'), ('a', 'error'), ('b', 'error'),
+         ('c', 'ok')]
+    assert responses[-1]['valid'] is None
+    assert '<div n="4" type="Title_section">' in responses[-1]['xml']
+
+
+def test_run_interactive(engine):
+    """The response is written before the next request is sent."""
+    written = queue.Queue()
+
+    class Output(object):
+        def write(self, line):
+            written.put(json.loads(line))
+
+        def flush(self):
+            pass
+
+    def requests():
+        for line in _requests(3):
+            yield line + '\n'
+            assert written.get(timeout=30)['id'] is not None
+
+    assert stdio.run(engine, requests(), Output()) == 3
+
+
+def test_run_not_utf8(engine):
+    text = read_text('aphorism_with_intro_title_text_footnotes.txt')
+    stdin = io.BytesIO(b'{"id": 1, "text": "x\xff"}\n' +
+                       json.dumps({'id': 2, 'text': text,
+                                   'validate': False}).encode('utf-8') +
+                       b'\n')
+    stdout = io.StringIO()
+    assert stdio.run(engine, stdin, stdout) == 2
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [r['status'] for r in responses] == ['error', 'ok']
+    assert 'not utf-8' in responses[0]['errors'][0]
+
+
+def test_run_reader_fails(engine):
+    def requests():
+        yield _requests(1)[0] + '\n'
+        raise OSError('Input/output error')
+
+    stdout = io.StringIO()
+    with pytest.raises(StdioException, match='after 1 requests'):
+        stdio.run(engine, requests(), stdout)
+    assert json.loads(stdout.getvalue())['id'] == 1
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import pytest
+
+from .conftest import Process, timings
+
+file_path = os.path.realpath(__file__)
+path_testdata = os.path.join(os.path.dirname(file_path), 'test_files')
+
+
+def test_timings_phase():
+    t = timings.Timings()
+    with t.phase('body'):
+        time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with t.phase('body'):
+            raise ValueError
+    t.add('title', 0.5)
+    t.counts['units'] = 3
+    record = t.record()
+    assert record['units'] == 3
+    assert record['phases']['body'] >= 0.01
+    assert record['phases']['title'] == 0.5
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert timings.percentile(values, 50) == 3
+    assert timings.percentile(values, 95) == 5
+    assert timings.percentile([], 50) == 0.
+
+
+def test_phase_statistics():
+    statistics = timings.PhaseStatistics()
+    for i in range(1, 101):
+        statistics.add({'body': i / 1000., 'other': 1.})
+    summary = statistics.summary()
+    assert list(summary) == ['body', 'other']
+    assert summary['body']['files'] == 100
+    assert summary['body']['p50'] == 0.05
+    assert summary['body']['p95'] == 0.095
+    assert summary['body']['max'] == 0.1
+    assert 'p95 (ms)' in statistics.report()
+
+
+def test_timings_file(tmpdir):
+    fname = str(tmpdir.join('timings.jsonl'))
+    with timings.TimingsFile(fname) as f:
+        f.write({'path': 'a.txt', 'phases': {}})
+        f.write({'path': 'b.txt', 'phases': {}})
+    with open(fname) as f:
+        assert [json.loads(line)['path'] for line in f] == ['a.txt', 'b.txt']
+
+
+def test_process_timings(tmpdir):
+    with tmpdir.as_cwd():
+        comtoepi = Process(fname=os.path.join(path_testdata,
+                                              'aphorisms.txt'))
+        comtoepi.main()
+    record = comtoepi.timings.record()
+    assert set(record['phases']) <= set(timings.PHASES)
+    for phase in ('open_document', 'divide_document', 'body', 'validate'):
+        assert record['phases'][phase] > 0
+    assert record['units'] > 0
+    assert record['footnotes'] > 0
+    assert record['witnesses'] > 0
+    assert record['characters'] > 0
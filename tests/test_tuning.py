@@ -0,0 +1,99 @@
+from .conftest import Job, Stage, Pipeline, AutoTuner, tuning
+
+
+def _noop(job):
+    pass
+
+
+# Bytes per second treated by one worker of each stage
+CAPACITY = {'read': 1000., 'convert': 100., 'validate': 150., 'write': 1000.}
+
+
+def _simulate(stages, clock, elapsed=1.):
+    """Advance the clock of one window, the throughput is limited by the
+    slowest stage."""
+    throughput = min(CAPACITY[stage.name] * stage.workers
+                     for stage in stages)
+    clock[0] += elapsed
+    for stage in stages:
+        stage.busy += throughput / CAPACITY[stage.name] * elapsed
+    stages[-1].n_bytes += int(throughput * elapsed)
+
+
+def test_tuner_grows_the_bottleneck():
+    stages = [Stage(name, _noop)
+              for name in ('read', 'convert', 'validate', 'write')]
+    clock = [0.]
+    tuner = AutoTuner(Pipeline(stages), max_workers=3, max_validators=2,
+                      max_io_workers=2, clock=lambda: clock[0])
+
+    tuner.update()
+    while True:
+        _simulate(stages, clock)
+        if not tuner.update():
+            break
+
+    # convert 1 -> 2, validate 1 -> 2, convert 2 -> 3, read 1 -> 2 which
+    # did not help
+    assert [settings['convert'] for settings, _ in tuner.history] == \
+        [1, 2, 2, 3, 3]
+    assert [throughput for _, throughput in tuner.history] == \
+        [100., 150., 200., 300., 300.]
+    assert tuner.settings == {'read': 1, 'convert': 3, 'validate': 2,
+                              'write': 1}
+    assert [stage.workers for stage in stages] == [1, 3, 2, 1]
+    assert '--workers=3 --validators=2 --io-workers=1 --writers=1' in \
+        tuner.summary()
+
+
+def test_tuner_max_windows():
+    stages = [Stage(name, _noop) for name in ('read', 'convert')]
+    clock = [0.]
+    tuner = AutoTuner(Pipeline(stages), max_workers=10, max_windows=2,
+                      clock=lambda: clock[0])
+    tuner.update()
+    _simulate(stages, clock)
+    assert tuner.update()
+    _simulate(stages, clock)
+    assert not tuner.update()
+    assert tuner.settings == {'read': 1, 'convert': 2}
+
+
+def test_tuner_waits_for_new_workers():
+    stage = Stage('validate', _noop, workers=2)
+    tuner = AutoTuner(Pipeline([stage]))
+    # A thread is still compiling its schema
+    stage.ready = 1
+    assert not tuner._ready()
+    stage.ready = 2
+    assert tuner._ready()
+
+
+def test_tuner_stopped_before_settled():
+    pipe = Pipeline([Stage('convert', _noop)])
+    tuner = AutoTuner(pipe, window=10)
+    tuner.start()
+    pipe.run(Job(str(i)) for i in range(10))
+    tuner.stop()
+    assert tuner.settings is None
+    assert 'not finished' in tuner.summary()
+
+
+def test_memory_limit(monkeypatch):
+    class Pool(object):
+        peak_memory = 300
+
+    pipe = Pipeline([Stage('convert', _noop)])
+    tuner = AutoTuner(pipe, Pool())
+    monkeypatch.setattr(tuning, 'available_memory', lambda: 1000)
+    assert tuner._memory_allows()
+    monkeypatch.setattr(tuning, 'available_memory', lambda: 500)
+    assert not tuner._memory_allows()
+    assert not tuner._grow({'convert': 1.})
+    monkeypatch.setattr(tuning, 'available_memory', lambda: None)
+    assert tuner._memory_allows()
+
+
+def test_available_memory():
+    memory = tuning.available_memory()
+    assert memory is None or memory > 0